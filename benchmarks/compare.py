@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+import argparse
+import json
+from pathlib import Path
+from typing import Any, Dict
+
+# python -m benchmarks.compare benchmarks/results/<old>.json benchmarks/results/<new>.json
+
+def flatten(obj: Any, prefix: str = "") -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            out.update(flatten(v, f"{prefix}.{k}" if prefix else k))
+    elif isinstance(obj, (int, float)) and not isinstance(obj, bool):
+        out[prefix] = float(obj)
+    return out
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Compare two benchmark result files")
+    ap.add_argument("old")
+    ap.add_argument("new")
+    args = ap.parse_args()
+
+    old = json.loads(Path(args.old).read_text(encoding="utf-8"))
+    new = json.loads(Path(args.new).read_text(encoding="utf-8"))
+    a, b = flatten(old["results"]), flatten(new["results"])
+    print(f"old: {old['meta'].get('commit')}  new: {new['meta'].get('commit')}")
+    width = max((len(k) for k in a.keys() | b.keys()), default=10)
+    for key in sorted(a.keys() | b.keys()):
+        va, vb = a.get(key), b.get(key)
+        if va is None or vb is None:
+            print(f"{key:<{width}}  {va!s:>12}  {vb!s:>12}")
+            continue
+        change = f"{(vb - va) / va * 100:+.1f}%" if va else ""
+        print(f"{key:<{width}}  {va:>12.4g}  {vb:>12.4g}  {change:>8}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Dict, List
+import json
+import random
+
+import fitz  # PyMuPDF
+
+# Synthetic annual reports: every PDF is one company/year with a cover page, narrative pages built
+# from a fixed vocabulary and a few key figures that the generated questions ask about.
+_NAMES = "Alder Birch Cedar Dune Ember Fjord Granite Harbor Iris Juniper Kestrel Lumen Meridian Nimbus Orchid Pioneer".split()
+_SECTORS = "Energy Logistics Pharma Retail Mining Software Foods Capital Media Telecom".split()
+_SUFFIXES = ["Inc.", "plc", "AG", "Holdings Ltd", "Corporation", "SA"]
+_METRICS = [
+    ("total revenue", "USD", "million"),
+    ("net income", "USD", "million"),
+    ("total assets", "USD", "million"),
+    ("number of employees", "", ""),
+    ("operating margin", "", "%"),
+    ("capital expenditure", "USD", "million"),
+]
+_FILLER = (
+    "the board reviewed the group strategy and approved the capital allocation framework for the coming years "
+    "our operations continued to focus on safety efficiency and long term value creation for shareholders "
+    "risk management covers market credit liquidity and operational risks across all business segments "
+    "the audit committee oversaw financial reporting internal controls and the external audit process "
+    "sustainability targets include lower emissions responsible sourcing and community investment programmes "
+    "management discussion and analysis explains the drivers of performance during the reporting period"
+).split()
+
+# legal boilerplate repeated at the top of every fourth page, as real reports do with disclaimers
+_DISCLAIMER = (
+    "Cautionary statement regarding forward-looking statements. This annual report contains certain forward-looking "
+    "statements with respect to the financial condition, results of operations and businesses of the group. These "
+    "statements and forecasts involve risk and uncertainty because they relate to events and depend on circumstances "
+    "that will occur in the future. There are a number of factors that could cause actual results or developments to "
+    "differ materially from those expressed or implied by these forward-looking statements, including changes in "
+    "economic conditions, commodity prices, exchange rates, interest rates, regulation, taxation and competition. "
+    "Forward-looking statements speak only as of the date of this report and the group undertakes no obligation to "
+    "update or revise them, whether as a result of new information, future events or otherwise, except as required "
+    "by applicable law and regulation. Nothing in this report should be construed as a profit forecast, and past "
+    "performance cannot be relied upon as a guide to future performance. Readers are cautioned not to place undue "
+    "reliance on these statements, which have not been reviewed or reported on by the auditors of the group."
+)
+
+def _sentence(rnd: random.Random, n: int) -> str:
+    words = [rnd.choice(_FILLER) for _ in range(n)]
+    return " ".join(words).capitalize() + "."
+
+def _figure(rnd: random.Random, unit: str) -> int | float:
+    if unit == "%":
+        return round(rnd.uniform(2, 40), 1)
+    if unit == "million":
+        return rnd.randint(50, 90_000)
+    return rnd.randint(200, 250_000)
+
+def _fmt(value: int | float, currency: str, unit: str) -> str:
+    num = f"{value:,}" if isinstance(value, int) else f"{value}"
+    if unit == "%":
+        return f"{num}%"
+    return " ".join(p for p in (currency, num, unit) if p)
+
+def make_corpus(out_dir: Path, *, num_pdfs: int = 20, pages: int = 30, seed: int = 0) -> List[Dict]:
+    out_dir.mkdir(parents=True, exist_ok=True)
+    rnd = random.Random(seed)
+    reports = []
+    for i in range(num_pdfs):
+        company = f"{_NAMES[i % len(_NAMES)]} {_SECTORS[(i // len(_NAMES)) % len(_SECTORS)]} {_SUFFIXES[i % len(_SUFFIXES)]}"
+        year = 2018 + i % 6
+        figures = {label: _figure(rnd, unit) for label, _, unit in _METRICS}
+        ceo = f"{rnd.choice(_NAMES)} {rnd.choice(['Smith', 'Meyer', 'Rossi', 'Dubois', 'Novak', 'Larsen'])}"
+
+        doc = fitz.open()
+        for p in range(pages):
+            if p == 0:
+                text = f"{company}\nAnnual Report {year}\n\nFor the financial year ended 31 December {year}."
+            else:
+                paras = [_sentence(rnd, rnd.randint(12, 30)) for _ in range(rnd.randint(6, 12))]
+                # each key figure is stated once, on its own page
+                for j, (label, currency, unit) in enumerate(_METRICS):
+                    if p == 1 + j % max(1, pages - 1):
+                        paras.insert(rnd.randint(0, len(paras)), f"In {year} {label} was {_fmt(figures[label], currency, unit)}.")
+                if p == pages - 1 or p == 1:
+                    paras.append(f"{ceo} served as Chief Executive Officer of {company} throughout {year}.")
+                text = "\n".join(paras)
+                if p % 4 == 3:
+                    text = _DISCLAIMER + "\n" + text
+            page = doc.new_page()
+            page.insert_textbox(fitz.Rect(40, 40, 555, 800), text, fontsize=8)
+        path = out_dir / f"report_{i:03d}.pdf"
+        doc.save(str(path))
+        doc.close()
+        reports.append({"file": path.name, "company": company, "year": year, "ceo": ceo, "figures": figures})
+    return reports
+
+def make_questions(reports: List[Dict], *, num_questions: int = 100, seed: int = 0) -> List[Dict]:
+    rnd = random.Random(seed)
+    out = []
+    for _ in range(num_questions):
+        r = rnd.choice(reports)
+        kind = rnd.choice(["number", "number", "name", "boolean"])
+        if kind == "number":
+            label, _, unit = rnd.choice(_METRICS)
+            text = f'What was the {label} of "{r["company"]}" in {r["year"]}?'
+            expected = r["figures"][label]
+        elif kind == "name":
+            text = f'Who was the Chief Executive Officer of "{r["company"]}" in {r["year"]}?'
+            expected = r["ceo"]
+        else:
+            text = f'Did "{r["company"]}" publish an annual report for {r["year"]}?'
+            expected = True
+        out.append({"text": text, "kind": kind, "expected": expected})
+    return out
+
+def write_questions(path: Path, questions: List[Dict]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(questions, ensure_ascii=False, indent=2), encoding="utf-8")
@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+
+from rag.config import Settings
+from rag.embedding import BACKENDS, load_embedder
+from rag.onnx_embed import export_dir
+from rag.pdf import list_pdfs
+
+from .corpus import make_corpus, make_questions
+from .run import bench_chunk, bench_extract, git_commit, latency_stats
+
+# EMBED_BACKEND comparison on the chunks and questions of a synthetic corpus:
+#   python -m benchmarks.embed_backends --backends torch,onnx,onnx-int8 --pdfs 10 --pages 20
+# Throughput: model load (plus the one-off ONNX export), corpus encoding in chunks/s, single-question
+# latency and batched question throughput. Quality against the torch vectors of the same model: cosine
+# of every chunk vector, and recall@k of exact top-k retrieval for the questions.
+
+def bench_backend(
+    name: str, backend: str, *, onnx_dir: Path, chunks: List[str], questions: List[str], batch_size: int,
+) -> tuple:
+    exported = backend != "torch" and not (export_dir(onnx_dir, name, backend) / "embedder.json").exists()
+    t0 = time.perf_counter()
+    model = load_embedder(name, backend=backend, onnx_dir=onnx_dir)
+    load = time.perf_counter() - t0
+    encode = lambda texts, bs: np.asarray(model.encode(texts, batch_size=bs, normalize_embeddings=True), dtype="float32")
+
+    encode(chunks[:batch_size], batch_size)  # warm-up: allocator, thread pools, lazy kernels
+    t0 = time.perf_counter()
+    vectors = encode(chunks, batch_size)
+    corpus = time.perf_counter() - t0
+
+    samples = []
+    for q in questions:
+        t0 = time.perf_counter()
+        encode([q], 1)
+        samples.append(time.perf_counter() - t0)
+    t0 = time.perf_counter()
+    queries = encode(questions, batch_size)
+    batch = time.perf_counter() - t0
+
+    row = {
+        "load_s": load,
+        # the first onnx / onnx-int8 load exports (and quantizes) the model
+        "exported": exported,
+        "corpus_chunks_per_s": len(chunks) / corpus,
+        "query": latency_stats(samples),
+        "batch_queries_per_s": len(questions) / batch,
+    }
+    return row, vectors, queries
+
+def recall_at_k(queries: np.ndarray, vectors: np.ndarray, ref_queries: np.ndarray, ref_vectors: np.ndarray, k: int) -> float:
+    top = np.argsort(-(queries @ vectors.T), axis=1)[:, :k]
+    ref = np.argsort(-(ref_queries @ ref_vectors.T), axis=1)[:, :k]
+    return float(np.mean([len(set(a) & set(b)) / k for a, b in zip(top.tolist(), ref.tolist())]))
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    settings = Settings()
+    name = args.model or settings.embed_model
+    work = Path(args.workdir) if args.workdir else Path(tempfile.mkdtemp(prefix="rag-embed-"))
+    pdf_dir = work / "pdfs"
+    if pdf_dir.exists():
+        shutil.rmtree(pdf_dir)
+    reports = make_corpus(pdf_dir, num_pdfs=args.pdfs, pages=args.pages, seed=args.seed)
+    questions = [q["text"] for q in make_questions(reports, num_questions=args.questions, seed=args.seed)]
+    pages, _ = bench_extract(list_pdfs(pdf_dir), workers=settings.extract_workers)
+    chunks, _ = bench_chunk(pages, chunk_chars=settings.chunk_chars, chunk_overlap=settings.chunk_overlap)
+    texts = [c.text for c in chunks]
+
+    # exports go to a fresh dir unless --onnx-dir points at existing ones
+    onnx_dir = Path(args.onnx_dir) if args.onnx_dir else work / "onnx"
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    if "torch" not in backends:
+        backends.insert(0, "torch")  # the reference for the quality columns
+
+    results: Dict[str, Any] = {}
+    ref = None
+    for backend in backends:
+        row, vectors, queries = bench_backend(
+            name, backend, onnx_dir=onnx_dir, chunks=texts, questions=questions, batch_size=args.batch_size,
+        )
+        if ref is None:
+            ref = (vectors, queries)
+        cos = (vectors * ref[0]).sum(axis=1)
+        row["cosine_vs_torch"] = {"mean": float(cos.mean()), "min": float(cos.min())}
+        row[f"recall@{args.k}_vs_torch"] = recall_at_k(queries, vectors, ref[1], ref[0], args.k)
+        if backend != "torch":
+            model_file = export_dir(onnx_dir, name, backend) / "model.onnx"
+            row["model_bytes"] = model_file.stat().st_size
+        results[backend] = row
+        print(backend, json.dumps({k: row[k] for k in ("load_s", "corpus_chunks_per_s", "batch_queries_per_s")}), flush=True)
+
+    if not args.workdir and not args.keep:
+        shutil.rmtree(work, ignore_errors=True)
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "embed_model": name,
+            "chunks": len(texts),
+            "questions": len(questions),
+            "batch_size": args.batch_size,
+            "chunk_chars": settings.chunk_chars,
+            "k": args.k,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Compare EMBED_BACKEND throughput and vector quality on a synthetic corpus")
+    ap.add_argument("--model", default=None, help="sentence-transformers model (default: EMBED_MODEL)")
+    ap.add_argument("--backends", default=",".join(BACKENDS), help="comma-separated; torch is always run as the reference")
+    ap.add_argument("--pdfs", type=int, default=10)
+    ap.add_argument("--pages", type=int, default=20)
+    ap.add_argument("--questions", type=int, default=100)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--batch-size", type=int, default=64)
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--onnx-dir", default=None, help="reuse ONNX exports from here (default: export into the work dir)")
+    ap.add_argument("--workdir", default=None, help="keep corpus and exports here instead of a temp dir")
+    ap.add_argument("--keep", action="store_true", help="do not delete the temp dir")
+    ap.add_argument("--out", default=None, help="result JSON (default: benchmarks/results/embed_<commit>.json)")
+    args = ap.parse_args()
+
+    report = run(args)
+    out = Path(args.out) if args.out else Path(__file__).parent / "results" / f"embed_{(report['meta']['commit'] or 'nogit')[:10]}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(json.dumps(report["results"], indent=2))
+    print(f"Wrote: {out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+from __future__ import annotations
+
+import argparse
+import dataclasses
+import hashlib
+import json
+import platform
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+from rag.config import Settings
+from rag.ann import AnnParams
+from rag.pdf import iter_pages, list_pdfs
+from rag.chunking import chunk_page_text
+from rag.index import build_or_load_index
+from rag.retrieval import retrieve, retrieve_many
+from rag.llm import LLMClient, LLMResponse
+from rag.answering import build_prompt, normalize_by_kind
+from rag.pipeline import lookup_facts, make_answer, question_context
+from rag.tokens import load_tokenizer, tokenizer_for
+
+from .corpus import make_corpus, make_questions
+
+# End-to-end benchmark on a synthetic corpus:
+#   python -m benchmarks.run --pdfs 20 --pages 30 --questions 100 --out benchmarks/results/my.json
+# --offline swaps the sentence-transformers models for hashing stand-ins, so the pipeline around
+# the models can be measured without downloads. Compare two result files with benchmarks.compare.
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    r = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return r / (1024 * 1024) if sys.platform == "darwin" else r / 1024
+
+def latency_stats(samples_s: Sequence[float]) -> Dict[str, float]:
+    ms = np.asarray(samples_s, dtype="float64") * 1000.0
+    if not len(ms):
+        return {"n": 0}
+    return {
+        "n": int(len(ms)),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "max_ms": float(ms.max()),
+    }
+
+class HashEmbedder:
+    # bag of hashed tokens, L2-normalised; same interface as SentenceTransformer for our call sites
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def encode(self, texts, batch_size: int = 64, show_progress_bar: bool = False, normalize_embeddings: bool = True, **kwargs):
+        out = np.zeros((len(texts), self.dim), dtype="float32")
+        for i, t in enumerate(texts):
+            for w in re.findall(r"\w+", t.lower()):
+                out[i, int.from_bytes(hashlib.blake2b(w.encode(), digest_size=4).digest(), "little") % self.dim] += 1.0
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return out / norms
+
+class OverlapReranker:
+    def predict(self, pairs, batch_size: int = 64, show_progress_bar: bool = False, **kwargs):
+        return np.asarray([len(set(q.lower().split()) & set(t.lower().split())) for q, t in pairs], dtype="float32")
+
+class StubLLM(LLMClient):
+    # fixed latency per call; answers with the first figure of the context so normalisation has work to do
+    provider = "stub"
+
+    def __init__(self, latency_s: float = 0.0):
+        self.latency_s = latency_s
+
+    def generate(self, prompt: str) -> LLMResponse:
+        t0 = time.perf_counter()
+        if self.latency_s:
+            time.sleep(self.latency_s)
+        m = re.search(r"Context:.*?(\d[\d,.]*)", prompt, flags=re.S)
+        return LLMResponse(text=m.group(1) if m else "N/A", total_s=time.perf_counter() - t0)
+
+def git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True, cwd=Path(__file__).parent)
+        return out.stdout.strip()
+    except Exception:
+        return None
+
+def bench_extract(pdf_paths: List[Path], *, workers: int) -> tuple:
+    t0 = time.perf_counter()
+    pages = list(iter_pages(pdf_paths, workers=workers))
+    dt = time.perf_counter() - t0
+    return pages, {"pages": len(pages), "seconds": dt, "pages_per_s": len(pages) / dt, "workers": workers}
+
+def bench_chunk(pages, *, chunk_chars: int, chunk_overlap: int) -> tuple:
+    t0 = time.perf_counter()
+    chunks = [
+        ch for p in pages
+        for ch in chunk_page_text(p.pdf_sha1, p.page_index, p.text, chunk_chars=chunk_chars, overlap=chunk_overlap)
+    ]
+    dt = time.perf_counter() - t0
+    return chunks, {"chunks": len(chunks), "seconds": dt, "chunks_per_s": len(chunks) / dt}
+
+def bench_embed(model, texts: List[str], *, batch_size: int) -> Dict[str, Any]:
+    t0 = time.perf_counter()
+    model.encode(texts, batch_size=batch_size, show_progress_bar=False, normalize_embeddings=True)
+    dt = time.perf_counter() - t0
+    return {"chunks": len(texts), "seconds": dt, "chunks_per_s": len(texts) / dt, "batch_size": batch_size}
+
+def bench_index(pdf_dir: Path, index_dir: Path, *, settings: Settings, model, ann: AnnParams) -> tuple:
+    if index_dir.exists():
+        shutil.rmtree(index_dir)
+    kwargs = dict(
+        pdf_dir=pdf_dir,
+        index_dir=index_dir,
+        embed_model=settings.embed_model,
+        chunk_chars=settings.chunk_chars,
+        chunk_overlap=settings.chunk_overlap,
+        extract_workers=settings.extract_workers,
+        ann=ann,
+        dedup_threshold=settings.dedup_threshold if settings.dedup else None,
+        lexical=settings.retrieval_mode == "hybrid",
+        model=model,
+    )
+    # cold: no embedding or page-text cache, everything is extracted and encoded
+    t0 = time.perf_counter()
+    build_or_load_index(**kwargs)
+    cold = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    artifacts = build_or_load_index(**kwargs)
+    warm = time.perf_counter() - t0
+    return artifacts, {
+        "cold_build_s": cold, "warm_load_s": warm, "chunks": len(artifacts.chunks), "index_type": ann.index_type,
+        "dedup_dropped": sum(e.get("num_duplicates", 0) for e in artifacts.pdfs.values()),
+        # the index is what stays resident; rescoring vectors are memory-mapped from disk
+        "quantization": ann.quantization, "index_bytes": (index_dir / "index.faiss").stat().st_size,
+    }
+
+def bench_retrieve(artifacts, questions: List[Dict], *, settings: Settings, embedder, reranker) -> Dict[str, Any]:
+    out: Dict[str, Any] = {}
+    texts = [q["text"] for q in questions]
+    for name, rerank in (("no_rerank", False), ("rerank", True)):
+        # warm-up so one-off allocations do not land in p95
+        retrieve(artifacts, query=texts[0], embedder=embedder, top_k=settings.top_k, fetch_k=settings.fetch_k, rerank=rerank, reranker=reranker)
+        samples = []
+        for q in texts:
+            t0 = time.perf_counter()
+            retrieve(
+                artifacts, query=q, embedder=embedder, top_k=settings.top_k, fetch_k=settings.fetch_k,
+                rerank=rerank, reranker=reranker, mode=settings.retrieval_mode,
+            )
+            samples.append(time.perf_counter() - t0)
+        t0 = time.perf_counter()
+        retrieve_many(
+            artifacts, queries=texts, embedder=embedder, top_k=settings.top_k, fetch_k=settings.fetch_k,
+            rerank=rerank, reranker=reranker, batch_size=settings.query_batch_size, mode=settings.retrieval_mode,
+        )
+        batch = time.perf_counter() - t0
+        out[name] = {"per_query": latency_stats(samples), "batch_queries_per_s": len(texts) / batch}
+    return out
+
+def bench_end_to_end(artifacts, questions: List[Dict], *, settings: Settings, embedder, reranker, llm_latency_s: float) -> Dict[str, Any]:
+    llm = StubLLM(latency_s=llm_latency_s)
+    t0 = time.perf_counter()
+    all_retrieved = retrieve_many(
+        artifacts, queries=[q["text"] for q in questions], embedder=embedder, top_k=settings.top_k,
+        fetch_k=settings.fetch_k, rerank=reranker is not None, reranker=reranker,
+        batch_size=settings.query_batch_size, mode=settings.retrieval_mode,
+    )
+    all_facts = [lookup_facts(settings, artifacts, q["text"], q["kind"]) for q in questions]
+    contexts = [question_context(settings, q["text"], q["kind"], r, f) for q, r, f in zip(questions, all_retrieved, all_facts)]
+    prompts = [build_prompt(q["text"], q["kind"], c) for q, c in zip(questions, contexts)]
+    responses = llm.generate_many(prompts, concurrency=settings.llm_concurrency)
+    answers = [
+        make_answer(q["text"], q["kind"], normalize_by_kind(q["kind"], resp.text, q["text"]), r, f)
+        for q, resp, r, f in zip(questions, responses, all_retrieved, all_facts)
+    ]
+    dt = time.perf_counter() - t0
+    tokenizer = load_tokenizer(tokenizer_for(settings))
+    correct = sum(1 for q, a in zip(questions, answers) if q["kind"] == "number" and a.value == q["expected"])
+    numbers = sum(1 for q in questions if q["kind"] == "number")
+    return {
+        "questions": len(questions),
+        "seconds": dt,
+        "questions_per_s": len(questions) / dt,
+        "rerank": reranker is not None,
+        "llm_latency_s": llm_latency_s,
+        "llm_concurrency": settings.llm_concurrency,
+        "context_tokens_mean": float(np.mean([tokenizer.count(c) for c in contexts])) if contexts else 0.0,
+        "context_tokenizer": tokenizer.name,
+        # sanity check that the pipeline still finds the planted figures, not an accuracy benchmark
+        "number_exact_match": correct / numbers if numbers else None,
+    }
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    settings = Settings()
+    if args.workers is not None:
+        settings = dataclasses.replace(settings, extract_workers=args.workers)
+    ann = AnnParams.from_settings(settings)
+
+    work = Path(args.workdir) if args.workdir else Path(tempfile.mkdtemp(prefix="rag-bench-"))
+    pdf_dir = work / "pdfs"
+    results: Dict[str, Any] = {}
+    rss: Dict[str, float] = {}
+
+    t0 = time.perf_counter()
+    if pdf_dir.exists():
+        shutil.rmtree(pdf_dir)
+    reports = make_corpus(pdf_dir, num_pdfs=args.pdfs, pages=args.pages, seed=args.seed)
+    questions = make_questions(reports, num_questions=args.questions, seed=args.seed)
+    results["corpus"] = {"pdfs": args.pdfs, "pages_per_pdf": args.pages, "questions": len(questions), "generate_s": time.perf_counter() - t0}
+    rss["corpus"] = peak_rss_mb()
+
+    if args.offline:
+        embedder, reranker = HashEmbedder(), OverlapReranker()
+    else:
+        from rag.embedding import embedder_from_settings, load_reranker
+        embedder, reranker = embedder_from_settings(settings), load_reranker(settings.rerank_model)
+    rss["models"] = peak_rss_mb()
+
+    pages, results["extract"] = bench_extract(list_pdfs(pdf_dir), workers=settings.extract_workers)
+    rss["extract"] = peak_rss_mb()
+    chunks, results["chunk"] = bench_chunk(pages, chunk_chars=settings.chunk_chars, chunk_overlap=settings.chunk_overlap)
+    rss["chunk"] = peak_rss_mb()
+    results["embed"] = bench_embed(embedder, [c.text for c in chunks], batch_size=args.embed_batch_size)
+    rss["embed"] = peak_rss_mb()
+    del pages, chunks
+
+    artifacts, results["index"] = bench_index(pdf_dir, work / "index", settings=settings, model=embedder, ann=ann)
+    rss["index"] = peak_rss_mb()
+    results["retrieve"] = bench_retrieve(artifacts, questions, settings=settings, embedder=embedder, reranker=reranker)
+    rss["retrieve"] = peak_rss_mb()
+    results["end_to_end"] = bench_end_to_end(
+        artifacts, questions, settings=settings, embedder=embedder,
+        reranker=reranker if args.e2e_rerank else None, llm_latency_s=args.llm_latency_ms / 1000.0,
+    )
+    rss["end_to_end"] = peak_rss_mb()
+    results["peak_rss_mb"] = {"after_stage": rss, "max": max(rss.values())}
+
+    if not args.workdir and not args.keep:
+        shutil.rmtree(work, ignore_errors=True)
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "offline_models": args.offline,
+            "embed_model": "hash" if args.offline else settings.embed_model,
+            "embed_backend": None if args.offline else settings.embed_backend,
+            "rerank_model": "overlap" if args.offline else settings.rerank_model,
+            "chunk_chars": settings.chunk_chars,
+            "chunk_overlap": settings.chunk_overlap,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Benchmark extraction, indexing, retrieval and answering on a synthetic corpus")
+    ap.add_argument("--pdfs", type=int, default=20)
+    ap.add_argument("--pages", type=int, default=30)
+    ap.add_argument("--questions", type=int, default=100)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--workers", type=int, default=None, help="extraction processes (default: EXTRACT_WORKERS)")
+    ap.add_argument("--embed-batch-size", type=int, default=64)
+    ap.add_argument("--llm-latency-ms", type=float, default=0.0, help="simulated latency of the stub LLM")
+    ap.add_argument("--e2e-rerank", action="store_true", help="rerank in the end-to-end run")
+    ap.add_argument("--offline", action="store_true", help="hashing stand-ins instead of sentence-transformers models")
+    ap.add_argument("--workdir", default=None, help="keep corpus and index here instead of a temp dir")
+    ap.add_argument("--keep", action="store_true", help="do not delete the temp dir")
+    ap.add_argument("--out", default=None, help="result JSON (default: benchmarks/results/<commit>.json)")
+    args = ap.parse_args()
+
+    report = run(args)
+    out = Path(args.out) if args.out else Path(__file__).parent / "results" / f"{(report['meta']['commit'] or 'nogit')[:10]}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(json.dumps(report["results"], indent=2))
+    print(f"Wrote: {out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+from __future__ import annotations
+
+import argparse
+import dataclasses
+import json
+import platform
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+
+from rag.config import Settings
+from rag.index import build_or_load_index_from_settings
+from rag.metadata import route_question
+
+from .corpus import make_corpus, make_questions
+from .run import HashEmbedder, git_commit, latency_stats
+
+# Sharded against single index on a synthetic corpus:
+#   python -m benchmarks.shards --pdfs 40 --shards 2,4 --workers local,process --offline
+# For every layout: cold build and warm load time (workers started and answering), dense search
+# throughput for the whole question batch and per question, with and without per-company routing
+# (FILTER_BY_COMPANY), and the overlap of the top-k ids with the single index. Query vectors are
+# encoded once up front, so the numbers are the search side only. INDEX_TYPE / QUANTIZATION apply.
+
+def _layout(settings: Settings, index_dir: Path, *, shards: int, workers: str) -> Settings:
+    return dataclasses.replace(settings, index_dir=index_dir, index_shards=shards, shard_workers=workers)
+
+def bench_layout(settings: Settings, *, model, texts: List[str], q: np.ndarray, k: int, repeat: int) -> tuple:
+    t0 = time.perf_counter()
+    artifacts = build_or_load_index_from_settings(settings, model=model)
+    build = time.perf_counter() - t0
+    if hasattr(artifacts, "close"):
+        artifacts.close()
+    t0 = time.perf_counter()
+    artifacts = build_or_load_index_from_settings(settings, model=model)
+    # a load is done when every worker has answered once
+    artifacts.search_vectors(q[:1], k, [None])
+    load = time.perf_counter() - t0
+
+    out: Dict[str, Any] = {"cold_build_s": build, "warm_load_s": load, "chunks": len(artifacts.chunks)}
+    ids = {}
+    routes = [route_question(t, artifacts.pdfs) for t in texts]
+    for name, ranges in (("open", [None] * len(q)), ("routed", [artifacts.id_ranges(r) if r else None for r in routes])):
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            D, I = artifacts.search_vectors(q, k, ranges)
+        batch = (time.perf_counter() - t0) / repeat
+        samples = []
+        for i in range(len(q)):
+            t0 = time.perf_counter()
+            artifacts.search_vectors(q[i:i + 1], k, ranges[i:i + 1])
+            samples.append(time.perf_counter() - t0)
+        out[name] = {"batch_queries_per_s": len(q) / batch, "per_query": latency_stats(samples)}
+        # global ids differ between layouts; compare by (pdf, page, chunk), and the scores themselves
+        # (equal-score candidates at the k-th place may be cut differently)
+        ids[name] = ([
+            {(c.pdf_sha1, c.page_index, c.chunk_index) for c in (artifacts.chunks[int(i)] for i in row if i >= 0)}
+            for row in I
+        ], np.where(I >= 0, D, 0.0))
+    if hasattr(artifacts, "close"):
+        artifacts.close()
+    return out, ids
+
+def overlap(a: List[set], b: List[set], k: int) -> float:
+    return float(np.mean([len(x & y) / k for x, y in zip(a, b)])) if a else 0.0
+
+def score_diff(a: np.ndarray, b: np.ndarray) -> float:
+    return float(np.abs(a - b).max()) if a.size else 0.0
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    work = Path(args.workdir) if args.workdir else Path(tempfile.mkdtemp(prefix="rag-shards-"))
+    pdf_dir = work / "pdfs"
+    if pdf_dir.exists():
+        shutil.rmtree(pdf_dir)
+    reports = make_corpus(pdf_dir, num_pdfs=args.pdfs, pages=args.pages, seed=args.seed)
+    questions = make_questions(reports, num_questions=args.questions, seed=args.seed)
+
+    # no embedding / page cache: every layout pays the full cold build
+    settings = dataclasses.replace(Settings(), pdf_dir=pdf_dir, embed_cache=False, page_cache=False)
+    if args.offline:
+        model = HashEmbedder()
+    else:
+        from rag.embedding import embedder_from_settings
+        model = embedder_from_settings(settings)
+    texts = [q["text"] for q in questions]
+    q = np.asarray(model.encode(texts, batch_size=64, normalize_embeddings=True), dtype="float32")
+
+    layouts = [("single", 1, "local")] + [
+        (f"{n}x{w}", n, w) for n in (int(x) for x in args.shards.split(",") if x.strip()) for w in args.workers.split(",") if w.strip()
+    ]
+    results: Dict[str, Any] = {}
+    baseline: Dict[str, tuple] = {}
+    for name, n, workers in layouts:
+        index_dir = work / f"index_{name}"
+        if index_dir.exists():
+            shutil.rmtree(index_dir)
+        s = _layout(settings, index_dir, shards=n, workers=workers)
+        row, ids = bench_layout(s, model=model, texts=texts, q=q, k=args.k, repeat=args.repeat)
+        baseline = baseline or ids
+        row["shards"], row["workers"] = n, workers if n > 1 else None
+        for mode in ("open", "routed"):
+            row[mode][f"overlap@{args.k}"] = overlap(ids[mode][0], baseline[mode][0], args.k)
+            row[mode]["max_score_diff"] = score_diff(ids[mode][1], baseline[mode][1])
+        results[name] = row
+        print(name, json.dumps({m: round(row[m]["batch_queries_per_s"], 1) for m in ("open", "routed")}), flush=True)
+
+    if not args.workdir and not args.keep:
+        shutil.rmtree(work, ignore_errors=True)
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "offline_models": args.offline,
+            "embed_model": "hash" if args.offline else settings.embed_model,
+            "index_type": settings.index_type,
+            "quantization": settings.quantization,
+            "pdfs": args.pdfs,
+            "pages_per_pdf": args.pages,
+            "questions": len(questions),
+            "k": args.k,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Benchmark a sharded index (scatter-gather search) against a single index")
+    ap.add_argument("--pdfs", type=int, default=40)
+    ap.add_argument("--pages", type=int, default=30)
+    ap.add_argument("--questions", type=int, default=200)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--shards", default="2,4", help="comma-separated shard counts")
+    ap.add_argument("--workers", default="local,process", help="comma-separated SHARD_WORKERS kinds")
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--repeat", type=int, default=5, help="batch searches averaged per layout")
+    ap.add_argument("--offline", action="store_true", help="hashing stand-in instead of the sentence-transformers model")
+    ap.add_argument("--workdir", default=None, help="keep corpus and indexes here instead of a temp dir")
+    ap.add_argument("--keep", action="store_true", help="do not delete the temp dir")
+    ap.add_argument("--out", default=None, help="result JSON (default: benchmarks/results/shards_<commit>.json)")
+    args = ap.parse_args()
+
+    report = run(args)
+    out = Path(args.out) if args.out else Path(__file__).parent / "results" / f"shards_{(report['meta']['commit'] or 'nogit')[:10]}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(json.dumps(report["results"], indent=2))
+    print(f"Wrote: {out}")
+
+if __name__ == "__main__":
+    main()
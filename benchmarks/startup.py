@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from .run import git_commit
+
+# Cold-start cost of the entry points, each measured in a fresh interpreter:
+#   python -m benchmarks.startup --repeat 5 --max-import-s 2.0
+# Importing main / rag.server must not pull in torch, sentence-transformers or faiss; those load on
+# first use. "resume" runs main.py with every answer already checkpointed, which should never touch
+# the models or the index. Exits non-zero when an import is over --max-import-s or loads a heavy module.
+
+ROOT = Path(__file__).resolve().parent.parent
+MODULES = ("main", "rag.server", "rag.index", "rag.retrieval", "rag.ann")
+HEAVY = ("torch", "sentence_transformers", "transformers", "faiss", "fitz", "tqdm")
+
+_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import {module}
+dt = time.perf_counter() - t0
+print(json.dumps({{"seconds": dt, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+def probe_import(module: str) -> Dict[str, Any]:
+    out = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(module=module, heavy=HEAVY)],
+        capture_output=True, text=True, check=True, cwd=ROOT,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def bench_import(module: str, *, repeat: int) -> Dict[str, Any]:
+    runs = [probe_import(module) for _ in range(repeat)]
+    seconds = [r["seconds"] for r in runs]
+    return {"median_s": statistics.median(seconds), "min_s": min(seconds), "max_s": max(seconds), "heavy": runs[-1]["heavy"]}
+
+def bench_resume(*, repeat: int) -> Dict[str, Any]:
+    # a run where every question is already in the checkpoint: only the submission gets written
+    from rag.checkpoint import AnswerCheckpoint, question_key, run_fingerprint
+    from rag.config import Settings
+    from rag.submission import Answer
+
+    with tempfile.TemporaryDirectory(prefix="rag-startup-") as tmp:
+        work = Path(tmp)
+        questions = [{"text": f"What was the revenue of Company {i}?", "kind": "number"} for i in range(20)]
+        (work / "data" / "questions").mkdir(parents=True)
+        (work / "data" / "questions" / "questions.json").write_text(json.dumps(questions), encoding="utf-8")
+        # main.py runs with the same environment, so its fingerprint matches this one
+        fingerprint = run_fingerprint(Settings())
+
+        env = {**os.environ, "SUBMISSION_NAME": "startup", "METRICS": "false", "PROFILE": "", "RESUME": "true"}
+        seconds = []
+        for _ in range(repeat):
+            # a finished run removes its checkpoint
+            checkpoint = AnswerCheckpoint(work / "submissions" / "submission_startup.checkpoint.jsonl", fingerprint=fingerprint)
+            for q in questions:
+                checkpoint.append(question_key(q["text"], q["kind"]), Answer(value=0, question_text=q["text"], kind=q["kind"]))
+            t0 = time.perf_counter()
+            subprocess.run([sys.executable, str(ROOT / "main.py")], capture_output=True, text=True, check=True, cwd=work, env=env)
+            seconds.append(time.perf_counter() - t0)
+    return {"questions": len(questions), "median_s": statistics.median(seconds), "min_s": min(seconds), "max_s": max(seconds)}
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    results: Dict[str, Any] = {"imports": {m: bench_import(m, repeat=args.repeat) for m in MODULES}}
+    if not args.skip_resume:
+        results["resume"] = bench_resume(repeat=args.repeat)
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+
+def check(report: Dict[str, Any], *, max_import_s: float | None) -> List[str]:
+    problems = []
+    for module, r in report["results"]["imports"].items():
+        if r["heavy"]:
+            problems.append(f"import {module} loads {', '.join(r['heavy'])}")
+        if max_import_s is not None and r["median_s"] > max_import_s:
+            problems.append(f"import {module} takes {r['median_s']:.2f}s (> {max_import_s:.2f}s)")
+    return problems
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Measure import and resume-run startup time of the entry points")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--skip-resume", action="store_true", help="only time the imports")
+    ap.add_argument("--max-import-s", type=float, default=None, help="fail when a median import time exceeds this")
+    ap.add_argument("--out", default=None, help="result JSON (default: benchmarks/results/startup_<commit>.json)")
+    args = ap.parse_args()
+
+    report = run(args)
+    out = Path(args.out) if args.out else Path(__file__).parent / "results" / f"startup_{(report['meta']['commit'] or 'nogit')[:10]}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(json.dumps(report["results"], indent=2))
+    print(f"Wrote: {out}")
+
+    problems = check(report, max_import_s=args.max_import_s)
+    for p in problems:
+        print(f"FAIL: {p}", file=sys.stderr)
+    if problems:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
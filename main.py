@@ -5,14 +5,15 @@ from pathlib import Path
 from dotenv import load_dotenv
 load_dotenv()
 
-from sentence_transformers import SentenceTransformer, CrossEncoder
-
 from rag.config import Settings
-from rag.index import build_or_load_index
-from rag.retrieval import retrieve, build_context
-from rag.llm import GeminiClient, OpenAICompatibleClient, HeuristicLLM
-from rag.answering import build_prompt, normalize_by_kind, default_heuristic_answer, pick_references
-from rag.submission import Submission, Answer, SourceReference
+from rag.embedding import embedder_from_settings, load_reranker
+from rag.index import build_or_load_index_from_settings
+from rag.llm import RateLimiter
+from rag.pipeline import get_llm, lookup_facts, question_context, make_answer, retrieve_questions, make_rerank_cache
+from rag.answering import build_prompt, normalize_by_kind, default_heuristic_answer
+from rag.submission import Submission
+from rag.checkpoint import AnswerCheckpoint, question_key, run_fingerprint
+from rag.metrics import METRICS, profile
 
 def load_questions(path: Path):
     data = json.loads(path.read_text(encoding="utf-8"))
@@ -22,109 +23,129 @@ def load_questions(path: Path):
         out.append({"text": q["text"], "kind": q.get("kind","name")})
     return out
 
-def get_llm(settings: Settings):
-    if settings.generator == "gemini":
-        if not settings.gemini_api_key:
-            raise RuntimeError("GENERATOR=gemini but GEMINI_API_KEY is not set")
-        return GeminiClient(api_key=settings.gemini_api_key, model=settings.gemini_model)
-    if settings.generator == "openai":
-        if not settings.openai_api_key:
-            raise RuntimeError("GENERATOR=openai but OPENAI_API_KEY is not set")
-        return OpenAICompatibleClient(api_key=settings.openai_api_key, base_url=settings.openai_base_url, model=settings.openai_model)
-    return HeuristicLLM()
-
 def main():
     settings = Settings()
     print("GENERATOR =", settings.generator)
     settings.submissions_dir.mkdir(parents=True, exist_ok=True)
 
+    METRICS.reset()
+    METRICS.enabled = settings.metrics
+    try:
+        with profile(settings.profile, settings.submissions_dir / f"profile_{settings.submission_name}"):
+            run(settings)
+    finally:
+        # also written when the run fails, so the trace shows how far it got
+        if settings.metrics:
+            metrics_path = settings.submissions_dir / f"metrics_{settings.submission_name}.json"
+            METRICS.write_json(metrics_path, generator=settings.generator, submission_name=settings.submission_name)
+            print(f"Metrics: {metrics_path}")
+
+def run(settings: Settings) -> None:
     questions = load_questions(settings.questions_path)
 
-    artifacts = build_or_load_index(
-        pdf_dir=settings.pdf_dir,
-        index_dir=settings.index_dir,
-        embed_model=settings.embed_model,
-        chunk_chars=settings.chunk_chars,
-        chunk_overlap=settings.chunk_overlap,
+    # answers are appended to the checkpoint as they complete; a restarted run with the same settings
+    # only does the rest
+    checkpoint = AnswerCheckpoint(
+        settings.submissions_dir / f"submission_{settings.submission_name}.checkpoint.jsonl",
+        resume=settings.resume, fingerprint=run_fingerprint(settings),
     )
-
-    embedder = SentenceTransformer(settings.embed_model)
-    reranker = CrossEncoder(settings.rerank_model) if settings.rerank else None
-    llm = get_llm(settings)
-
-    answers = []
-    for q in questions:
-        qtext = q["text"]
-        kind = q["kind"]
-
-        retrieved = retrieve(
-            artifacts,
-            query=qtext,
-            embedder=embedder,
-            top_k=settings.top_k,
-            fetch_k=settings.fetch_k,
-            rerank=settings.rerank,
-            reranker=reranker,
-        )
-        context = build_context(retrieved, max_chars=settings.max_context_chars)
-        if kind == "number":
-            q = qtext.lower()
-            keywords = [w for w in q.replace('"', '').replace("?", "").split() if len(w) >= 5]
-            lines = []
-            for chunk in retrieved[: min(len(retrieved), 12)]:
-                txt = chunk["text"] if isinstance(chunk, dict) else getattr(chunk, "text", "")
-                for sent in txt.split("."):
-                    s = sent.strip()
-                    if not s:
-                        continue
-                    sl = s.lower()
-                    if any(k in sl for k in keywords):
-                        lines.append(s)
-                if len(" ".join(lines)) > settings.max_context_chars:
-                    break
-            if lines:
-                context = ". ".join(lines)[: settings.max_context_chars]
-
-        if settings.generator == "heuristic":
-            value = default_heuristic_answer(kind, retrieved)
-        else:
-            prompt = build_prompt(qtext, kind, context)
-            raw = llm.generate(prompt).text
-            value = normalize_by_kind(kind, raw, qtext)
-            
-
-        refs = pick_references(retrieved, max_refs=2)
-        # ===== FINAL SAFETY (ABSOLUTE MUST) =====
-        if kind == "boolean":
-            # по правилам: если нет упоминания -> False
-            if value in ("N/A", "NA", None, ""):
-                value = False
-            if isinstance(value, str):
-                v = value.strip().lower()
-                if v in ("yes", "true", "1"):
-                    value = True
-                elif v in ("no", "false", "0"):
-                    value = False
-                else:
-                    value = False
-
-        if kind == "number":
-            from rag.answering import sanitize_number
-            value = sanitize_number(value, qtext)
-        # =======================================
-
-        ans = Answer(value=value, references=[SourceReference(**r) for r in refs], question_text=qtext, kind=kind)
-        answers.append(ans)
+    done = checkpoint.load()
+    keys = [question_key(q["text"], q["kind"]) for q in questions]
+    for q, k in zip(questions, keys):
+        # LLM output that the current normalize_by_kind reads differently is answered again (from the LLM cache)
+        raw = checkpoint.raw.get(k)
+        if k in done and raw is not None and normalize_by_kind(q["kind"], raw, q["text"]) != done[k].value:
+            del done[k]
+    pending = [i for i, k in enumerate(keys) if k not in done]
+    print(f"Questions: {len(questions)} total, {len(questions) - len(pending)} already answered")
+
+    if pending:
+        answer_questions(settings, [questions[i] for i in pending], [keys[i] for i in pending], checkpoint, done)
 
     submission = Submission.model_validate({
         "email": settings.team_email,
         "submission_name": settings.submission_name,
-        "answers": [a.model_dump() for a in answers],
+        "answers": [done[k].model_dump() for k in keys],
     })
 
     out_path = settings.submissions_dir / f"submission_{settings.submission_name}.json"
-    out_path.write_text(submission.model_dump_json(indent=2, by_alias=False), encoding="utf-8")
+    with METRICS.timer("submission.write"):
+        out_path.write_text(submission.model_dump_json(indent=2, by_alias=False), encoding="utf-8")
+    # the next run starts over: it is usually made to see the effect of a change
+    checkpoint.remove()
     print(f"Wrote: {out_path}")
 
+def answer_questions(settings: Settings, questions, keys, checkpoint: AnswerCheckpoint, done) -> None:
+    artifacts = build_or_load_index_from_settings(settings)
+
+    with METRICS.timer("models.load"):
+        # memoised: the same embedder instance the index build used, if it had to encode
+        embedder = embedder_from_settings(settings)
+        reranker = load_reranker(settings.rerank_model) if settings.rerank else None
+        llm = get_llm(settings)
+    for q, key in zip(questions, keys):
+        METRICS.annotate(key, question=q["text"], kind=q["kind"])
+
+    # ===== retrieval phase: all questions in one batch =====
+    with METRICS.timer("retrieval.batch") as retrieval:
+        all_retrieved = retrieve_questions(
+            settings, artifacts, [q["text"] for q in questions],
+            embedder=embedder, reranker=reranker, rerank_cache=make_rerank_cache(settings),
+        )
+    # retrieval is batched, so a question's trace gets an equal share of the batch time
+    for key in keys:
+        METRICS.annotate(key, retrieval_share_s=retrieval.seconds / len(keys))
+
+    all_facts = []
+    for q, key in zip(questions, keys):
+        with METRICS.timer("facts.lookup", trace=key):
+            all_facts.append(lookup_facts(settings, artifacts, q["text"], q["kind"]))
+
+    def finish(i: int, value, raw: str | None = None) -> None:
+        q = questions[i]
+        with METRICS.timer("answer.make", trace=keys[i]):
+            answer = make_answer(q["text"], q["kind"], value, all_retrieved[i], all_facts[i])
+        with METRICS.timer("checkpoint.append", trace=keys[i]):
+            checkpoint.append(keys[i], answer, raw=raw)
+        done[keys[i]] = answer
+
+    # ===== generation phase =====
+    if settings.generator == "heuristic":
+        for i, q in enumerate(questions):
+            with METRICS.timer("answer.heuristic", trace=keys[i]):
+                value = default_heuristic_answer(q["kind"], all_retrieved[i], all_facts[i], question=q["text"])
+            finish(i, value)
+        return
+
+    prompts = []
+    for q, key, retrieved, facts in zip(questions, keys, all_retrieved, all_facts):
+        with METRICS.timer("prompt.build", trace=key):
+            prompts.append(build_prompt(q["text"], q["kind"], question_context(settings, q["text"], q["kind"], retrieved, facts)))
+
+    def on_llm_result(i: int, resp) -> None:
+        key = keys[i]
+        if resp.cached:
+            METRICS.count("llm.cache_hits", trace=key)
+        else:
+            if resp.total_s is not None:
+                METRICS.observe("llm.call", resp.total_s, trace=key)
+            if resp.ttfb_s is not None:
+                METRICS.observe("llm.ttfb", resp.ttfb_s, trace=key)
+            METRICS.count("llm.attempts", resp.attempts, trace=key)
+            METRICS.count("llm.prompt_tokens", resp.prompt_tokens or 0, trace=key)
+            METRICS.count("llm.completion_tokens", resp.completion_tokens or 0, trace=key)
+        with METRICS.timer("answer.normalize", trace=key):
+            value = normalize_by_kind(questions[i]["kind"], resp.text, questions[i]["text"])
+        finish(i, value, resp.text)
+
+    llm.generate_many(
+        prompts,
+        concurrency=settings.llm_concurrency,
+        rate_limiter=RateLimiter(settings.llm_rate_per_sec, burst=settings.llm_concurrency),
+        max_retries=settings.llm_max_retries,
+        backoff=settings.llm_backoff,
+        on_result=on_llm_result,
+    )
+
 if __name__ == "__main__":
     main()
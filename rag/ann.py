@@ -0,0 +1,384 @@
+from __future__ import annotations
+
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Sequence, Tuple, TYPE_CHECKING
+import time
+import numpy as np
+
+if TYPE_CHECKING:
+    import faiss
+
+INDEX_TYPES = ("flat", "hnsw", "ivf", "ivfpq")
+# how vectors are stored in the index: full float32, faiss scalar quantizer (2 or 1 byte per dimension)
+# or sign bits searched by Hamming distance (1 bit per dimension)
+QUANTIZATIONS = ("none", "fp16", "int8", "binary")
+_SQ = {"fp16": "SQfp16", "int8": "SQ8"}
+# set bits per byte value, for Hamming distances computed in numpy
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype="uint8")
+
+@dataclass(frozen=True)
+class AnnParams:
+    index_type: str = "flat"
+    # hnsw
+    hnsw_m: int = 32
+    hnsw_ef_construction: int = 200
+    hnsw_ef_search: int = 64
+    # ivf / ivfpq
+    ivf_nlist: int = 1024
+    ivf_nprobe: int = 16
+    ivf_train_sample: int = 100_000
+    pq_m: int = 16  # sub-quantizers; code size is pq_m * pq_nbits / 8 bytes per chunk
+    pq_nbits: int = 8
+    quantization: str = "none"
+    # lossy indexes fetch rescore_factor * k candidates and re-rank them by exact inner product
+    # against float32 vectors kept on disk next to the chunk store
+    rescore: bool = True
+    rescore_factor: int = 4
+
+    def __post_init__(self):
+        if self.index_type not in INDEX_TYPES:
+            raise ValueError(f"INDEX_TYPE must be one of {INDEX_TYPES}, got {self.index_type!r}")
+        if self.quantization not in QUANTIZATIONS:
+            raise ValueError(f"QUANTIZATION must be one of {QUANTIZATIONS}, got {self.quantization!r}")
+        if self.index_type == "ivfpq" and self.quantization != "none":
+            raise ValueError("INDEX_TYPE=ivfpq is already product-quantized; use QUANTIZATION=none")
+        if self.quantization == "binary" and self.index_type not in ("flat", "hnsw"):
+            raise ValueError("QUANTIZATION=binary supports INDEX_TYPE=flat or hnsw")
+
+    @property
+    def lossy(self) -> bool:
+        return self.quantization != "none" or self.index_type == "ivfpq"
+
+    @property
+    def keeps_vectors(self) -> bool:
+        # exact vectors are only worth storing when the index itself cannot return exact scores
+        return self.lossy and self.rescore
+
+    @property
+    def needs_training(self) -> bool:
+        return self.index_type in ("ivf", "ivfpq") or self.quantization == "int8"
+
+    @classmethod
+    def from_settings(cls, settings) -> "AnnParams":
+        return cls(
+            index_type=settings.index_type,
+            hnsw_m=settings.hnsw_m,
+            hnsw_ef_construction=settings.hnsw_ef_construction,
+            hnsw_ef_search=settings.hnsw_ef_search,
+            ivf_nlist=settings.ivf_nlist,
+            ivf_nprobe=settings.ivf_nprobe,
+            ivf_train_sample=settings.ivf_train_sample,
+            pq_m=settings.pq_m,
+            pq_nbits=settings.pq_nbits,
+            quantization=settings.quantization,
+            rescore=settings.rescore,
+            rescore_factor=settings.rescore_factor,
+        )
+
+    def build_info(self) -> Dict[str, Any]:
+        # parameters baked into the stored index; efSearch/nprobe are query-time only
+        info = {"index_type": self.index_type}
+        if self.index_type == "hnsw":
+            info.update(hnsw_m=self.hnsw_m, hnsw_ef_construction=self.hnsw_ef_construction)
+        if self.index_type in ("ivf", "ivfpq"):
+            info.update(ivf_nlist=self.ivf_nlist)
+        if self.index_type == "ivfpq":
+            info.update(pq_m=self.pq_m, pq_nbits=self.pq_nbits)
+        # older indexes have no quantization key: they are float32, i.e. "none"
+        if self.quantization != "none":
+            info.update(quantization=self.quantization)
+        if self.lossy:
+            info.update(rescore=self.rescore)
+        return info
+
+def is_binary(index) -> bool:
+    import faiss
+
+    return isinstance(index, faiss.IndexBinary)
+
+def binary_codes(x: np.ndarray) -> np.ndarray:
+    # one sign bit per dimension, packed 8 per byte
+    return np.packbits(np.asarray(x) > 0, axis=1)
+
+def hamming_to_score(D: np.ndarray, dim: int) -> np.ndarray:
+    # inner product of the +-1 sign vectors scaled to [-1, 1], so higher stays better like cosine
+    return 1.0 - 2.0 * np.asarray(D, dtype="float32") / dim
+
+def _make_binary_index(dim: int, params: AnnParams):
+    import faiss
+
+    if dim % 8:
+        raise ValueError(f"QUANTIZATION=binary needs a dimension divisible by 8, got {dim}")
+    if params.index_type == "hnsw":
+        inner = faiss.IndexBinaryHNSW(dim, params.hnsw_m)
+        inner.hnsw.efConstruction = params.hnsw_ef_construction
+    else:
+        inner = faiss.IndexBinaryFlat(dim)
+    index = faiss.IndexBinaryIDMap2(inner)
+    apply_search_params(index, params)
+    return index
+
+def make_index(dim: int, params: AnnParams, train: np.ndarray | None = None) -> faiss.Index:
+    import faiss
+
+    # flat and hnsw are wrapped in IDMap2 so chunk ids stay stable and can be reconstructed; IVF lists
+    # store the chunk ids themselves (IDMap2 over IVF breaks on the second remove_ids)
+    if params.quantization == "binary":
+        return _make_binary_index(dim, params)
+    storage = _SQ.get(params.quantization, "Flat")
+    if params.index_type == "flat":
+        desc = storage
+    elif params.index_type == "hnsw":
+        desc = f"HNSW{params.hnsw_m},{storage}"
+    else:
+        n = 0 if train is None else len(train)
+        # faiss wants ~39 training points per centroid; clamp for small corpora
+        nlist = max(1, min(params.ivf_nlist, n // 39 or 1))
+        # PQ codebooks need at least 2**nbits training points each
+        nbits = max(1, min(params.pq_nbits, int(np.log2(max(n, 2)))))
+        desc = f"IVF{nlist},{storage}" if params.index_type == "ivf" else f"IVF{nlist},PQ{params.pq_m}x{nbits}"
+
+    wrap = "IDMap2," if params.index_type in ("flat", "hnsw") else ""
+    index = faiss.index_factory(dim, wrap + desc, faiss.METRIC_INNER_PRODUCT)
+    if params.index_type == "hnsw":
+        faiss.downcast_index(index.index).hnsw.efConstruction = params.hnsw_ef_construction
+    if not index.is_trained:
+        if train is None or not len(train):
+            raise ValueError(f"INDEX_TYPE={params.index_type} needs training vectors")
+        if len(train) > params.ivf_train_sample:
+            rng = np.random.default_rng(0)
+            train = train[np.sort(rng.choice(len(train), params.ivf_train_sample, replace=False))]
+        index.train(np.ascontiguousarray(train, dtype="float32"))
+    apply_search_params(index, params)
+    return index
+
+def apply_search_params(index: faiss.Index, params: AnnParams) -> None:
+    import faiss
+
+    if params.index_type == "hnsw":
+        inner = faiss.downcast_IndexBinary(index.index) if is_binary(index) else faiss.downcast_index(index.index)
+        inner.hnsw.efSearch = params.hnsw_ef_search
+    elif params.index_type in ("ivf", "ivfpq"):
+        faiss.extract_index_ivf(index).nprobe = params.ivf_nprobe
+
+def supports_remove(params: AnnParams) -> bool:
+    return params.index_type != "hnsw"
+
+def remove_id_range(index: faiss.Index, params: AnnParams, lo: int, hi: int) -> faiss.Index:
+    import faiss
+
+    if supports_remove(params):
+        index.remove_ids(faiss.IDSelectorRange(lo, hi))
+        return index
+    # HNSW graphs cannot drop nodes: rebuild from the stored vectors (or codes) of the remaining ids
+    ids = faiss.vector_to_array(index.id_map)
+    inner = faiss.downcast_IndexBinary(index.index) if is_binary(index) else faiss.downcast_index(index.index)
+    vectors = inner.reconstruct_n(0, index.ntotal)
+    keep = (ids < lo) | (ids >= hi)
+    rebuilt = make_index(index.d, params, train=vectors[keep] if params.needs_training else None)
+    if keep.any():
+        rebuilt.add_with_ids(vectors[keep], ids[keep])
+    return rebuilt
+
+def add_vectors(index, vectors: np.ndarray, ids: np.ndarray) -> None:
+    if is_binary(index):
+        vectors = binary_codes(vectors)
+    index.add_with_ids(np.ascontiguousarray(vectors), ids)
+
+def search_index(index, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    if is_binary(index):
+        D, I = index.search(binary_codes(queries), k)
+        return np.where(I >= 0, hamming_to_score(D, index.d), -np.inf).astype("float32"), I
+    return index.search(np.ascontiguousarray(queries, dtype="float32"), k)
+
+def rescore(queries: np.ndarray, I: np.ndarray, vectors: np.ndarray, ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    # exact inner products for first-pass candidates I; vectors[row] belongs to chunk id ids[row] (ids ascending)
+    valid = (I >= 0) & (len(ids) > 0)
+    rows = np.minimum(np.searchsorted(ids, np.where(valid, I, 0)), max(len(ids) - 1, 0))
+    order = np.argsort(rows, axis=None)
+    flat = np.empty((rows.size, queries.shape[1]), dtype="float32")
+    if rows.size and len(ids):
+        # sorted row order reads the memmap sequentially
+        flat[order] = vectors[rows.ravel()[order]]
+    exact = np.einsum("qd,qkd->qk", queries, flat.reshape(*I.shape, -1))
+    exact = np.where(valid, exact, -np.inf)
+    kk = min(k, I.shape[1])
+    top = np.argsort(-exact, axis=1, kind="stable")[:, :kk]
+    D = np.full((len(queries), k), -np.inf, dtype="float32")
+    out = np.full((len(queries), k), -1, dtype="int64")
+    D[:, :kk] = np.take_along_axis(exact, top, axis=1)
+    out[:, :kk] = np.where(np.isfinite(D[:, :kk]), np.take_along_axis(I, top, axis=1), -1)
+    return D, out
+
+def search_id_ranges(
+    index: faiss.Index,
+    params: AnnParams,
+    queries: np.ndarray,
+    k: int,
+    ranges: Sequence[Tuple[int, int]],
+) -> Tuple[np.ndarray, np.ndarray]:
+    import faiss
+
+    # restrict search to chunk ids in [lo, hi) ranges (one range per PDF)
+    ranges = [(lo, hi) for lo, hi in ranges if hi > lo]
+    if not ranges or index.ntotal == 0:
+        return np.full((len(queries), k), -np.inf, dtype="float32"), np.full((len(queries), k), -1, dtype="int64")
+
+    if is_binary(index):
+        # binary indexes take no search parameters: Hamming distances over the PDF's slice of the
+        # codes (flat storage, or the HNSW's flat storage; both keep insertion order)
+        inner = faiss.downcast_IndexBinary(index.index)
+        storage = inner if params.index_type == "flat" else faiss.downcast_IndexBinary(inner.storage)
+        id_map = faiss.vector_to_array(index.id_map)
+        codes = faiss.vector_to_array(storage.xb).reshape(index.ntotal, index.code_size)
+        pos = np.concatenate([np.arange(*np.searchsorted(id_map, [lo, hi])) for lo, hi in ranges])
+        q = binary_codes(queries)
+        hamming = _POPCOUNT[q[:, None, :] ^ codes[pos][None, :, :]].sum(axis=2, dtype="int32")
+        scores = hamming_to_score(hamming, index.d)
+        kk = min(k, len(pos))
+        top = np.argsort(-scores, axis=1, kind="stable")[:, :kk]
+        D = np.full((len(queries), k), -np.inf, dtype="float32")
+        I = np.full((len(queries), k), -1, dtype="int64")
+        D[:, :kk] = np.take_along_axis(scores, top, axis=1)
+        I[:, :kk] = id_map[pos[top]]
+        return D, I
+
+    if params.index_type == "flat" and params.quantization == "none":
+        # ids are assigned in ascending order and removal keeps order, so a PDF's vectors are one
+        # contiguous slice of the flat storage: score just that slice
+        id_map = faiss.rev_swig_ptr(index.id_map.data(), index.id_map.size())
+        xb = faiss.rev_swig_ptr(faiss.downcast_index(index.index).get_xb(), index.ntotal * index.d).reshape(index.ntotal, index.d)
+        pos = [np.arange(*np.searchsorted(id_map, [lo, hi])) for lo, hi in ranges]
+        pos = np.concatenate(pos)
+        scores = queries @ xb[pos].T
+        kk = min(k, len(pos))
+        top = np.argsort(-scores, axis=1, kind="stable")[:, :kk]
+        D = np.full((len(queries), k), -np.inf, dtype="float32")
+        I = np.full((len(queries), k), -1, dtype="int64")
+        D[:, :kk] = np.take_along_axis(scores, top, axis=1)
+        I[:, :kk] = id_map[pos[top]]
+        return D, I
+
+    sel = faiss.IDSelectorRange(*ranges[0]) if len(ranges) == 1 else faiss.IDSelectorBatch(
+        np.concatenate([np.arange(lo, hi, dtype="int64") for lo, hi in ranges])
+    )
+    if params.index_type == "hnsw":
+        sp = faiss.SearchParametersHNSW(sel=sel, efSearch=params.hnsw_ef_search)
+    elif params.index_type == "flat":
+        sp = faiss.SearchParameters(sel=sel)
+    else:
+        sp = faiss.SearchParametersIVF(sel=sel, nprobe=params.ivf_nprobe)
+    return index.search(np.ascontiguousarray(queries, dtype="float32"), k, params=sp)
+
+def exact_search(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    import faiss
+
+    flat = faiss.IndexFlatIP(vectors.shape[1])
+    flat.add(np.ascontiguousarray(vectors, dtype="float32"))
+    _, I = flat.search(np.ascontiguousarray(queries, dtype="float32"), k)
+    return I
+
+def recall_at_k(approx_ids: np.ndarray, exact_ids: np.ndarray, k: int) -> float:
+    # fraction of the exact top-k that the approximate index also returns in its top-k
+    hits = 0
+    total = 0
+    for a, e in zip(approx_ids[:, :k].tolist(), exact_ids[:, :k].tolist()):
+        e = [x for x in e if x != -1]
+        hits += len(set(a) & set(e))
+        total += len(e)
+    return hits / total if total else 1.0
+
+def evaluate(
+    index: faiss.Index,
+    params: AnnParams,
+    *,
+    vectors: np.ndarray,
+    ids: np.ndarray,
+    queries: np.ndarray,
+    k: int,
+    ef_search: Sequence[int] = (),
+    nprobe: Sequence[int] = (),
+) -> List[Dict[str, Any]]:
+    t0 = time.perf_counter()
+    I = exact_search(vectors, queries, k)
+    exact = np.where(I >= 0, ids[I], -1)
+    flat_ms = (time.perf_counter() - t0) * 1000 / max(1, len(queries))
+
+    points = [params]
+    if params.index_type == "hnsw":
+        points += [AnnParams(**{**asdict(params), "hnsw_ef_search": v}) for v in ef_search]
+    elif params.index_type in ("ivf", "ivfpq"):
+        points += [AnnParams(**{**asdict(params), "ivf_nprobe": v}) for v in nprobe]
+
+    rows = []
+    for p in points:
+        apply_search_params(index, p)
+        t0 = time.perf_counter()
+        _, I = search_index(index, queries, k)
+        ms = (time.perf_counter() - t0) * 1000 / max(1, len(queries))
+        row = {
+            **p.build_info(),
+            "hnsw_ef_search": p.hnsw_ef_search if p.index_type == "hnsw" else None,
+            "ivf_nprobe": p.ivf_nprobe if p.index_type in ("ivf", "ivfpq") else None,
+            f"recall@{k}": round(recall_at_k(I, exact, k), 4),
+            "ms_per_query": round(ms, 3),
+            "flat_ms_per_query": round(flat_ms, 3),
+        }
+        if p.keeps_vectors:
+            t0 = time.perf_counter()
+            _, I = search_index(index, queries, k * p.rescore_factor)
+            _, I = rescore(queries, I, vectors, ids, k)
+            row[f"rescored_recall@{k}"] = round(recall_at_k(I, exact, k), 4)
+            row["rescored_ms_per_query"] = round((time.perf_counter() - t0) * 1000 / max(1, len(queries)), 3)
+        rows.append(row)
+    apply_search_params(index, params)
+    return rows
+
+def main() -> None:
+    # python -m rag.ann --k 10 --ef-search 16,32,128 --nprobe 4,32,128
+    import argparse
+    import json
+
+    from .config import Settings
+    from .embed_cache import EmbeddingCache
+    from .embedding import embed_model_id, embedder_from_settings
+    from .index import build_or_load_index_from_settings
+
+    ap = argparse.ArgumentParser(description="recall@k and latency of INDEX_TYPE against exact flat search")
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--ef-search", default="", help="comma-separated efSearch values to sweep (hnsw)")
+    ap.add_argument("--nprobe", default="", help="comma-separated nprobe values to sweep (ivf, ivfpq)")
+    args = ap.parse_args()
+
+    settings = Settings()
+    if settings.index_shards > 1:
+        raise SystemExit("rag.ann evaluates a single index; run it with INDEX_SHARDS=1")
+    params = AnnParams.from_settings(settings)
+    artifacts = build_or_load_index_from_settings(settings)
+    model = embedder_from_settings(settings)
+
+    # exact vectors come from the embedding cache (free after indexing) or are re-encoded
+    ids = np.asarray(artifacts.chunks.ids)
+    texts = list(artifacts.chunks.iter_texts())
+    encode = lambda t: np.asarray(model.encode(t, batch_size=64, normalize_embeddings=True), dtype="float32")
+    if settings.embed_cache:
+        vectors = EmbeddingCache(
+            settings.embed_cache_dir, embed_model_id(settings.embed_model, settings.embed_backend), dtype=settings.embed_cache_dtype,
+        ).get_or_compute(texts, encode)
+    else:
+        vectors = encode(texts)
+
+    questions = [q["text"] for q in json.loads(settings.questions_path.read_text(encoding="utf-8"))]
+    queries = np.asarray(model.encode(questions, batch_size=64, normalize_embeddings=True), dtype="float32")
+
+    parse = lambda s: [int(x) for x in s.split(",") if x.strip()]
+    rows = evaluate(
+        artifacts.faiss_index, params,
+        vectors=vectors, ids=ids, queries=queries, k=args.k,
+        ef_search=parse(args.ef_search), nprobe=parse(args.nprobe),
+    )
+    for row in rows:
+        print(json.dumps(row))
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,15 @@ from __future__ import annotations
 
 import re
 from dataclasses import dataclass
-from typing import Any, List, Tuple
+from typing import Any, List, Sequence, Tuple
 
 from .retrieval import Retrieved
+from .facts import Fact, label_matches, metric_terms
+from .sentences import sentence_spans, sentence_texts
+
+# bump when prompts, normalization or the heuristic answers change, so checkpointed answers of an
+# interrupted run (rag/checkpoint.py) are not resumed
+ANSWER_VERSION = 2
 
 BOOL_TRUE = {"true","yes","y","1"}
 BOOL_FALSE = {"false","no","n","0"}
@@ -31,7 +37,8 @@ def normalize_number(text: str) -> Any:
     if re.search(r"(?i)\bn\s*/\s*a\b|\bn/a\b|\bna\b", t):
         return "N/A"
     # find first number-like token
-    m = re.search(r"[-+]?\d{1,3}(?:[\d,\s]\d{3})*(?:\.\d+)?|[-+]?\d+(?:\.\d+)?", t)
+    # grouped thousands ("12,345" / "12 345") first, then plain digits ("12345")
+    m = re.search(r"[-+]?\d{1,3}(?:[,\s]\d{3})+(?!\d)(?:\.\d+)?|[-+]?\d+(?:\.\d+)?", t)
     if not m:
         return "N/A"
     num = m.group(0)
@@ -144,7 +151,16 @@ def normalize_by_kind(kind: str, raw: str, question_text: str):
 
     return normalize_name(raw)
 
-def default_heuristic_answer(kind: str, retrieved: List[Retrieved]) -> Any:
+def default_heuristic_answer(kind: str, retrieved: List[Retrieved], facts: Sequence[Fact] = (), *, question: str = "") -> Any:
+    if kind == "number" and facts:
+        # best label match from the fact index (rag/facts.py), but only one whose label names the
+        # whole metric asked for; otherwise the text heuristic below decides
+        terms = metric_terms(question)
+        trusted = [f for f in facts if label_matches(f, terms)]
+        if trusted:
+            v = trusted[0].value
+            return int(v) if v.is_integer() else v
+
     if not retrieved:
         return "N/A"
 
@@ -158,9 +174,11 @@ def default_heuristic_answer(kind: str, retrieved: List[Retrieved]) -> Any:
         return False
 
     if kind == "number":
-        # ищем число в предложениях с ключевыми словами
-        joined = " ".join(texts)
-        sentences = re.split(r"[.\n]", joined)
+        # ищем число в предложениях с ключевыми словами (границы предложений посчитаны при индексации)
+        sentences = []
+        for r in retrieved[:5]:
+            spans = r.sentences if r.sentences is not None else sentence_spans(r.chunk.text)
+            sentences.extend(sentence_texts(r.chunk.text, spans))
 
         # ключевые слова из вопроса (грубая эвристика)
         # часто встречаются в числовых вопросах
@@ -200,9 +218,18 @@ def default_heuristic_answer(kind: str, retrieved: List[Retrieved]) -> Any:
 
     return "N/A"
 
-def pick_references(retrieved: List[Retrieved], max_refs: int = 2):
+def pick_references(retrieved: List[Retrieved], max_refs: int = 2, facts: Sequence[Fact] = ()):
     refs = []
     used = set()
+    # pages of facts that back the answer come first
+    for f in facts:
+        key = (f.pdf_sha1, f.page_index)
+        if key in used:
+            continue
+        used.add(key)
+        refs.append({"pdf_sha1": f.pdf_sha1, "page_index": int(f.page_index)})
+        if len(refs) >= max_refs:
+            return refs
     for r in retrieved:
         key = (r.chunk.pdf_sha1, r.chunk.page_index)
         if key in used:
@@ -210,5 +237,15 @@ def pick_references(retrieved: List[Retrieved], max_refs: int = 2):
         used.add(key)
         refs.append({"pdf_sha1": r.chunk.pdf_sha1, "page_index": int(r.chunk.page_index)})
         if len(refs) >= max_refs:
-            break
+            return refs
+    # then pages where a retrieved chunk's deduplicated copies appeared
+    for r in retrieved:
+        for page_index in r.also_in:
+            key = (r.chunk.pdf_sha1, page_index)
+            if key in used:
+                continue
+            used.add(key)
+            refs.append({"pdf_sha1": r.chunk.pdf_sha1, "page_index": int(page_index)})
+            if len(refs) >= max_refs:
+                return refs
     return refs
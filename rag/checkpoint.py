@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Dict, Optional, TYPE_CHECKING
+import dataclasses
+import hashlib
+import json
+import os
+import threading
+
+from .submission import Answer
+
+if TYPE_CHECKING:
+    from .config import Settings
+
+def question_key(text: str, kind: str) -> str:
+    # keyed by content rather than position, so an edited or reordered questions file still resumes
+    return hashlib.sha1(f"{kind}\0{text}".encode("utf-8")).hexdigest()
+
+def run_fingerprint(settings: "Settings") -> str:
+    # everything besides the question that decides an answer: a checkpoint written under other
+    # settings is not resumed
+    from .ann import AnnParams
+    from .answering import ANSWER_VERSION
+
+    model = {"openai": (settings.openai_base_url, settings.openai_model), "gemini": (settings.gemini_model,)}
+    parts = {
+        "answer_version": ANSWER_VERSION,
+        "generator": settings.generator,
+        "model": model.get(settings.generator),
+        "index": [
+            str(settings.pdf_dir), str(settings.index_dir), settings.index_shards, settings.embed_model, settings.embed_backend, settings.chunk_chars,
+            settings.chunk_overlap, settings.dedup, settings.dedup_threshold,
+        ],
+        # every ANN parameter, build- and query-time (efSearch, nprobe, quantization, rescoring): all of
+        # them can change which chunks come back
+        "ann": dataclasses.asdict(AnnParams.from_settings(settings)),
+        "retrieval": [
+            settings.retrieval_mode, settings.top_k, settings.fetch_k, settings.rrf_k, settings.bm25_k1, settings.bm25_b,
+            settings.filter_by_company, settings.fact_index, settings.fact_top_k,
+        ],
+        "rerank": [settings.rerank_model, settings.rerank_min_score] if settings.rerank else None,
+        "context": [settings.max_context_tokens, settings.context_tokenizer, settings.max_context_chars],
+    }
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+# Append-only JSONL of finished answers, flushed and fsynced as each answer completes. The first line
+# is a {"fingerprint"} header; then one {"key", "answer", "raw"} line per question, raw being the
+# LLM output before normalization (None for the heuristic generator). A run killed midway loses at
+# most the line being written; a torn last line is ignored on load. A checkpoint whose fingerprint
+# differs from the current run's is discarded, and a finished run removes its checkpoint.
+class AnswerCheckpoint:
+    def __init__(self, path: Path, *, resume: bool = True, fingerprint: str = ""):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.fingerprint = fingerprint
+        self.raw: Dict[str, Optional[str]] = {}
+        self._lock = threading.Lock()
+        if path.exists() and (not resume or self._header() != fingerprint):
+            path.unlink()
+        if not path.exists() or not path.stat().st_size:
+            with path.open("w", encoding="utf-8") as f:
+                f.write(json.dumps({"fingerprint": fingerprint}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+        else:
+            # terminate a torn last line so the next append starts on a line of its own
+            with path.open("rb+") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    f.write(b"\n")
+
+    def _header(self) -> Optional[str]:
+        with self.path.open("r", encoding="utf-8") as f:
+            try:
+                return json.loads(f.readline()).get("fingerprint")
+            except (ValueError, AttributeError):
+                return None
+
+    def load(self) -> Dict[str, Answer]:
+        done: Dict[str, Answer] = {}
+        if not self.path.exists():
+            return done
+        with self.path.open("r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                    done[row["key"]] = Answer.model_validate(row["answer"])
+                    self.raw[row["key"]] = row.get("raw")
+                except (ValueError, KeyError):
+                    continue
+        return done
+
+    def remove(self) -> None:
+        with self._lock:
+            self.path.unlink(missing_ok=True)
+
+    def append(self, key: str, answer: Answer, *, raw: Optional[str] = None) -> None:
+        line = json.dumps({"key": key, "answer": answer.model_dump(), "raw": raw}, ensure_ascii=False)
+        with self._lock:
+            with self.path.open("a", encoding="utf-8") as f:
+                f.write(line + "\n")
+                f.flush()
+                os.fsync(f.fileno())
@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Iterable, Iterator, Tuple
+import mmap
+import shutil
+import numpy as np
+
+from .chunking import Chunk
+
+# On-disk columnar chunk store, one raw little-endian file per column:
+#   ids.i64    stable chunk id (ascending; the faiss id)
+#   pdf.sha1   20-byte binary pdf_sha1
+#   page.i32   page_index
+#   chunk.i32  chunk_index within the page
+#   sent.i64   end row of the chunk's sentences in sents.i32 (start = previous end)
+#   end.i64    end offset of the chunk text in text.bin (start = previous end)
+#   text.bin   utf-8 text of all chunks, back to back
+#   sents.i32  (end offset, token count, has digit) per sentence of all chunks (rag/sentences.py)
+# Rows are append-only; removal rewrites the store through compact().
+_COLUMNS = (
+    ("ids.i64", "<i8", 8), ("pdf.sha1", "u1", 20), ("page.i32", "<i4", 4), ("chunk.i32", "<i4", 4),
+    ("sent.i64", "<i8", 8), ("end.i64", "<i8", 8),
+)
+_TEXT = "text.bin"
+_SENTS = "sents.i32"
+_SENT_BYTES = 12
+
+def _open_column(path: Path, dtype: str, width: int, n: int) -> np.ndarray:
+    shape = (n, 20) if width == 20 else (n,)
+    if n == 0:
+        return np.zeros(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+def _truncate_to_consistent(root: Path, limit: int | None = None) -> None:
+    # drop a torn tail (e.g. from a crashed build) so appends line up across columns again;
+    # `limit` also drops complete rows past the last checkpoint of an interrupted build
+    store = ChunkStore(root)
+    n = len(store) if limit is None else min(limit, len(store))
+    text_end = int(store._end[n - 1]) if n else 0
+    sents_end = int(store._sent[n - 1]) if n else 0
+    store.close()
+    for name, _, width in _COLUMNS:
+        with (root / name).open("ab") as f:
+            f.truncate(n * width)
+    with (root / _TEXT).open("ab") as f:
+        f.truncate(text_end)
+    with (root / _SENTS).open("ab") as f:
+        f.truncate(sents_end * _SENT_BYTES)
+
+class ChunkStoreWriter:
+    def __init__(self, root: Path):
+        root.mkdir(parents=True, exist_ok=True)
+        _truncate_to_consistent(root)
+        self.root = root
+        self._files = [(root / name).open("ab") for name, _, _ in _COLUMNS]
+        self._text = (root / _TEXT).open("ab")
+        self._offset = self._text.tell()
+        self._sents = (root / _SENTS).open("ab")
+        self._num_sents = self._sents.tell() // _SENT_BYTES
+
+    def append(self, chunk_id: int, chunk: Chunk, sentences: np.ndarray) -> None:
+        data = chunk.text.encode("utf-8")
+        self._text.write(data)
+        self._offset += len(data)
+        self._sents.write(np.ascontiguousarray(sentences, dtype="<i4").tobytes())
+        self._num_sents += len(sentences)
+        fid, fpdf, fpage, fchunk, fsent, fend = self._files
+        fid.write(np.int64(chunk_id).tobytes())
+        fpdf.write(bytes.fromhex(chunk.pdf_sha1))
+        fpage.write(np.int32(chunk.page_index).tobytes())
+        fchunk.write(np.int32(chunk.chunk_index).tobytes())
+        fsent.write(np.int64(self._num_sents).tobytes())
+        fend.write(np.int64(self._offset).tobytes())
+
+    def extend(self, items: Iterable[Tuple[int, Chunk, np.ndarray]]) -> None:
+        for chunk_id, chunk, sentences in items:
+            self.append(chunk_id, chunk, sentences)
+
+    def flush(self) -> None:
+        # same order as close(); rows flushed here survive a crash of the rest of the build
+        self._text.flush()
+        self._sents.flush()
+        for f in self._files:
+            f.flush()
+
+    def close(self) -> None:
+        # text and sentences first, end offsets last: a torn append is detected and dropped by ChunkStore.open
+        self._text.close()
+        self._sents.close()
+        for f in self._files:
+            f.close()
+
+    def __enter__(self) -> "ChunkStoreWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+class ChunkStore(Mapping):
+    # read-only, memory-mapped view; Chunk objects are only built for the rows that are accessed
+    def __init__(self, root: Path):
+        self.root = root
+        sizes = [(root / name).stat().st_size // width if (root / name).exists() else 0 for name, _, width in _COLUMNS]
+        n = min(sizes)
+        cols = [_open_column(root / name, dtype, width, n) for name, dtype, width in _COLUMNS]
+        self.ids, self._pdf, self._page, self._chunk, self._sent, self._end = cols
+        self._text_file = None
+        self._text: mmap.mmap | bytes = b""
+        text_path = root / _TEXT
+        if n and text_path.exists() and text_path.stat().st_size:
+            self._text_file = text_path.open("rb")
+            self._text = mmap.mmap(self._text_file.fileno(), 0, access=mmap.ACCESS_READ)
+        sents_path = root / _SENTS
+        num_sents = sents_path.stat().st_size // _SENT_BYTES if n and sents_path.exists() else 0
+        self._sents = (
+            np.memmap(sents_path, dtype="<i4", mode="r", shape=(num_sents, 3)) if num_sents else np.zeros((0, 3), dtype="<i4")
+        )
+        # rows whose text or sentences did not make it to disk are not part of the store
+        while n and (int(self._end[n - 1]) > len(self._text) or int(self._sent[n - 1]) > num_sents):
+            n -= 1
+        self._n = n
+        self.ids = self.ids[:n]
+
+    @classmethod
+    def open(cls, root: Path) -> "ChunkStore":
+        return cls(root)
+
+    def close(self) -> None:
+        if isinstance(self._text, mmap.mmap):
+            self._text.close()
+        if self._text_file is not None:
+            self._text_file.close()
+        self._text, self._text_file = b"", None
+        # the column memory maps keep descriptors of their own; a closed store is empty
+        cols = (self.ids, self._pdf, self._page, self._chunk, self._sent, self._end)
+        self.ids, self._pdf, self._page, self._chunk, self._sent, self._end = (np.array(c[:0]) for c in cols)
+        self._sents = np.array(self._sents[:0])
+        self._n = 0
+
+    def __len__(self) -> int:
+        return self._n
+
+    def __iter__(self) -> Iterator[int]:
+        for cid in self.ids:
+            yield int(cid)
+
+    def _row(self, chunk_id: int) -> int:
+        row = int(np.searchsorted(self.ids, chunk_id))
+        if row >= self._n or int(self.ids[row]) != chunk_id:
+            raise KeyError(chunk_id)
+        return row
+
+    def __contains__(self, chunk_id) -> bool:
+        try:
+            self._row(int(chunk_id))
+        except (KeyError, TypeError, ValueError):
+            return False
+        return True
+
+    def text_at(self, row: int) -> str:
+        start = int(self._end[row - 1]) if row else 0
+        return self._text[start: int(self._end[row])].decode("utf-8")
+
+    def chunk_at(self, row: int) -> Chunk:
+        return Chunk(
+            pdf_sha1=self._pdf[row].tobytes().hex(),
+            page_index=int(self._page[row]),
+            chunk_index=int(self._chunk[row]),
+            text=self.text_at(row),
+        )
+
+    def __getitem__(self, chunk_id: int) -> Chunk:
+        return self.chunk_at(self._row(int(chunk_id)))
+
+    def sentences_at(self, row: int) -> np.ndarray:
+        start = int(self._sent[row - 1]) if row else 0
+        return self._sents[start: int(self._sent[row])]
+
+    def sentences(self, chunk_id: int) -> np.ndarray:
+        return self.sentences_at(self._row(int(chunk_id)))
+
+    def truncate(self, n: int) -> "ChunkStore":
+        self.close()
+        _truncate_to_consistent(self.root, n)
+        return ChunkStore(self.root)
+
+    def iter_texts(self) -> Iterator[str]:
+        for row in range(self._n):
+            yield self.text_at(row)
+
+    def compact(self, keep: np.ndarray) -> "ChunkStore":
+        # rewrite only the rows where keep is True, then swap the directories
+        tmp = self.root.with_name(self.root.name + ".tmp")
+        if tmp.exists():
+            shutil.rmtree(tmp)
+        with ChunkStoreWriter(tmp) as w:
+            for row in np.flatnonzero(keep[: self._n]):
+                w.append(int(self.ids[row]), self.chunk_at(int(row)), self.sentences_at(int(row)))
+        self.close()
+        shutil.rmtree(self.root)
+        tmp.rename(self.root)
+        return ChunkStore(self.root)
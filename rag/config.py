@@ -14,23 +14,105 @@ class Settings:
     index_dir: Path = Path("indexes/faiss_v1")
     submissions_dir: Path = Path("submissions")
 
+    # pdf extraction (EXTRACT_WORKERS<=1 -> serial, >1 -> spawned worker processes; PAGES_PER_TASK=0 -> one task per PDF)
+    extract_workers: int = int(os.getenv("EXTRACT_WORKERS", "1"))
+    extract_pages_per_task: int = int(os.getenv("EXTRACT_PAGES_PER_TASK", "0"))
+
     # embeddings / retrieval
     embed_model: str = os.getenv("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+    # torch (sentence-transformers) | onnx | onnx-int8: the same model exported to ONNX and run on
+    # onnxruntime, optionally with int8 weights (rag/onnx_embed.py); exports live in EMBED_ONNX_DIR
+    embed_backend: str = os.getenv("EMBED_BACKEND", "torch").lower()
+    embed_onnx_dir: Path = Path(os.getenv("EMBED_ONNX_DIR", "indexes/onnx"))
     chunk_chars: int = int(os.getenv("CHUNK_CHARS", "1200"))
     chunk_overlap: int = int(os.getenv("CHUNK_OVERLAP", "150"))
+    # drop near-duplicate chunks within a report before embedding (MinHash/LSH, estimated Jaccard of
+    # word 3-shingles >= DEDUP_THRESHOLD, same figures); their pages stay citable as aliases (rag/dedup.py)
+    dedup: bool = os.getenv("DEDUP", "false").lower() in {"1","true","yes"}
+    dedup_threshold: float = float(os.getenv("DEDUP_THRESHOLD", "0.8"))
+    # content-addressed embedding cache shared by all index dirs (EMBED_CACHE=false disables)
+    embed_cache: bool = os.getenv("EMBED_CACHE", "true").lower() in {"1","true","yes"}
+    embed_cache_dir: Path = Path(os.getenv("EMBED_CACHE_DIR", "indexes/embed_cache"))
+    embed_cache_dtype: str = os.getenv("EMBED_CACHE_DTYPE", "float32")  # float32 | float16
+    # compressed per-PDF page text (rag/page_cache.py); gzip | zstd (needs the zstandard package)
+    page_cache: bool = os.getenv("PAGE_CACHE", "true").lower() in {"1","true","yes"}
+    page_cache_dir: Path = Path(os.getenv("PAGE_CACHE_DIR", "indexes/page_cache"))
+    page_cache_codec: str = os.getenv("PAGE_CACHE_CODEC", "gzip").lower()
+    # streaming index build (rag/ingest.py): at most INDEX_QUEUE_SIZE PDFs wait between pipeline stages,
+    # small PDFs are pooled into encode calls of INDEX_ENCODE_BATCH chunks, and progress is checkpointed
+    # every INDEX_CHECKPOINT_S seconds so an interrupted build resumes from there
+    index_queue_size: int = int(os.getenv("INDEX_QUEUE_SIZE", "4"))
+    index_encode_batch: int = int(os.getenv("INDEX_ENCODE_BATCH", "256"))
+    index_checkpoint_s: float = float(os.getenv("INDEX_CHECKPOINT_S", "300"))
+    # INDEX_SHARDS > 1 splits the index by PDF into shards under <INDEX_DIR>/shards (rag/shards.py); dense
+    # search fans out to one SHARD_WORKERS worker per shard: process | local | module:factory
+    index_shards: int = int(os.getenv("INDEX_SHARDS", "1"))
+    shard_workers: str = os.getenv("SHARD_WORKERS", "process")
+    # ann index: flat | hnsw | ivf | ivfpq (see rag/ann.py; python -m rag.ann reports recall@k)
+    index_type: str = os.getenv("INDEX_TYPE", "flat").lower()
+    hnsw_m: int = int(os.getenv("HNSW_M", "32"))
+    hnsw_ef_construction: int = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+    hnsw_ef_search: int = int(os.getenv("HNSW_EF_SEARCH", "64"))
+    ivf_nlist: int = int(os.getenv("IVF_NLIST", "1024"))
+    ivf_nprobe: int = int(os.getenv("IVF_NPROBE", "16"))
+    ivf_train_sample: int = int(os.getenv("IVF_TRAIN_SAMPLE", "100000"))
+    pq_m: int = int(os.getenv("PQ_M", "16"))
+    pq_nbits: int = int(os.getenv("PQ_NBITS", "8"))
+    # vector storage inside the index: none (float32) | fp16 | int8 (scalar quantizer) | binary (sign bits);
+    # lossy storage (and ivfpq) fetches RESCORE_FACTOR * k candidates and rescores them with exact
+    # float32 vectors memory-mapped from <INDEX_DIR>/vectors
+    quantization: str = os.getenv("QUANTIZATION", "none").lower()
+    rescore: bool = os.getenv("RESCORE", "true").lower() in {"1","true","yes"}
+    rescore_factor: int = int(os.getenv("RESCORE_FACTOR", "4"))
     top_k: int = int(os.getenv("TOP_K", "8"))
     fetch_k: int = int(os.getenv("FETCH_K", "25"))
+    query_batch_size: int = int(os.getenv("QUERY_BATCH_SIZE", "64"))
+
+    # dense | hybrid (dense + BM25 fused with reciprocal rank fusion)
+    retrieval_mode: str = os.getenv("RETRIEVAL_MODE", "dense").lower()
+    bm25_k1: float = float(os.getenv("BM25_K1", "1.2"))
+    bm25_b: float = float(os.getenv("BM25_B", "0.75"))
+    rrf_k: int = int(os.getenv("RRF_K", "60"))
+    # restrict search to the report(s) of the company named in the question (rag/metadata.py)
+    filter_by_company: bool = os.getenv("FILTER_BY_COMPANY", "false").lower() in {"1","true","yes"}
+    # numeric facts (label, value, unit, currency, period) extracted at indexing time (rag/facts.py)
+    fact_index: bool = os.getenv("FACT_INDEX", "true").lower() in {"1","true","yes"}
+    fact_top_k: int = int(os.getenv("FACT_TOP_K", "8"))
 
     # rerank (optional)
     rerank: bool = os.getenv("RERANK", "false").lower() in {"1","true","yes"}
     rerank_model: str = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+    rerank_batch_size: int = int(os.getenv("RERANK_BATCH_SIZE", "64"))
+    rerank_cache: bool = os.getenv("RERANK_CACHE", "true").lower() in {"1","true","yes"}
+    rerank_cache_path: Path = Path(os.getenv("RERANK_CACHE_PATH", "indexes/rerank_cache.sqlite"))
+    # only candidates whose dense cosine similarity is >= this go through the cross-encoder (unset = all);
+    # always on the cosine scale, in hybrid mode too (not the ~0.016 RRF scale); BM25-only hits are kept
+    rerank_min_score: float | None = float(os.environ["RERANK_MIN_SCORE"]) if os.getenv("RERANK_MIN_SCORE") else None
 
     # generator
     generator: str = os.getenv("GENERATOR", "heuristic")  # gemini | openai | heuristic
+    llm_concurrency: int = int(os.getenv("LLM_CONCURRENCY", "4"))
+    llm_rate_per_sec: float = float(os.getenv("LLM_RATE_PER_SEC", "0"))  # 0 = no rate limit
+    llm_max_retries: int = int(os.getenv("LLM_MAX_RETRIES", "4"))
+    llm_backoff: float = float(os.getenv("LLM_BACKOFF", "1.0"))  # seconds, doubled per retry
+    llm_pool_size: int = int(os.getenv("LLM_POOL_SIZE", "10"))  # keep-alive connections per host
+    llm_connect_timeout: float = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+    llm_read_timeout: float = float(os.getenv("LLM_READ_TIMEOUT", "120"))
+    # response cache: use | refresh (re-ask, overwrite) | off
+    llm_cache: str = os.getenv("LLM_CACHE", "use").lower()
+    llm_cache_path: Path = Path(os.getenv("LLM_CACHE_PATH", "indexes/llm_cache.sqlite"))
+    llm_cache_max_mb: int = int(os.getenv("LLM_CACHE_MAX_MB", "512"))
 
     # submission identity
     team_email: str = os.getenv("TEAM_EMAIL", "test@rag-tat.com")
     submission_name: str = os.getenv("SUBMISSION_NAME", "surname_v0")
+    # answers are checkpointed to submissions/submission_<name>.checkpoint.jsonl until the submission is
+    # written; a rerun after an interruption resumes unless the settings changed. RESUME=false starts over
+    resume: bool = os.getenv("RESUME", "true").lower() in {"1","true","yes"}
+    # per-stage timings, counters and per-question traces -> submissions/metrics_<name>.json (rag/metrics.py)
+    metrics: bool = os.getenv("METRICS", "true").lower() in {"1","true","yes"}
+    # whole-run profiler: "" (off) | cprofile | pyinstrument -> submissions/profile_<name>.prof / .html
+    profile: str = os.getenv("PROFILE", "").lower()
 
     # OpenAI-compatible
     openai_api_key: str | None = os.getenv("OPENAI_API_KEY")
@@ -42,4 +124,11 @@ class Settings:
     gemini_model: str = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
 
     # behavior
-    max_context_chars: int = int(os.getenv("MAX_CONTEXT_CHARS", "12000"))
+    # prompt context budget in tokens, filled with the retrieved sentences that best match the question
+    # (rag/context.py); counted with CONTEXT_TOKENIZER: regex (approximate, no dependencies) or a
+    # tiktoken model / encoding name. Unset = the OpenAI model's encoding if tiktoken is installed, else regex.
+    # Changing it does not rebuild the index: the context builder counts retrieved sentences itself
+    max_context_tokens: int = int(os.getenv("MAX_CONTEXT_TOKENS", "3000"))
+    context_tokenizer: str = os.getenv("CONTEXT_TOKENIZER", "")
+    # legacy character cap on the prompt context, applied on top of MAX_CONTEXT_TOKENS; unset = none
+    max_context_chars: int | None = int(os.environ["MAX_CONTEXT_CHARS"]) if os.getenv("MAX_CONTEXT_CHARS") else None
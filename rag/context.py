@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+from bisect import bisect_right
+from typing import Dict, List, Sequence, Tuple
+import numpy as np
+
+from .lexical import tokenize
+from .retrieval import Retrieved
+from .sentences import sentence_spans
+
+# Prompt context assembled sentence by sentence under a token budget. Sentence boundaries and regex
+# token counts come precomputed from the index (Retrieved.sentences), so per question the only text
+# work is a str.find per question term and retrieved chunk; another tokenizer (tiktoken) counts the
+# sentences of the retrieved chunks here. Sentences are ranked by the number
+# of distinct question terms they contain (plus a bonus for figures on number questions, and the
+# chunk's retrieval rank as tie-break) and taken greedily while they fit; the chosen sentences are
+# printed under their chunk's header, in retrieval order and in their original order within a chunk.
+_NUMBER_BONUS = 0.5
+_GAP = " ... "
+
+def _header(r: Retrieved) -> str:
+    return f"[pdf_sha1={r.chunk.pdf_sha1} page_index={r.chunk.page_index}]\n"
+
+def _render(retrieved: Sequence[Retrieved], spans: Sequence[np.ndarray], chosen: Dict[int, List[int]], figures: Sequence[str]) -> str:
+    parts = []
+    if figures:
+        parts.append("Extracted figures:\n" + "\n".join(figures) + "\n")
+    for ci, r in enumerate(retrieved):
+        rows = sorted(chosen.get(ci, ()))
+        if not rows:
+            continue
+        ends = spans[ci][:, 0].tolist()
+        pieces = []
+        prev = None
+        for s in rows:
+            text = r.chunk.text[ends[s - 1] if s else 0:ends[s]].strip()
+            # neighbouring sentences are printed as one run of the original text
+            if prev is not None and s == prev + 1:
+                pieces[-1] = pieces[-1] + " " + text
+            else:
+                pieces.append(text)
+            prev = s
+        parts.append(_header(r) + _GAP.join(pieces) + "\n")
+    return "\n".join(parts)
+
+def build_context(
+    retrieved: Sequence[Retrieved],
+    *,
+    query: str,
+    tokenizer,
+    max_tokens: int,
+    figures: Sequence[str] = (),
+    numbers: bool = False,
+    max_chars: int | None = None,
+) -> str:
+    terms = sorted(set(tokenize(query)))
+
+    spans: List[np.ndarray] = []
+    tokens: List[List[int]] = []
+    # (-score, chunk rank, sentence) for every sentence of every retrieved chunk
+    ranked: List[Tuple[float, int, int]] = []
+    for ci, r in enumerate(retrieved):
+        sp = r.sentences if r.sentences is not None else sentence_spans(r.chunk.text)
+        spans.append(sp)
+        if tokenizer.name == "regex":
+            tokens.append(sp[:, 1].tolist())
+        else:
+            ends = sp[:, 0].tolist()
+            tokens.append(tokenizer.count_many([r.chunk.text[s:e] for s, e in zip([0] + ends[:-1], ends)]))
+        score = (_NUMBER_BONUS * sp[:, 2]).tolist() if numbers else [0.0] * len(sp)
+        if terms and len(sp):
+            ends = sp[:, 0].tolist()
+            last = len(ends) - 1
+            text = r.chunk.text.lower()
+            # str.find per term is much cheaper than one regex alternation over the text
+            for term in terms:
+                seen = set()
+                i = text.find(term)
+                while i >= 0:
+                    j = i + len(term)
+                    if (i == 0 or not text[i - 1].isalnum()) and (j == len(text) or not text[j].isalnum()):
+                        seen.add(min(bisect_right(ends, i), last))
+                    i = text.find(term, j)
+                for s in seen:
+                    score[s] += 1.0
+        ranked.extend((-score[s], ci, s) for s in range(len(sp)))
+    ranked.sort()
+
+    gap = tokenizer.count(_GAP)
+
+    # figures from the fact index go first, as many lines as fit
+    used = 0
+    kept_figures: List[str] = []
+    if figures:
+        used = tokenizer.count("Extracted figures:\n") + 1
+        for line in figures:
+            cost = tokenizer.count(line) + 1
+            if used + cost > max_tokens:
+                break
+            kept_figures.append(line)
+            used += cost
+        if not kept_figures:
+            used = 0
+
+    chosen: Dict[int, List[int]] = {}
+    order: List[Tuple[int, int]] = []
+    header_cost: Dict[int, int] = {}
+    for _, ci, s in ranked:
+        rows = chosen.get(ci)
+        if rows is None:
+            # a chunk's header (and the blank line before it) is paid for by its first chosen sentence
+            if ci not in header_cost:
+                header_cost[ci] = tokenizer.count(_header(retrieved[ci])) + 2
+            extra = header_cost[ci]
+        else:
+            # next to a chosen sentence it extends that run; otherwise it costs a gap marker (a later
+            # sentence that closes the gap is still charged, so the total only errs on the safe side)
+            extra = 0 if (s - 1 in rows or s + 1 in rows) else gap
+        cost = tokens[ci][s] + extra
+        if used + cost > max_tokens:
+            continue
+        chosen.setdefault(ci, []).append(s)
+        order.append((ci, s))
+        used += cost
+
+    def fits(context: str) -> bool:
+        # BPE counts are additive only up to merges across boundaries, so those are checked on the real
+        # prompt text; MAX_CONTEXT_CHARS (legacy) caps the characters on top of the token budget
+        if not tokenizer.additive and tokenizer.count(context) > max_tokens:
+            return False
+        return max_chars is None or len(context) <= max_chars
+
+    # drop the weakest sentences until it fits
+    context = _render(retrieved, spans, chosen, kept_figures)
+    while order and not fits(context):
+        ci, s = order.pop()
+        chosen[ci].remove(s)
+        if not chosen[ci]:
+            del chosen[ci]
+        context = _render(retrieved, spans, chosen, kept_figures)
+    return context if max_chars is None else context[:max_chars]
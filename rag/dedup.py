@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Dict, Iterable, List, Sequence, Tuple
+import re
+import zlib
+import numpy as np
+
+# Near-duplicate chunks (headers, footers, disclaimers, tables repeated on many pages of a report)
+# are found with MinHash over word shingles and LSH banding, and only the first copy is embedded.
+# The pages of the dropped copies are kept as aliases of that canonical chunk, so references can
+# still point at them. Chunks whose figures differ (the same table for another year or segment) are
+# never merged, however similar their words are.
+
+# bump when the duplicate rule changes, so deduplicated indexes are rebuilt
+DEDUP_VERSION = 2
+
+_PRIME = (1 << 31) - 1
+_WORD = re.compile(r"\w+", re.UNICODE)
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)*")
+
+def _numbers(text: str) -> Tuple[str, ...]:
+    return tuple(_NUMBER.findall(text))
+
+def _shingle_hashes(text: str, size: int) -> np.ndarray:
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        grams = [" ".join(words)]
+    else:
+        grams = [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+    # crc32 rather than hash(): stable across processes and PYTHONHASHSEED
+    return np.unique(np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype="int64", count=len(grams)))
+
+def minhash_signatures(texts: Sequence[str], *, num_perm: int = 64, shingle: int = 3, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, _PRIME, size=num_perm, dtype="int64")
+    b = rng.integers(0, _PRIME, size=num_perm, dtype="int64")
+    out = np.empty((len(texts), num_perm), dtype="int64")
+    for i, text in enumerate(texts):
+        h = _shingle_hashes(text, shingle) % _PRIME
+        # (a*h + b) mod p stays below 2**62, no int64 overflow
+        out[i] = ((h[:, None] * a[None, :] + b[None, :]) % _PRIME).min(axis=0)
+    return out
+
+def near_duplicates(
+    texts: Sequence[str],
+    *,
+    threshold: float = 0.8,
+    num_perm: int = 64,
+    bands: int = 16,
+    shingle: int = 3,
+) -> np.ndarray:
+    # canonical[i] is the index of the first text that i near-duplicates (estimated Jaccard >= threshold
+    # and the same numbers in the same order), else i
+    n = len(texts)
+    canonical = np.arange(n, dtype="int64")
+    if n < 2:
+        return canonical
+    sig = minhash_signatures(texts, num_perm=num_perm, shingle=shingle)
+    numbers = [_numbers(t) for t in texts]
+    rows = num_perm // bands
+    # bucket key per band; texts sharing any bucket are candidates, confirmed on the full signature
+    buckets: Dict[Tuple[int, bytes], List[int]] = {}
+    for i in range(n):
+        if canonical[i] != i:
+            continue
+        match = -1
+        keys = [(band, sig[i, band * rows:(band + 1) * rows].tobytes()) for band in range(bands)]
+        for key in keys:
+            for j in buckets.get(key, ()):
+                if numbers[i] == numbers[j] and np.mean(sig[i] == sig[j]) >= threshold:
+                    match = j
+                    break
+            if match >= 0:
+                break
+        if match >= 0:
+            canonical[i] = match
+            continue
+        # only canonical texts enter the buckets, so every match is already a root
+        for key in keys:
+            buckets.setdefault(key, []).append(i)
+    return canonical
+
+class ChunkAliases:
+    # extra pages of the canonical chunks: row r says chunk canonical[r] also appears on page[r] of its PDF
+    def __init__(self, path: Path):
+        self.path = path
+        if path.exists():
+            with np.load(path) as data:
+                self.canonical, self.page = data["canonical"], data["page"]
+        else:
+            self.canonical, self.page = np.zeros(0, dtype="int64"), np.zeros(0, dtype="int32")
+        self._sort()
+
+    def _sort(self) -> None:
+        order = np.argsort(self.canonical, kind="stable")
+        self.canonical, self.page = self.canonical[order], self.page[order]
+
+    def __len__(self) -> int:
+        return len(self.canonical)
+
+    def pages_of(self, chunk_id: int) -> Tuple[int, ...]:
+        lo, hi = np.searchsorted(self.canonical, [chunk_id, chunk_id + 1])
+        return tuple(int(p) for p in self.page[lo:hi])
+
+    def keep_ids_below(self, next_id: int) -> None:
+        # rows written by a build that crashed before its manifest was saved
+        keep = self.canonical < next_id
+        self.canonical, self.page = self.canonical[keep], self.page[keep]
+
+    def remove_range(self, lo: int, hi: int) -> None:
+        keep = (self.canonical < lo) | (self.canonical >= hi)
+        self.canonical, self.page = self.canonical[keep], self.page[keep]
+
+    def extend(self, rows: Iterable[Tuple[int, int]]) -> None:
+        rows = list(rows)
+        if not rows:
+            return
+        arr = np.asarray(rows, dtype="int64")
+        self.canonical = np.concatenate([self.canonical, arr[:, 0]])
+        self.page = np.concatenate([self.page, arr[:, 1].astype("int32")])
+        self._sort()
+
+    def save(self) -> None:
+        tmp = self.path.with_name(self.path.name + ".tmp.npz")
+        np.savez(tmp, canonical=self.canonical, page=self.page)
+        tmp.replace(self.path)
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Callable, Dict, List, Sequence
+import hashlib
+import json
+import re
+import numpy as np
+
+KEY_BYTES = 20  # sha1 digest of the chunk text
+
+def text_key(text: str) -> bytes:
+    return hashlib.sha1(text.encode("utf-8")).digest()
+
+# Content-addressed store of normalized embeddings for one embed model, shared by all index dirs.
+# <root>/<model>/vectors.bin is a raw row-major matrix read through np.memmap, keys.bin holds one
+# sha1 digest per row in the same order, meta.json records model/dim/dtype. Rows are append-only.
+class EmbeddingCache:
+    def __init__(self, root: Path, embed_model: str, *, dtype: str = "float32"):
+        slug = re.sub(r"[^A-Za-z0-9._-]+", "_", embed_model).strip("_")
+        self.dir = root / f"{slug}-{hashlib.sha1(embed_model.encode('utf-8')).hexdigest()[:8]}"
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.embed_model = embed_model
+        self._vec_path = self.dir / "vectors.bin"
+        self._key_path = self.dir / "keys.bin"
+        self._meta_path = self.dir / "meta.json"
+
+        self.dim: int | None = None
+        self.dtype = np.dtype(dtype)
+        if self._meta_path.exists():
+            meta = json.loads(self._meta_path.read_text(encoding="utf-8"))
+            self.dim = int(meta["dim"])
+            # the on-disk dtype wins; mixing precisions in one file is not possible
+            self.dtype = np.dtype(meta["dtype"])
+
+        self._rows: Dict[bytes, int] = {}
+        self._vectors: np.ndarray | None = None
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _load(self) -> None:
+        if self.dim is None or not self._key_path.exists() or not self._vec_path.exists():
+            return
+        row_bytes = self.dim * self.dtype.itemsize
+        n = min(self._key_path.stat().st_size // KEY_BYTES, self._vec_path.stat().st_size // row_bytes)
+        # drop a torn tail left by an interrupted append
+        with self._key_path.open("r+b") as f:
+            f.truncate(n * KEY_BYTES)
+        with self._vec_path.open("r+b") as f:
+            f.truncate(n * row_bytes)
+        keys = self._key_path.read_bytes()
+        self._rows = {keys[i * KEY_BYTES:(i + 1) * KEY_BYTES]: i for i in range(n)}
+        self._vectors = np.memmap(self._vec_path, dtype=self.dtype, mode="r", shape=(n, self.dim)) if n else None
+
+    def _append(self, keys: List[bytes], emb: np.ndarray) -> None:
+        if self.dim is None:
+            self.dim = int(emb.shape[1])
+            meta = {"embed_model": self.embed_model, "dim": self.dim, "dtype": self.dtype.name, "normalized": True}
+            self._meta_path.write_text(json.dumps(meta, indent=2), encoding="utf-8")
+        # vectors first: keys without vectors would be truncated away on the next load anyway
+        with self._vec_path.open("ab") as f:
+            f.write(np.ascontiguousarray(emb, dtype=self.dtype).tobytes())
+        with self._key_path.open("ab") as f:
+            f.write(b"".join(keys))
+        # extend the in-memory key map and remap; re-reading keys.bin would make every append O(cache size)
+        start = len(self._rows)
+        for i, k in enumerate(keys):
+            self._rows[k] = start + i
+        self._vectors = np.memmap(self._vec_path, dtype=self.dtype, mode="r", shape=(len(self._rows), self.dim))
+
+    def get_or_compute(self, texts: Sequence[str], encode: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        keys = [text_key(t) for t in texts]
+
+        miss_keys: List[bytes] = []
+        miss_texts: List[str] = []
+        seen = set()
+        for k, t in zip(keys, texts):
+            if k in self._rows or k in seen:
+                continue
+            seen.add(k)
+            miss_keys.append(k)
+            miss_texts.append(t)
+
+        if miss_texts:
+            self._append(miss_keys, np.asarray(encode(miss_texts), dtype="float32"))
+
+        if not keys:
+            return np.zeros((0, self.dim or 0), dtype="float32")
+        rows = np.fromiter((self._rows[k] for k in keys), dtype="int64", count=len(keys))
+        return np.asarray(self._vectors[rows], dtype="float32")
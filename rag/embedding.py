@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Dict, Tuple, TYPE_CHECKING
+import threading
+
+if TYPE_CHECKING:
+    from sentence_transformers import CrossEncoder, SentenceTransformer
+
+# sentence-transformers (and torch behind it) take seconds to import, so it is only imported here,
+# on first use. Models are memoised per name: build_or_load_index, main and the server all get the
+# same instance instead of loading the weights twice.
+_lock = threading.Lock()
+_models: Dict[Tuple[str, str], object] = {}
+
+def _load(kind: str, name: str):
+    key = (kind, name)
+    with _lock:
+        model = _models.get(key)
+        if model is None:
+            import sentence_transformers
+
+            model = getattr(sentence_transformers, kind)(name)
+            _models[key] = model
+        return model
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+def load_embedder(name: str, *, backend: str = "torch", onnx_dir: Path = Path("indexes/onnx")) -> "SentenceTransformer":
+    # onnx / onnx-int8 return an OnnxEmbedder (rag/onnx_embed.py) with the same encode() interface
+    if backend == "torch":
+        return _load("SentenceTransformer", name)
+    if backend not in BACKENDS:
+        raise ValueError(f"EMBED_BACKEND must be one of {', '.join(BACKENDS)}, got {backend!r}")
+    key = (backend, name)
+    with _lock:
+        model = _models.get(key)
+        if model is None:
+            from .onnx_embed import load_onnx_embedder
+
+            model = load_onnx_embedder(name, onnx_dir, backend=backend)
+            _models[key] = model
+        return model
+
+def embedder_from_settings(settings) -> "SentenceTransformer":
+    return load_embedder(settings.embed_model, backend=settings.embed_backend, onnx_dir=settings.embed_onnx_dir)
+
+def embed_model_id(name: str, backend: str) -> str:
+    # identity of the vectors a model produces, for the embedding cache: ONNX (and above all int8)
+    # vectors are close to the torch ones but not equal, so they are cached separately
+    return name if backend == "torch" else f"{name}@{backend}"
+
+def load_reranker(name: str) -> "CrossEncoder":
+    return _load("CrossEncoder", name)
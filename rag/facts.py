@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AbstractSet, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+import io
+import json
+import re
+import numpy as np
+
+from .lexical import BM25Index, STOPWORDS, tokenize
+
+# bump when extraction rules change so existing indexes are rebuilt
+FACTS_VERSION = 1
+
+UNITS = ("", "%", "thousand", "million", "billion")
+CURRENCIES = ("", "USD", "EUR", "GBP", "CHF", "JPY", "CNY", "RUB", "CAD", "AUD", "INR")
+
+_CUR_ALIASES = {"$": "USD", "US$": "USD", "€": "EUR", "£": "GBP", "¥": "JPY", "₽": "RUB"}
+_UNIT_ALIASES = {
+    "%": "%", "percent": "%", "per cent": "%",
+    "thousand": "thousand", "k": "thousand",
+    "million": "million", "mln": "million", "mn": "million", "m": "million",
+    "billion": "billion", "bn": "billion", "b": "billion",
+}
+_CUR = r"US\$|\$|€|£|¥|₽|" + "|".join(c for c in CURRENCIES if c)
+_FACT = re.compile(
+    rf"(?:(?P<cur>{_CUR})\s?)?"
+    r"(?<![\w.,])(?P<num>\(?-?\d{1,3}(?:,\d{3})+(?:\.\d+)?\)?|\(?-?\d+(?:\.\d+)?\)?)"
+    r"(?:\s?(?P<unit>%|percent|per cent|thousand|million|billion|mln|bn|mn|m|k|b)(?!\w))?"
+    rf"(?:\s?(?P<cur2>{'|'.join(c for c in CURRENCIES if c)})(?!\w))?"
+)
+_YEAR = re.compile(r"\b(19[89]\d|20[0-4]\d)\b")
+_LABEL_WORD = re.compile(r"[A-Za-z][A-Za-z&'\-/]*")
+# a label is the run of words right before the number, within the same clause; year column
+# headers ("Revenue 2023 2022 5,432") do not break it, other numbers do
+_CLAUSE_BREAK = re.compile(r"[.;:!?]\s|(?<![\w.,])(?!(?:19[89]\d|20[0-4]\d)\b)\d[\d,.]*")
+_GLUE = STOPWORDS | {"amounted", "totaled", "totalled", "reached", "stood", "approximately", "about", "over", "up", "down", "by"}
+# question words that name no metric: 'What was the total revenue of "Acme" in 2022?' -> {total, revenue}
+_QUESTION_WORDS = frozenset("according amount annual company figure fiscal how many much period report reported value year".split())
+_SCALE_WORDS = {"thousand", "million", "billion", "mln", "bn", "mn", "m", "k", "b", "percent", "per", "cent"}
+
+@dataclass(frozen=True)
+class Fact:
+    pdf_sha1: str
+    page_index: int
+    label: str
+    value: float
+    unit: str
+    currency: str
+    period: Optional[int]
+
+    def describe(self) -> str:
+        value = f"{int(self.value):,}" if self.value.is_integer() else f"{self.value:,}"
+        parts = [f"{self.label}: {value}"]
+        if self.unit:
+            parts.append(self.unit)
+        if self.currency:
+            parts.append(self.currency)
+        if self.period:
+            parts.append(f"({self.period})")
+        return " ".join(parts) + f" [pdf_sha1={self.pdf_sha1} page_index={self.page_index}]"
+
+def _label_before(text: str, start: int) -> str:
+    window = text[max(0, start - 120):start]
+    cut = 0
+    for m in _CLAUSE_BREAK.finditer(window):
+        cut = m.end()
+    words = _LABEL_WORD.findall(window[cut:])[-8:]
+    # trim leading/trailing glue words ("the total revenue was" -> "total revenue") and the
+    # scale/currency of a previous figure ("million, up 12%")
+    while words and (words[0].lower() in _GLUE | _SCALE_WORDS or words[0] in CURRENCIES):
+        words.pop(0)
+    while words and words[-1].lower() in _GLUE:
+        words.pop()
+    return " ".join(words)
+
+def extract_facts(pdf_sha1: str, page_index: int, text: str, *, default_year: Optional[int] = None) -> List[Fact]:
+    facts: List[Fact] = []
+    for m in _FACT.finditer(text):
+        raw = m.group("num")
+        negative = raw.startswith("(") and raw.endswith(")")
+        digits = raw.strip("()").replace(",", "")
+        try:
+            value = float(digits)
+        except ValueError:
+            continue
+        if negative:
+            value = -value
+
+        cur = m.group("cur") or m.group("cur2") or ""
+        currency = _CUR_ALIASES.get(cur, cur)
+        unit = _UNIT_ALIASES.get((m.group("unit") or "").lower(), "")
+        # bare years and tiny bare integers (notes, page refs) are not facts
+        if not currency and not unit and ("." not in digits and (_YEAR.fullmatch(digits) or abs(value) < 10)):
+            continue
+
+        label = _label_before(text, m.start())
+        if len(label) < 3 or not any(len(w) > 2 for w in label.split()):
+            continue
+
+        # the closest year mention within the sentence neighbourhood is the period
+        lo = max(0, m.start() - 80)
+        nearby = [(abs(y.start() + lo - m.start()), int(y.group(1))) for y in _YEAR.finditer(text[lo: m.end() + 40])]
+        period = min(nearby)[1] if nearby else default_year
+        facts.append(Fact(pdf_sha1, page_index, label, value, unit, currency, period))
+    return facts
+
+def write_pdf_facts(path: Path, facts: Sequence[Fact], *, default_year: Optional[int] = None) -> None:
+    # facts without a nearby year are attributed to the report year
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp.npz")
+    np.savez(
+        tmp,
+        page=np.asarray([f.page_index for f in facts], dtype="int32"),
+        value=np.asarray([f.value for f in facts], dtype="float64"),
+        unit=np.asarray([UNITS.index(f.unit) for f in facts], dtype="int8"),
+        currency=np.asarray([CURRENCIES.index(f.currency) for f in facts], dtype="int8"),
+        period=np.asarray([f.period or default_year or 0 for f in facts], dtype="int16"),
+        label=np.asarray([f.label for f in facts], dtype=str),
+    )
+    tmp.replace(path)
+
+# Corpus-wide fact table under <index_dir>/facts/:
+#   pdfs/<sha1>.npz   facts of one PDF, written when the PDF is indexed, deleted when it is removed
+#   pdf.sha1, page.npy, value.npy, unit.npy, currency.npy, period.npy   concatenated columns
+#   labels.txt        one label per row; labels_bm25/ is a BM25 index over them (ids = row numbers)
+#   ranges.json       pdf_sha1 -> [first_row, end_row)
+# Columns are opened with mmap; lookups go through the label index, never through page text.
+class FactTable:
+    def __init__(self, root: Path):
+        self.root = root
+        self.ranges: Dict[str, Tuple[int, int]] = {k: tuple(v) for k, v in json.loads((root / "ranges.json").read_text(encoding="utf-8")).items()}
+        n = sum(hi - lo for lo, hi in self.ranges.values())
+        load = lambda name: np.load(root / name, mmap_mode="r")
+        self._pdf = np.memmap(root / "pdf.sha1", dtype="u1", mode="r", shape=(n, 20)) if n else np.zeros((0, 20), dtype="u1")
+        self.page = load("page.npy")
+        self.value = load("value.npy")
+        self.unit = load("unit.npy")
+        self.currency = load("currency.npy")
+        self.period = load("period.npy")
+        self.labels = (root / "labels.txt").read_text(encoding="utf-8").split("\n")[:n]
+        self.label_index = BM25Index(root / "labels_bm25")
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    @classmethod
+    def build(cls, root: Path, pdf_sha1s: Iterable[str]) -> "FactTable":
+        cols: Dict[str, List[np.ndarray]] = {k: [] for k in ("page", "value", "unit", "currency", "period", "label")}
+        pdf_col: List[bytes] = []
+        ranges: Dict[str, Tuple[int, int]] = {}
+        row = 0
+        for sha in pdf_sha1s:
+            path = root / "pdfs" / f"{sha}.npz"
+            if not path.exists():
+                continue
+            with np.load(path) as data:
+                n = len(data["page"])
+                for k in cols:
+                    cols[k].append(data[k])
+            pdf_col.append(bytes.fromhex(sha) * n)
+            ranges[sha] = (row, row + n)
+            row += n
+
+        # every file is written under a temp name and renamed over the old one, so a table that is
+        # still open (e.g. by the server while it reloads) keeps reading its own mmapped columns
+        def put(name: str, data: bytes) -> None:
+            tmp = root / (name + ".tmp")
+            tmp.write_bytes(data)
+            tmp.replace(root / name)
+
+        cat = lambda k, dtype: np.concatenate(cols[k]).astype(dtype) if cols[k] else np.zeros(0, dtype=dtype)
+        for k, dtype in (("page", "int32"), ("value", "float64"), ("unit", "int8"), ("currency", "int8"), ("period", "int16")):
+            buf = io.BytesIO()
+            np.save(buf, cat(k, dtype))
+            put(f"{k}.npy", buf.getvalue())
+        put("pdf.sha1", b"".join(pdf_col))
+        labels = [str(x) for part in cols["label"] for x in part]
+        put("labels.txt", "\n".join(labels).encode("utf-8"))
+        BM25Index.build(root / "labels_bm25", np.arange(len(labels), dtype="int64"), labels)
+        put("ranges.json", json.dumps(ranges).encode("utf-8"))
+        return cls(root)
+
+    @staticmethod
+    def remove_pdf(root: Path, pdf_sha1: str) -> None:
+        (root / "pdfs" / f"{pdf_sha1}.npz").unlink(missing_ok=True)
+
+    def fact_at(self, row: int) -> Fact:
+        period = int(self.period[row])
+        return Fact(
+            pdf_sha1=self._pdf[row].tobytes().hex(),
+            page_index=int(self.page[row]),
+            label=self.labels[row],
+            value=float(self.value[row]),
+            unit=UNITS[int(self.unit[row])],
+            currency=CURRENCIES[int(self.currency[row])],
+            period=period or None,
+        )
+
+    def lookup(
+        self,
+        question: str,
+        *,
+        pdf_sha1s: Optional[Sequence[str]] = None,
+        year: Optional[int] = None,
+        top_k: int = 10,
+    ) -> List[Fact]:
+        ranges = [self.ranges[s] for s in pdf_sha1s or () if s in self.ranges] or None
+        if pdf_sha1s and not ranges:
+            return []
+        hits = self.label_index.search(question, top_k * 4, id_ranges=ranges)
+        if year is not None and hits:
+            # among reasonably matching labels, facts for the asked period come first
+            best = hits[0][1]
+            hits = [h for h in hits if h[1] >= 0.5 * best]
+            hits.sort(key=lambda h: (int(self.period[h[0]]) != year, -h[1]))
+        return [self.fact_at(row) for row, _ in hits[:top_k]]
+
+def question_year(question: str) -> Optional[int]:
+    years = _YEAR.findall(question)
+    return int(years[-1]) if years else None
+
+def metric_terms(question: str) -> Set[str]:
+    # the quoted company name and the year select the report and period, they are not part of the metric
+    text = re.sub(r"[\"“”][^\"“”]*[\"“”]", " ", question)
+    return {t for t in tokenize(text) if not t.isdigit() and t not in _QUESTION_WORDS}
+
+def label_matches(fact: Fact, terms: AbstractSet[str]) -> bool:
+    # every metric term of the question appears in the label; one shared word ("total") is not a match
+    return bool(terms) and terms <= set(tokenize(fact.label))
@@ -1,93 +1,548 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import List, Tuple
+from typing import Any, Dict, List, Optional, Sequence, Tuple, TYPE_CHECKING
 import json
+import shutil
+import time
 import numpy as np
-from tqdm import tqdm
 
-import faiss
-from sentence_transformers import SentenceTransformer
+from .config import Settings
+from .pdf import iter_pages, list_pdfs, pdf_sha1_for
+from .embed_cache import EmbeddingCache
+from .chunk_store import ChunkStore, ChunkStoreWriter
+from .lexical import BM25Index
+from .ann import (
+    AnnParams, add_vectors, apply_search_params, is_binary, make_index, remove_id_range, rescore, search_id_ranges,
+    search_index,
+)
+from .vector_store import VectorStore
+from .dedup import DEDUP_VERSION, ChunkAliases
+from .ingest import PdfBatch, background, encode_batches, pdf_batches
+from .page_cache import PageTextCache
+from .metrics import METRICS, timer
+from .embedding import embed_model_id, load_embedder
+from .facts import FACTS_VERSION, Fact, FactTable, extract_facts, write_pdf_facts
 
-from .pdf import iter_all_pages
-from .chunking import chunk_page_text, Chunk
+# faiss, tqdm and sentence-transformers are imported where they are used, so that importing this
+# module (e.g. for a run that only reads the answer checkpoint) stays cheap
+if TYPE_CHECKING:
+    import faiss
+    from sentence_transformers import SentenceTransformer
+
+# upper bound for "every id from here on" in id-range removals
+_MAX_ID = 1 << 62
 
 @dataclass
 class IndexArtifacts:
     faiss_index: faiss.Index
-    chunks: List[Chunk]
+    # lazy mapping keyed by stable chunk id (the faiss id); Chunk objects are built on access
+    chunks: ChunkStore
     embed_model_name: str
+    # lexical index over the same chunks (rag/lexical.py), used by RETRIEVAL_MODE=hybrid; None otherwise
+    bm25: BM25Index | None = None
+    # per-PDF table from the manifest: pdf_sha1 -> {file, first_id, num_chunks, company, year}
+    pdfs: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    ann: AnnParams = field(default_factory=AnnParams)
+    # numeric facts extracted at indexing time (rag/facts.py); None when FACT_INDEX is off
+    facts: FactTable | None = None
+    # exact vectors for rescoring a lossy index (rag/vector_store.py); None for exact indexes
+    vectors: VectorStore | None = None
+    # pages of near-duplicate chunks that were dropped at indexing time, keyed by their canonical chunk
+    aliases: ChunkAliases | None = None
+
+    def close(self) -> None:
+        # the chunk store's file is closed here; the memory maps of the vectors, BM25 postings and
+        # facts go with their last reference
+        self.chunks.close()
+        self.faiss_index, self.bm25, self.facts, self.vectors, self.aliases = None, None, None, None, None
+
+    def id_ranges(self, pdf_sha1s: Sequence[str]) -> List[Tuple[int, int]]:
+        out = []
+        for sha in pdf_sha1s:
+            entry = self.pdfs.get(sha)
+            if entry is not None:
+                out.append((entry["first_id"], entry["first_id"] + entry["num_chunks"]))
+        return out
+
+    def search_vectors(
+        self, q: np.ndarray, top_k: int, id_ranges: Sequence[Optional[List[Tuple[int, int]]]]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        # (scores, chunk ids) of shape (len(q), top_k), padded with (-inf, -1); id_ranges[i] restricts
+        # query i to those id ranges, None searches everything
+        # lossy indexes over-fetch, then the candidates are re-ranked by exact inner product
+        k = top_k * self.ann.rescore_factor if self.vectors is not None else top_k
+        D = np.full((len(q), k), -np.inf, dtype="float32")
+        I = np.full((len(q), k), -1, dtype="int64")
+        if self.faiss_index.ntotal == 0 or not len(q):
+            return D[:, :top_k], I[:, :top_k]
+        # queries routed to specific PDFs only search those PDFs' id ranges; the rest share one search
+        open_rows = [i for i, r in enumerate(id_ranges) if r is None]
+        with METRICS.timer("search.faiss"):
+            if open_rows:
+                D[open_rows], I[open_rows] = search_index(self.faiss_index, q[open_rows], k)
+            for i, r in enumerate(id_ranges):
+                if r is not None:
+                    D[i:i + 1], I[i:i + 1] = search_id_ranges(self.faiss_index, self.ann, q[i:i + 1], k, r)
+        if self.vectors is not None:
+            with METRICS.timer("search.rescore"):
+                D, I = rescore(q, I, self.vectors.vectors, np.asarray(self.chunks.ids), top_k)
+        return D, I
 
 def _ensure_dir(p: Path) -> None:
     p.mkdir(parents=True, exist_ok=True)
 
+def _read_json(path: Path) -> Dict[str, Any] | None:
+    if not path.exists():
+        return None
+    return json.loads(path.read_text(encoding="utf-8"))
+
+def _write_json(path: Path, obj: Dict[str, Any]) -> None:
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(obj, ensure_ascii=False, indent=2), encoding="utf-8")
+    tmp.replace(path)
+
+def _write_index(index, path: Path) -> None:
+    import faiss
+
+    # written next to the old file and swapped in, so a crash mid-write keeps the last checkpoint
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    write = faiss.write_index_binary if is_binary(index) else faiss.write_index
+    write(index, str(tmp))
+    tmp.replace(path)
+
+def _load_or_build_bm25(bm25_dir: Path, chunks: ChunkStore, *, k1: float, b: float) -> BM25Index:
+    ids = np.asarray(chunks.ids)
+    if (bm25_dir / "meta.json").exists():
+        bm25 = BM25Index(bm25_dir, k1=k1, b=b)
+        if np.array_equal(bm25.ids, ids):
+            return bm25
+        # the chunk store only ever drops rows and appends new ones: if the rows BM25 still has are the
+        # head of the store, only the appended chunks are tokenized
+        keep = np.isin(bm25.ids, ids)
+        kept = int(keep.sum())
+        if np.array_equal(np.asarray(bm25.ids)[keep], ids[:kept]):
+            with METRICS.timer("index.bm25_update"):
+                return bm25.update(keep, ids[kept:], (chunks.text_at(row) for row in range(kept, len(ids))))
+    with METRICS.timer("index.bm25_build"):
+        return BM25Index.build(bm25_dir, ids, chunks.iter_texts(), k1=k1, b=b)
+
+def _load_or_build_facts(
+    facts_dir: Path,
+    pdfs: Dict[str, Dict[str, Any]],
+    paths: Dict[str, Path],
+    *,
+    rebuild: bool,
+    extract_workers: int,
+    extract_pages_per_task: int,
+    page_cache: PageTextCache | None = None,
+    table: bool = True,
+) -> FactTable | None:
+    version_path = facts_dir / "version.json"
+    version = _read_json(version_path)
+    if version is None or version.get("facts_version") != FACTS_VERSION:
+        if facts_dir.exists():
+            shutil.rmtree(facts_dir)
+        rebuild = True
+    _ensure_dir(facts_dir / "pdfs")
+
+    for path in (facts_dir / "pdfs").glob("*.npz"):
+        if path.stem not in pdfs:
+            path.unlink()
+            rebuild = True
+
+    # PDFs indexed before the fact table existed (or under an older extractor) are re-read for facts only
+    missing = [s for s in pdfs if s in paths and not (facts_dir / "pdfs" / f"{s}.npz").exists()]
+    if missing:
+        from tqdm import tqdm
+
+        found: Dict[str, List[Fact]] = {s: [] for s in missing}
+        pages = iter_pages(
+            [paths[s] for s in missing], workers=extract_workers, pages_per_task=extract_pages_per_task, cache=page_cache
+        )
+        for page in tqdm(pages, desc="Extracting facts"):
+            with METRICS.timer("index.facts"):
+                found[page.pdf_sha1].extend(extract_facts(page.pdf_sha1, page.page_index, page.text))
+        for s, facts in found.items():
+            write_pdf_facts(facts_dir / "pdfs" / f"{s}.npz", facts, default_year=pdfs[s].get("year"))
+        rebuild = True
+
+    _write_json(version_path, {"facts_version": FACTS_VERSION})
+    if not table:
+        return None
+    if not rebuild and (facts_dir / "ranges.json").exists():
+        return FactTable(facts_dir)
+    return FactTable.build(facts_dir, pdfs)
+
+@timer("index.build_or_load")
 def build_or_load_index(
     *,
     pdf_dir: Path,
     index_dir: Path,
     embed_model: str,
     chunk_chars: int,
-    chunk_overlap: int
+    chunk_overlap: int,
+    extract_workers: int = 1,
+    extract_pages_per_task: int = 0,
+    embed_cache_dir: Path | None = None,
+    embed_cache_dtype: str = "float32",
+    ann: AnnParams | None = None,
+    bm25_k1: float = 1.2,
+    bm25_b: float = 0.75,
+    facts: bool = True,
+    page_cache_dir: Path | None = None,
+    page_cache_codec: str = "gzip",
+    dedup_threshold: float | None = None,
+    queue_size: int = 4,
+    encode_batch: int = 256,
+    checkpoint_s: float = 300.0,
+    shard: Tuple[int, int] | None = None,
+    pdfs: Dict[str, Path] | None = None,
+    fact_table: bool = True,
+    lexical: bool = True,
+    embed_backend: str = "torch",
+    embed_onnx_dir: Path = Path("indexes/onnx"),
+    model: "SentenceTransformer | None" = None,
 ) -> IndexArtifacts:
+    import faiss
+    from tqdm import tqdm
+
+    ann = ann or AnnParams()
     _ensure_dir(index_dir)
     idx_path = index_dir / "index.faiss"
-    meta_path = index_dir / "chunks.jsonl"
+    store_dir = index_dir / "chunks"
+    vectors_dir = index_dir / "vectors"
+    aliases_path = index_dir / "aliases.npz"
     info_path = index_dir / "info.json"
+    manifest_path = index_dir / "manifest.json"
+    facts_dir = index_dir / "facts"
+
+    want_info = {
+        "embed_model": embed_model, "chunk_chars": chunk_chars, "chunk_overlap": chunk_overlap,
+        "dedup_threshold": dedup_threshold, "dedup_version": DEDUP_VERSION if dedup_threshold is not None else None,
+        # sentence token counts in the chunk store are regex counts, whatever the prompt tokenizer
+        "tokenizer": "regex", **ann.build_info(),
+        "shard": list(shard) if shard else None,
+        # indexes from before EMBED_BACKEND existed are torch ones and stay valid
+        "embed_backend": None if embed_backend == "torch" else embed_backend,
+    }
+
+    # manifest: {"next_id": int, "num_chunks": int, "pdfs": {pdf_sha1: {"file", "first_id", "num_chunks"}}}
+    # every PDF owns the contiguous id range [first_id, first_id + num_chunks)
+    faiss_index = None
+    chunks: ChunkStore | None = None
+    vectors: VectorStore | None = None
+    manifest: Dict[str, Any] = {"next_id": 0, "num_chunks": 0, "pdfs": {}}
+
+    info = _read_json(info_path)
+    old_manifest = _read_json(manifest_path)
+    if (
+        info is not None and old_manifest is not None and idx_path.exists() and store_dir.exists()
+        and all(info.get(k) == v for k, v in want_info.items())
+    ):
+        read = faiss.read_index_binary if ann.quantization == "binary" else faiss.read_index
+        faiss_index = read(str(idx_path))
+        chunks = ChunkStore.open(store_dir)
+        vectors = VectorStore.open(vectors_dir) if ann.keeps_vectors and vectors_dir.exists() else None
+        # a build interrupted after a checkpoint leaves rows (and possibly index entries) past the manifest:
+        # they are dropped and the missing PDFs are added again. Anything short of the manifest -> rebuild
+        n = old_manifest.get("num_chunks", -1)
+        if faiss_index.ntotal > n >= 0:
+            faiss_index = remove_id_range(faiss_index, ann, old_manifest["next_id"], _MAX_ID)
+        if (
+            faiss_index.ntotal == n and len(chunks) >= n
+            and (not ann.keeps_vectors or (vectors is not None and len(vectors) >= n))
+        ):
+            manifest = old_manifest
+            if len(chunks) > n:
+                chunks = chunks.truncate(n)
+            if vectors is not None and len(vectors) > n:
+                vectors = vectors.truncate(n)
+            if faiss_index.ntotal:
+                apply_search_params(faiss_index, ann)
+        else:
+            chunks.close()
+            faiss_index, chunks, vectors = None, None, None
 
-    if idx_path.exists() and meta_path.exists() and info_path.exists():
-        info = json.loads(info_path.read_text(encoding="utf-8"))
-        if info.get("embed_model") == embed_model and info.get("chunk_chars")==chunk_chars and info.get("chunk_overlap")==chunk_overlap:
-            faiss_index = faiss.read_index(str(idx_path))
-            chunks: List[Chunk] = []
-            with meta_path.open("r", encoding="utf-8") as f:
-                for line in f:
-                    obj = json.loads(line)
-                    chunks.append(Chunk(**obj))
-            return IndexArtifacts(faiss_index=faiss_index, chunks=chunks, embed_model_name=embed_model)
+    if chunks is None:
+        if store_dir.exists():
+            shutil.rmtree(store_dir)
+        ChunkStoreWriter(store_dir).close()
+        chunks = ChunkStore.open(store_dir)
+    if vectors is None and vectors_dir.exists():
+        shutil.rmtree(vectors_dir)
+    if faiss_index is None:
+        # a rebuild must not be resumed against the previous build's manifest, nor reuse its BM25 postings
+        # (chunk ids start over)
+        for path in (aliases_path, manifest_path, info_path):
+            path.unlink(missing_ok=True)
+        if (index_dir / "bm25").exists():
+            shutil.rmtree(index_dir / "bm25")
+    aliases = ChunkAliases(aliases_path)
+    aliases.keep_ids_below(manifest["next_id"])
 
-    # rebuild
-    model = SentenceTransformer(embed_model)
+    # the sharded build (rag/shards.py) hashes the PDF directory once and hands each shard its own PDFs
+    current = pdfs
+    if current is None:
+        current = {}
+        for pdf_path in list_pdfs(pdf_dir):
+            current.setdefault(pdf_sha1_for(pdf_path), pdf_path)
+    removed = [s for s in manifest["pdfs"] if s not in current]
+    added = {s: p for s, p in current.items() if s not in manifest["pdfs"]}
 
-    chunks: List[Chunk] = []
-    texts: List[str] = []
+    # extracted page text survives index rebuilds, so re-chunking does not re-parse PDFs
+    page_cache = PageTextCache(page_cache_dir, codec=page_cache_codec) if page_cache_dir is not None else None
 
-    for page in tqdm(list(iter_all_pages(pdf_dir)), desc="Extracting pages"):
-        for ch in chunk_page_text(page.pdf_sha1, page.page_index, page.text, chunk_chars=chunk_chars, overlap=chunk_overlap):
-            chunks.append(ch)
-            texts.append(ch.text)
+    def load_facts(rebuild: bool) -> FactTable | None:
+        if not facts:
+            return None
+        return _load_or_build_facts(
+            facts_dir, manifest["pdfs"], current,
+            rebuild=rebuild, extract_workers=extract_workers, extract_pages_per_task=extract_pages_per_task,
+            page_cache=page_cache, table=fact_table,
+        )
 
-    # embeddings (normalized for cosine via inner product)
-    emb = model.encode(texts, batch_size=64, show_progress_bar=True, normalize_embeddings=True)
-    emb = np.asarray(emb, dtype="float32")
+    if faiss_index is not None and not removed and not added:
+        bm25 = _load_or_build_bm25(index_dir / "bm25", chunks, k1=bm25_k1, b=bm25_b) if lexical else None
+        return IndexArtifacts(
+            faiss_index=faiss_index, chunks=chunks, embed_model_name=embed_model, bm25=bm25, pdfs=manifest["pdfs"], ann=ann,
+            facts=load_facts(False), vectors=vectors, aliases=aliases,
+        )
 
-    dim = emb.shape[1]
-    faiss_index = faiss.IndexFlatIP(dim)
-    faiss_index.add(emb)
+    num_chunks = len(chunks)
+    next_id = manifest["next_id"]
+    writer: ChunkStoreWriter | None = None
+    new_aliases: List[Tuple[int, int]] = []
 
-    faiss.write_index(faiss_index, str(idx_path))
+    def commit() -> None:
+        # checkpoint: rows are flushed before the index and the manifest, so after a crash the next
+        # load finds at least as many rows as the manifest and truncates the rest
+        if writer is not None:
+            writer.flush()
+        aliases.extend(new_aliases)
+        new_aliases.clear()
+        aliases.save()
+        with METRICS.timer("index.write"):
+            _write_index(faiss_index, idx_path)
+        manifest["next_id"] = next_id
+        manifest["num_chunks"] = num_chunks
+        _write_json(manifest_path, manifest)
+        _write_json(info_path, {**want_info, "num_chunks": num_chunks, "num_pdfs": len(manifest["pdfs"])})
 
-    with meta_path.open("w", encoding="utf-8") as f:
-        for ch in chunks:
-            f.write(json.dumps(ch.__dict__, ensure_ascii=False) + "\n")
+    keep = np.ones(len(chunks), dtype=bool)
+    for pdf_sha1 in removed:
+        entry = manifest["pdfs"].pop(pdf_sha1)
+        lo, hi = entry["first_id"], entry["first_id"] + entry["num_chunks"]
+        if hi > lo:
+            faiss_index = remove_id_range(faiss_index, ann, lo, hi)
+            keep &= (chunks.ids < lo) | (chunks.ids >= hi)
+            aliases.remove_range(lo, hi)
+    if removed:
+        chunks = chunks.compact(keep)
+        if vectors is not None:
+            vectors = vectors.compact(keep)
+        num_chunks = len(chunks)
+        commit()
 
-    info = {"embed_model": embed_model, "chunk_chars": chunk_chars, "chunk_overlap": chunk_overlap, "num_chunks": len(chunks)}
-    info_path.write_text(json.dumps(info, ensure_ascii=False, indent=2), encoding="utf-8")
+    # unless the caller passes one in, the model is only loaded when something actually has to be encoded
+    def get_model() -> "SentenceTransformer":
+        nonlocal model
+        if model is None:
+            model = load_embedder(embed_model, backend=embed_backend, onnx_dir=embed_onnx_dir)
+        return model
 
-    return IndexArtifacts(faiss_index=faiss_index, chunks=chunks, embed_model_name=embed_model)
+    def encode(texts: List[str]) -> np.ndarray:
+        # embeddings (normalized for cosine via inner product)
+        with METRICS.timer("index.encode"):
+            emb = get_model().encode(texts, batch_size=64, show_progress_bar=False, normalize_embeddings=True)
+        METRICS.count("index.encoded_chunks", len(texts))
+        return np.asarray(emb, dtype="float32")
+
+    cache = (
+        EmbeddingCache(embed_cache_dir, embed_model_id(embed_model, embed_backend), dtype=embed_cache_dtype)
+        if embed_cache_dir is not None else None
+    )
+
+    def new_index(dim: int, params: AnnParams, train: np.ndarray | None = None) -> None:
+        nonlocal faiss_index, vectors
+        faiss_index = make_index(dim, params, train=train)
+        if ann.keeps_vectors and vectors is None:
+            vectors = VectorStore.create(vectors_dir, dim)
+
+    def add_pdf(batch: PdfBatch, emb: np.ndarray | None) -> None:
+        nonlocal next_id, num_chunks, vectors
+        n = len(batch.chunks)
+        entry = {
+            "file": added[batch.pdf_sha1].name, "first_id": next_id, "num_chunks": n,
+            "num_duplicates": batch.num_duplicates,
+            # company name / report year from the first pages, used to route questions to their report
+            **batch.metadata,
+        }
+        if n:
+            ids = np.arange(next_id, next_id + n, dtype="int64")
+            with METRICS.timer("index.faiss_add"):
+                add_vectors(faiss_index, emb, ids)
+            writer.extend(zip(ids.tolist(), batch.chunks, batch.sentences))
+            if vectors is not None:
+                with METRICS.timer("index.vectors_write"):
+                    vectors = vectors.append(emb)
+            new_aliases.extend((next_id + pos, page) for pos, page in batch.aliases)
+        if facts:
+            write_pdf_facts(facts_dir / "pdfs" / f"{batch.pdf_sha1}.npz", batch.facts, default_year=entry.get("year"))
+        manifest["pdfs"][batch.pdf_sha1] = entry
+        next_id += n
+        num_chunks += n
+
+    # extract -> chunk/dedup -> encode run in background threads behind bounded queues; this thread adds
+    # each PDF to the index and the chunk store as it arrives, and checkpoints every checkpoint_s seconds
+    if added:
+        chunks.close()
+        writer = ChunkStoreWriter(store_dir)
+        pages = iter_pages(
+            list(added.values()), workers=extract_workers, pages_per_task=extract_pages_per_task, cache=page_cache
+        )
+        batches = pdf_batches(
+            tqdm(pages, desc="Extracting pages"), list(added),
+            chunk_chars=chunk_chars, chunk_overlap=chunk_overlap,
+            facts=facts, dedup_threshold=dedup_threshold,
+        )
+        encoded = encode_batches(
+            background(batches, maxsize=queue_size),
+            lambda texts: cache.get_or_compute(texts, encode) if cache is not None else encode(texts),
+            batch_size=encode_batch,
+        )
+        # a fresh (or still empty) index is created from the first vectors; IVF / SQ8 are trained first,
+        # so their PDFs wait here until ivf_train_sample vectors (or the whole input) have arrived
+        fresh = faiss_index is None or faiss_index.ntotal == 0
+        untrained: List[Tuple[PdfBatch, np.ndarray | None]] = []
+
+        def train_and_flush() -> None:
+            sample = np.concatenate([e for _, e in untrained if e is not None])
+            new_index(sample.shape[1], ann, train=sample)
+            for b, e in untrained:
+                add_pdf(b, e)
+            untrained.clear()
+
+        last_commit = time.perf_counter()
+        stream = background(encoded, maxsize=queue_size)
+        try:
+            for batch, emb in stream:
+                if fresh and emb is not None and not ann.needs_training:
+                    new_index(emb.shape[1], ann)
+                    fresh = False
+                if not fresh:
+                    add_pdf(batch, emb)
+                else:
+                    untrained.append((batch, emb))
+                    if sum(len(b.chunks) for b, _ in untrained) < ann.ivf_train_sample:
+                        continue
+                    train_and_flush()
+                    fresh = False
+                if time.perf_counter() - last_commit >= checkpoint_s:
+                    commit()
+                    last_commit = time.perf_counter()
+        finally:
+            stream.close()
+        if any(e is not None for _, e in untrained):
+            train_and_flush()
+        for b, e in untrained:
+            add_pdf(b, e)
+        writer.close()
+        writer = None
+        chunks = ChunkStore.open(store_dir)
+
+    if faiss_index is None:
+        dim = cache.dim if cache is not None and cache.dim else get_model().get_sentence_embedding_dimension()
+        # empty corpus: an untrainable IVF / SQ8 is replaced by an empty flat index until vectors arrive
+        new_index(dim, AnnParams() if ann.needs_training else ann)
+    commit()
+
+    bm25 = _load_or_build_bm25(index_dir / "bm25", chunks, k1=bm25_k1, b=bm25_b) if lexical else None
+    return IndexArtifacts(
+        faiss_index=faiss_index, chunks=chunks, embed_model_name=embed_model, bm25=bm25, pdfs=manifest["pdfs"], ann=ann,
+        facts=load_facts(True), vectors=vectors, aliases=aliases,
+    )
+
+def load_index(index_dir: Path, ann: AnnParams) -> IndexArtifacts:
+    # read-only open of an index built by build_or_load_index, with just what search_vectors needs
+    # (the shard workers of rag/shards.py); nothing is checked against the PDFs or rebuilt
+    import faiss
+
+    read = faiss.read_index_binary if ann.quantization == "binary" else faiss.read_index
+    faiss_index = read(str(index_dir / "index.faiss"))
+    if faiss_index.ntotal:
+        apply_search_params(faiss_index, ann)
+    vectors_dir = index_dir / "vectors"
+    info = _read_json(index_dir / "info.json") or {}
+    return IndexArtifacts(
+        faiss_index=faiss_index, chunks=ChunkStore.open(index_dir / "chunks"), embed_model_name=info.get("embed_model", ""),
+        ann=ann, vectors=VectorStore.open(vectors_dir) if ann.keeps_vectors and vectors_dir.exists() else None,
+    )
+
+def search_many(
+    artifacts: IndexArtifacts,
+    queries: Sequence[str],
+    *,
+    model: "SentenceTransformer",
+    top_k: int = 8,
+    batch_size: int = 64,
+    pdf_filters: Sequence[Optional[Sequence[str]]] | None = None,
+) -> List[List[Tuple[int, float]]]:
+    if not queries:
+        return []
+    if len(artifacts.chunks) == 0:
+        return [[] for _ in queries]
+    # one batched encode + one matrix search for the whole question set
+    with METRICS.timer("search.encode_queries"):
+        q = np.asarray(model.encode(list(queries), batch_size=batch_size, normalize_embeddings=True), dtype="float32")
+
+    filters = list(pdf_filters) if pdf_filters is not None else [None] * len(queries)
+    D, I = artifacts.search_vectors(q, top_k, [artifacts.id_ranges(f) if f else None for f in filters])
+
+    out = []
+    for ids, scores in zip(I.tolist(), D.tolist()):
+        out.append([(idx, float(score)) for idx, score in zip(ids, scores) if idx != -1])
+    return out
 
 def search(
     artifacts: IndexArtifacts,
     query: str,
     *,
-    model: SentenceTransformer,
+    model: "SentenceTransformer",
     top_k: int = 8
 ) -> List[Tuple[int, float]]:
-    q = model.encode([query], normalize_embeddings=True)
-    D, I = artifacts.faiss_index.search(np.asarray(q, dtype="float32"), top_k)
-    results = []
-    for idx, score in zip(I[0].tolist(), D[0].tolist()):
-        if idx == -1:
-            continue
-        results.append((idx, float(score)))
-    return results
+    return search_many(artifacts, [query], model=model, top_k=top_k)[0]
+
+def index_kwargs(settings: Settings) -> Dict[str, Any]:
+    # build_or_load_index arguments from the settings, minus pdf_dir / index_dir / shard
+    return dict(
+        embed_model=settings.embed_model,
+        chunk_chars=settings.chunk_chars,
+        chunk_overlap=settings.chunk_overlap,
+        extract_workers=settings.extract_workers,
+        extract_pages_per_task=settings.extract_pages_per_task,
+        embed_cache_dir=settings.embed_cache_dir if settings.embed_cache else None,
+        embed_cache_dtype=settings.embed_cache_dtype,
+        ann=AnnParams.from_settings(settings),
+        bm25_k1=settings.bm25_k1,
+        bm25_b=settings.bm25_b,
+        # only hybrid retrieval reads BM25; dense runs neither build nor update it
+        lexical=settings.retrieval_mode == "hybrid",
+        facts=settings.fact_index,
+        page_cache_dir=settings.page_cache_dir if settings.page_cache else None,
+        page_cache_codec=settings.page_cache_codec,
+        dedup_threshold=settings.dedup_threshold if settings.dedup else None,
+        queue_size=settings.index_queue_size,
+        encode_batch=settings.index_encode_batch,
+        checkpoint_s=settings.index_checkpoint_s,
+        embed_backend=settings.embed_backend,
+        embed_onnx_dir=settings.embed_onnx_dir,
+    )
+
+def build_or_load_index_from_settings(settings: Settings, *, model: "SentenceTransformer | None" = None) -> IndexArtifacts:
+    if settings.index_shards > 1:
+        from .shards import build_or_load_sharded_index
+
+        return build_or_load_sharded_index(settings, model=model)
+    return build_or_load_index(pdf_dir=settings.pdf_dir, index_dir=settings.index_dir, model=model, **index_kwargs(settings))
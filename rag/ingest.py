@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+import queue
+import threading
+import numpy as np
+
+from .chunking import Chunk, chunk_page_text
+from .dedup import near_duplicates
+from .facts import Fact, extract_facts
+from .metadata import METADATA_PAGES, extract_pdf_metadata
+from .metrics import METRICS
+from .pdf import Page
+from .sentences import sentence_spans
+
+# Streaming stages of an index build, one PDF at a time:
+#   pages -> pdf_batches (chunk, dedup, sentences, facts, metadata) -> encode_batches (batched model.encode)
+# and build_or_load_index adds each encoded PDF to faiss and the chunk store as it arrives.
+# background() runs a stage in its own thread behind a bounded queue, so extraction, chunking and
+# encoding overlap while at most `maxsize` PDFs wait between any two stages.
+
+@dataclass
+class PdfBatch:
+    pdf_sha1: str
+    # kept chunks, in page order; ids are assigned by the consumer
+    chunks: List[Chunk] = field(default_factory=list)
+    # sentence spans of each kept chunk (rag/sentences.py)
+    sentences: List[np.ndarray] = field(default_factory=list)
+    # (position in chunks of the canonical copy, page of a dropped near-duplicate)
+    aliases: List[Tuple[int, int]] = field(default_factory=list)
+    num_duplicates: int = 0
+    facts: List[Fact] = field(default_factory=list)
+    # company / year from the first pages (rag/metadata.py)
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+def _finish(pdf_sha1: str, chunks: List[Chunk], first_pages: List[str], facts: List[Fact], dedup_threshold: float | None) -> PdfBatch:
+    batch = _dedup(PdfBatch(pdf_sha1=pdf_sha1, facts=facts, metadata=extract_pdf_metadata(first_pages)), chunks, dedup_threshold)
+    with METRICS.timer("index.sentences"):
+        batch.sentences = [sentence_spans(ch.text) for ch in batch.chunks]
+    return batch
+
+def _dedup(batch: PdfBatch, chunks: List[Chunk], dedup_threshold: float | None) -> PdfBatch:
+    if dedup_threshold is None:
+        batch.chunks = chunks
+        return batch
+    # near-duplicates within the report are not embedded; their pages become aliases of the first copy
+    with METRICS.timer("index.dedup"):
+        canonical = near_duplicates([ch.text for ch in chunks], threshold=dedup_threshold)
+    position: Dict[int, int] = {}
+    aliases = set()
+    for j, ch in enumerate(chunks):
+        c = int(canonical[j])
+        if c == j:
+            position[j] = len(batch.chunks)
+            batch.chunks.append(ch)
+        elif ch.page_index != chunks[c].page_index:
+            aliases.add((position[c], ch.page_index))
+    batch.aliases = sorted(aliases)
+    batch.num_duplicates = len(chunks) - len(batch.chunks)
+    METRICS.count("index.dedup_dropped", batch.num_duplicates)
+    return batch
+
+def pdf_batches(
+    pages: Iterable[Page],
+    pdf_sha1s: Sequence[str],
+    *,
+    chunk_chars: int,
+    chunk_overlap: int,
+    facts: bool = True,
+    dedup_threshold: float | None = None,
+) -> Iterator[PdfBatch]:
+    # pages arrive grouped by PDF; PDFs without any text still get an (empty) batch at the end
+    current: str | None = None
+    chunks: List[Chunk] = []
+    first_pages: List[str] = []
+    found: List[Fact] = []
+    seen = set()
+    for page in pages:
+        if page.pdf_sha1 != current:
+            if current is not None:
+                yield _finish(current, chunks, first_pages, found, dedup_threshold)
+            current, chunks, first_pages, found = page.pdf_sha1, [], [], []
+            seen.add(current)
+        if page.page_index < METADATA_PAGES:
+            first_pages.append(page.text)
+        if facts:
+            with METRICS.timer("index.facts"):
+                found.extend(extract_facts(page.pdf_sha1, page.page_index, page.text))
+        with METRICS.timer("index.chunk"):
+            chunks.extend(chunk_page_text(page.pdf_sha1, page.page_index, page.text, chunk_chars=chunk_chars, overlap=chunk_overlap))
+    if current is not None:
+        yield _finish(current, chunks, first_pages, found, dedup_threshold)
+    for pdf_sha1 in pdf_sha1s:
+        if pdf_sha1 not in seen:
+            yield PdfBatch(pdf_sha1=pdf_sha1)
+
+def encode_batches(
+    batches: Iterable[PdfBatch],
+    encode: Callable[[List[str]], np.ndarray],
+    *,
+    batch_size: int,
+) -> Iterator[Tuple[PdfBatch, np.ndarray | None]]:
+    # small PDFs are pooled into one encode call of at least batch_size chunks; a large PDF is one call
+    pending: List[PdfBatch] = []
+    size = 0
+
+    def flush() -> Iterator[Tuple[PdfBatch, np.ndarray | None]]:
+        texts = [ch.text for b in pending for ch in b.chunks]
+        emb = encode(texts) if texts else None
+        offset = 0
+        for b in pending:
+            yield b, emb[offset:offset + len(b.chunks)] if emb is not None else None
+            offset += len(b.chunks)
+
+    try:
+        for batch in batches:
+            pending.append(batch)
+            size += len(batch.chunks)
+            if size >= batch_size:
+                yield from flush()
+                pending, size = [], 0
+        yield from flush()
+    finally:
+        # stop the upstream stage now rather than whenever the garbage collector finds it, possibly
+        # on another stage's thread while that holds a lock the upstream needs to finish
+        close = getattr(batches, "close", None)
+        if close is not None:
+            close()
+
+_DONE = object()
+
+class _Failure:
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+def background(items: Iterable[Any], *, maxsize: int) -> Iterator[Any]:
+    # iterate `items` in a worker thread, handing results over through a queue of at most maxsize
+    q: queue.Queue = queue.Queue(maxsize=max(1, maxsize))
+    stop = threading.Event()
+
+    def put(item: Any) -> bool:
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run() -> None:
+        it = iter(items)
+        try:
+            for item in it:
+                if not put(item):
+                    return
+            put(_DONE)
+        except BaseException as e:
+            put(_Failure(e))
+        finally:
+            # generators are closed in the thread that ran them, which also stops nested stages
+            close = getattr(it, "close", None)
+            if close is not None:
+                close()
+
+    worker = threading.Thread(target=run, name="index-stage", daemon=True)
+    worker.start()
+    try:
+        while True:
+            item = q.get()
+            if item is _DONE:
+                return
+            if isinstance(item, _Failure):
+                raise item.exc
+            yield item
+    finally:
+        stop.set()
+        # a generator abandoned by a failed stage may be garbage-collected on its own worker thread
+        if worker is not threading.current_thread():
+            worker.join()
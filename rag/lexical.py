@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+from collections import Counter
+from pathlib import Path
+from typing import Iterable, List, Sequence, Tuple
+import json
+import math
+import re
+import shutil
+import numpy as np
+
+_TOKEN = re.compile(r"\w+")
+STOPWORDS = frozenset(
+    "a an and are as at be by did do does for from had has have in is it its of on or that the this to was were what which who with".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(text.lower()) if len(t) > 1 and t not in STOPWORDS]
+
+def _postings(texts: Iterable[str], vocab: dict, *, first_row: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    # (term id, row, term frequency) per distinct term of each text, rows numbered from first_row, and
+    # the token count of each text; new terms are added to vocab
+    term_col: List[int] = []
+    row_col: List[int] = []
+    tf_col: List[int] = []
+    doc_len: List[int] = []
+    for row, text in enumerate(texts, start=first_row):
+        toks = tokenize(text)
+        doc_len.append(len(toks))
+        for term, c in Counter(toks).items():
+            term_col.append(vocab.setdefault(term, len(vocab)))
+            row_col.append(row)
+            tf_col.append(min(c, 65535))
+    return (
+        np.asarray(term_col, dtype="int64"), np.asarray(row_col, dtype="int64"), np.asarray(tf_col, dtype="uint16"),
+        np.asarray(doc_len, dtype="int32"),
+    )
+
+# Okapi BM25 over the chunk store. On disk (<index_dir>/bm25/):
+#   vocab.json     list of terms; position = term id
+#   offsets.npy    int64[V+1], postings of term t are rows offsets[t]:offsets[t+1]
+#   postings.npy   int32 chunk-store row of each posting, ascending within a term
+#   tf.npy         uint16 term frequency of each posting
+#   doc_len.npy    int32 token count per row
+#   ids.npy        int64 chunk id per row
+#   meta.json      {"num_docs", "avgdl"}
+# Arrays are opened with mmap_mode="r"; a query only touches the postings of its own terms.
+class BM25Index:
+    def __init__(self, root: Path, *, k1: float = 1.2, b: float = 0.75):
+        self.root = root
+        self.k1 = k1
+        self.b = b
+        meta = json.loads((root / "meta.json").read_text(encoding="utf-8"))
+        self.num_docs = int(meta["num_docs"])
+        self.avgdl = float(meta["avgdl"]) or 1.0
+        terms = json.loads((root / "vocab.json").read_text(encoding="utf-8"))
+        self.vocab = {t: i for i, t in enumerate(terms)}
+        load = lambda name: np.load(root / name, mmap_mode="r")
+        self.offsets = load("offsets.npy")
+        self.postings = load("postings.npy")
+        self.tf = load("tf.npy")
+        self.doc_len = load("doc_len.npy")
+        self.ids = load("ids.npy")
+
+    @classmethod
+    def build(cls, root: Path, ids: np.ndarray, texts: Iterable[str], **kwargs) -> "BM25Index":
+        vocab: dict = {}
+        terms, rows, tf, doc_len = _postings(texts, vocab, first_row=0)
+        return cls._write(root, vocab, terms, rows, tf, doc_len, np.asarray(ids, dtype="int64"), **kwargs)
+
+    def update(self, keep: np.ndarray, ids: np.ndarray, texts: Iterable[str]) -> "BM25Index":
+        # the index after dropping the rows where keep is False and appending `texts` (chunk ids `ids`) as
+        # new rows; only the new texts are tokenized, the kept postings are renumbered and merged as arrays
+        keep = np.asarray(keep, dtype=bool)
+        new_row = np.cumsum(keep) - 1
+        old_terms = np.repeat(np.arange(len(self.vocab), dtype="int64"), np.diff(np.asarray(self.offsets)))
+        mask = keep[self.postings]
+        vocab = dict(self.vocab)
+        terms, rows, tf, doc_len = _postings(texts, vocab, first_row=int(keep.sum()))
+        return self._write(
+            self.root, vocab,
+            np.concatenate([old_terms[mask], terms]),
+            np.concatenate([new_row[self.postings[mask]], rows]),
+            np.concatenate([np.asarray(self.tf)[mask], tf]),
+            np.concatenate([np.asarray(self.doc_len)[keep], doc_len]),
+            np.concatenate([np.asarray(self.ids)[keep], np.asarray(ids, dtype="int64")]),
+            k1=self.k1, b=self.b,
+        )
+
+    @classmethod
+    def _write(
+        cls, root: Path, vocab: dict, terms: np.ndarray, rows: np.ndarray, tf: np.ndarray, doc_len: np.ndarray, ids: np.ndarray,
+        **kwargs,
+    ) -> "BM25Index":
+        # terms without postings (their rows were all dropped) leave the vocabulary
+        counts = np.bincount(terms, minlength=len(vocab))
+        live = np.flatnonzero(counts)
+        remap = np.full(len(vocab), -1, dtype="int64")
+        remap[live] = np.arange(len(live))
+        terms = remap[terms]
+        # stable sort keeps rows ascending inside each posting list
+        order = np.argsort(terms, kind="stable")
+        offsets = np.searchsorted(terms[order], np.arange(len(live) + 1))
+        words = sorted(vocab, key=vocab.get)
+
+        tmp = root.with_name(root.name + ".tmp")
+        if tmp.exists():
+            shutil.rmtree(tmp)
+        tmp.mkdir(parents=True)
+        np.save(tmp / "offsets.npy", offsets.astype("int64"))
+        np.save(tmp / "postings.npy", rows.astype("int32")[order])
+        np.save(tmp / "tf.npy", tf.astype("uint16")[order])
+        np.save(tmp / "doc_len.npy", doc_len.astype("int32"))
+        np.save(tmp / "ids.npy", ids.astype("int64"))
+        (tmp / "vocab.json").write_text(json.dumps([words[t] for t in live], ensure_ascii=False), encoding="utf-8")
+        meta = {"num_docs": len(doc_len), "avgdl": float(np.mean(doc_len)) if len(doc_len) else 0.0}
+        (tmp / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+        if root.exists():
+            shutil.rmtree(root)
+        tmp.rename(root)
+        return cls(root, **kwargs)
+
+    def search(self, query: str, top_k: int, *, id_ranges: Sequence[Tuple[int, int]] | None = None) -> List[Tuple[int, float]]:
+        rows_parts = []
+        score_parts = []
+        for term in set(tokenize(query)):
+            tid = self.vocab.get(term)
+            if tid is None:
+                continue
+            s, e = int(self.offsets[tid]), int(self.offsets[tid + 1])
+            rows = self.postings[s:e]
+            tf = self.tf[s:e].astype("float32")
+            df = e - s
+            idf = math.log(1.0 + (self.num_docs - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * self.doc_len[rows] / self.avgdl)
+            rows_parts.append(rows)
+            score_parts.append(idf * tf * (self.k1 + 1.0) / (tf + norm))
+        if not rows_parts:
+            return []
+
+        rows = np.concatenate(rows_parts)
+        uniq, inv = np.unique(rows, return_inverse=True)
+        scores = np.bincount(inv, weights=np.concatenate(score_parts))
+        if id_ranges:
+            ids = self.ids[uniq]
+            mask = np.zeros(len(uniq), dtype=bool)
+            for lo, hi in id_ranges:
+                mask |= (ids >= lo) & (ids < hi)
+            uniq, scores = uniq[mask], scores[mask]
+        k = min(top_k, len(uniq))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(self.ids[uniq[i]]), float(scores[i])) for i in top]
+
+    def search_many(
+        self, queries: Sequence[str], top_k: int, *, id_ranges: Sequence[Sequence[Tuple[int, int]] | None] | None = None
+    ) -> List[List[Tuple[int, float]]]:
+        ranges = id_ranges if id_ranges is not None else [None] * len(queries)
+        return [self.search(q, top_k, id_ranges=r) for q, r in zip(queries, ranges)]
+
+def reciprocal_rank_fusion(rankings: Sequence[List[Tuple[int, float]]], *, k: int = 60) -> List[Tuple[int, float]]:
+    fused: dict = {}
+    for ranking in rankings:
+        for rank, (chunk_id, _) in enumerate(ranking):
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda x: x[1], reverse=True)
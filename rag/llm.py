@@ -1,27 +1,225 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, replace
+from typing import Callable, List, Optional, Sequence
+import json
 import os
+import random
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from .metrics import METRICS
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
 
 @dataclass(frozen=True)
 class LLMResponse:
     text: str
+    # per-request timing in seconds: TCP+TLS setup (0 on a reused keep-alive connection),
+    # time to first byte of the response, and total wall time including body download
+    connect_s: float | None = None
+    ttfb_s: float | None = None
+    total_s: float | None = None
+    cached: bool = False
+    # token usage as reported by the provider, and the number of attempts generate_with_retry needed
+    prompt_tokens: int | None = None
+    completion_tokens: int | None = None
+    attempts: int = 1
+
+# connect() time of the current thread's last request, filled in by the timed connection classes
+_conn_timing = threading.local()
+
+class _TimedConnectMixin:
+    def connect(self):
+        t0 = time.perf_counter()
+        super().connect()
+        _conn_timing.connect_s = getattr(_conn_timing, "connect_s", 0.0) + (time.perf_counter() - t0)
+
+class _TimedHTTPConnection(_TimedConnectMixin, HTTPConnection):
+    pass
+
+class _TimedHTTPSConnection(_TimedConnectMixin, HTTPSConnection):
+    pass
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+class TimedHTTPAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _TimedHTTPConnectionPool, "https": _TimedHTTPSConnectionPool}
+
+def make_session(*, pool_size: int = 10) -> requests.Session:
+    # keep-alive connection pool; retries are handled by LLMClient.generate_with_retry
+    session = requests.Session()
+    adapter = TimedHTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Connection": "keep-alive"})
+    return session
+
+class RateLimiter:
+    # token bucket: `rate` requests per second on average, bursts of up to `burst`
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+def _status_of(exc: Exception) -> Optional[int]:
+    # requests.HTTPError carries .response; google api_core errors carry .code
+    resp = getattr(exc, "response", None)
+    status = getattr(resp, "status_code", None)
+    if status is None:
+        code = getattr(exc, "code", None)
+        status = code if isinstance(code, int) else None
+    return status
+
+def is_retryable(exc: Exception) -> bool:
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout)):
+        return True
+    return _status_of(exc) in RETRYABLE_STATUS
+
+def _retry_after(exc: Exception) -> Optional[float]:
+    resp = getattr(exc, "response", None)
+    value = getattr(resp, "headers", {}).get("Retry-After") if resp is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+SYSTEM_PROMPT = "You are a precise financial QA assistant. Follow the required output format strictly."
 
 class LLMClient:
+    provider: str = "none"
+    model: str = ""
+    temperature: float = 0.0
+    system_prompt: str = ""
+
     def generate(self, prompt: str) -> LLMResponse:
         raise NotImplementedError
 
+    def cache_identity(self) -> dict:
+        # everything besides the prompt that determines the completion (see rag/llm_cache.py)
+        return {"provider": self.provider, "model": self.model, "temperature": self.temperature, "system": self.system_prompt}
+
+    def generate_with_retry(
+        self,
+        prompt: str,
+        *,
+        rate_limiter: RateLimiter | None = None,
+        max_retries: int = 4,
+        backoff: float = 1.0,
+        max_backoff: float = 60.0,
+    ) -> LLMResponse:
+        attempt = 0
+        while True:
+            if rate_limiter is not None:
+                rate_limiter.acquire()
+            try:
+                resp = self.generate(prompt)
+                return replace(resp, attempts=attempt + 1) if attempt else resp
+            except Exception as e:
+                if attempt >= max_retries or not is_retryable(e):
+                    METRICS.count("llm.failures")
+                    raise
+                METRICS.count("llm.retries")
+                # exponential backoff with full jitter; a Retry-After header wins if present
+                delay = _retry_after(e)
+                if delay is None:
+                    delay = random.uniform(0, min(max_backoff, backoff * (2 ** attempt)))
+                time.sleep(delay)
+                attempt += 1
+
+    def generate_many(
+        self,
+        prompts: Sequence[str],
+        *,
+        concurrency: int = 4,
+        rate_limiter: RateLimiter | None = None,
+        max_retries: int = 4,
+        backoff: float = 1.0,
+        on_result: Callable[[int, LLMResponse], None] | None = None,
+    ) -> List[LLMResponse]:
+        # thread pool over the blocking generate(); results keep the order of `prompts`.
+        # on_result(i, response) fires as each prompt completes, in completion order.
+        def one(prompt: str) -> LLMResponse:
+            return self.generate_with_retry(prompt, rate_limiter=rate_limiter, max_retries=max_retries, backoff=backoff)
+
+        results: List[LLMResponse | None] = [None] * len(prompts)
+        if concurrency <= 1:
+            for i, p in enumerate(prompts):
+                results[i] = one(p)
+                if on_result is not None:
+                    on_result(i, results[i])
+            return results
+
+        # a failed prompt does not cancel the others: every success is still reported to on_result
+        # before the first error is re-raised
+        error: Exception | None = None
+        with ThreadPoolExecutor(max_workers=concurrency) as ex:
+            futures = {ex.submit(one, p): i for i, p in enumerate(prompts)}
+            for fut in as_completed(futures):
+                i = futures[fut]
+                try:
+                    results[i] = fut.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                if on_result is not None:
+                    on_result(i, results[i])
+        if error is not None:
+            raise error
+        return results
+
 class HeuristicLLM(LLMClient):
+    provider = "heuristic"
+
     def generate(self, prompt: str) -> LLMResponse:
         return LLMResponse(text="")
 
 class OpenAICompatibleClient(LLMClient):
-    def __init__(self, *, api_key: str, base_url: str, model: str):
+    provider = "openai"
+    system_prompt = SYSTEM_PROMPT
+
+    def __init__(
+        self,
+        *,
+        api_key: str,
+        base_url: str,
+        model: str,
+        pool_size: int = 10,
+        connect_timeout: float = 10.0,
+        read_timeout: float = 120.0,
+    ):
         self.api_key = api_key
         self.base_url = base_url.rstrip("/")
         self.model = model
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = make_session(pool_size=pool_size)
 
     def generate(self, prompt: str) -> LLMResponse:
         url = f"{self.base_url}/chat/completions"
@@ -29,18 +227,38 @@ class OpenAICompatibleClient(LLMClient):
         payload = {
             "model": self.model,
             "messages": [
-                {"role": "system", "content": "You are a precise financial QA assistant. Follow the required output format strictly."},
+                {"role": "system", "content": self.system_prompt},
                 {"role": "user", "content": prompt},
             ],
-            "temperature": 0,
+            "temperature": self.temperature,
         }
-        r = requests.post(url, headers=headers, json=payload, timeout=120)
+        _conn_timing.connect_s = 0.0
+        t0 = time.perf_counter()
+        # stream=True returns as soon as the headers arrive, which gives time-to-first-byte
+        r = self.session.post(url, headers=headers, json=payload, timeout=self.timeout, stream=True)
+        ttfb = time.perf_counter() - t0
+        try:
+            body = r.content
+        finally:
+            r.close()
+        total = time.perf_counter() - t0
         r.raise_for_status()
-        data = r.json()
+        data = json.loads(body)
         text = data["choices"][0]["message"]["content"]
-        return LLMResponse(text=text)
+        usage = data.get("usage") or {}
+        return LLMResponse(
+            text=text, connect_s=_conn_timing.connect_s, ttfb_s=ttfb, total_s=total,
+            prompt_tokens=usage.get("prompt_tokens"), completion_tokens=usage.get("completion_tokens"),
+        )
+
+    def cache_identity(self) -> dict:
+        # the same model name can mean different models behind different endpoints
+        return {**super().cache_identity(), "base_url": self.base_url}
 
 class GeminiClient(LLMClient):
+    provider = "gemini"
+    max_output_tokens = 256
+
     def __init__(self, *, api_key: str, model: str):
         self.api_key = api_key
         self.model = model
@@ -53,8 +271,18 @@ class GeminiClient(LLMClient):
         self._model = genai.GenerativeModel(model)
 
     def generate(self, prompt: str) -> LLMResponse:
+        t0 = time.perf_counter()
         resp = self._model.generate_content(
             prompt,
-            generation_config={"temperature": 0, "max_output_tokens": 256},
+            generation_config={"temperature": self.temperature, "max_output_tokens": self.max_output_tokens},
+        )
+        usage = getattr(resp, "usage_metadata", None)
+        return LLMResponse(
+            text=getattr(resp, "text", "") or "",
+            total_s=time.perf_counter() - t0,
+            prompt_tokens=getattr(usage, "prompt_token_count", None),
+            completion_tokens=getattr(usage, "candidates_token_count", None),
         )
-        return LLMResponse(text=getattr(resp, "text", "") or "")
+
+    def cache_identity(self) -> dict:
+        return {**super().cache_identity(), "max_output_tokens": self.max_output_tokens}
@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Optional
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from .llm import LLMClient, LLMResponse, RateLimiter
+
+CACHE_MODES = ("use", "refresh", "off")
+
+# SQLite-backed response cache keyed by sha256 of (provider, model, temperature, system prompt, ...)
+# plus the prompt. Least recently used rows are evicted once the stored text exceeds max_bytes.
+class LLMResponseCache:
+    def __init__(self, path: Path, *, max_bytes: int = 512 * 1024 * 1024):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, provider TEXT, model TEXT, text TEXT,"
+            " size INTEGER, created REAL, last_used REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used)")
+        self._db.commit()
+        self._size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(identity: dict, prompt: str) -> str:
+        h = hashlib.sha256(json.dumps(identity, sort_keys=True).encode("utf-8"))
+        h.update(b"\0")
+        h.update(prompt.encode("utf-8"))
+        return h.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._db.execute("SELECT text FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            return row[0]
+
+    def put(self, key: str, identity: dict, text: str) -> None:
+        size = len(text.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            old = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, provider, model, text, size, created, last_used) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, identity.get("provider"), identity.get("model"), text, size, now, now),
+            )
+            self._size += size - (old[0] if old else 0)
+            self._evict()
+            self._db.commit()
+
+    def _evict(self) -> None:
+        while self._size > self.max_bytes:
+            rows = self._db.execute("SELECT key, size FROM responses ORDER BY last_used LIMIT 256").fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if self._size <= self.max_bytes:
+                    break
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._size -= size
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+class CachedLLM(LLMClient):
+    # wraps any LLMClient; "refresh" ignores stored answers but still writes new ones
+    def __init__(self, inner: LLMClient, cache: LLMResponseCache, *, mode: str = "use"):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"LLM_CACHE must be one of {CACHE_MODES}, got {mode!r}")
+        self.inner = inner
+        self.cache = cache
+        self.mode = mode
+        self.provider = inner.provider
+        self.model = inner.model
+        self.temperature = inner.temperature
+        self.system_prompt = inner.system_prompt
+
+    def cache_identity(self) -> dict:
+        return self.inner.cache_identity()
+
+    def _lookup(self, prompt: str) -> tuple[str, Optional[LLMResponse]]:
+        key = LLMResponseCache.make_key(self.inner.cache_identity(), prompt)
+        if self.mode == "use":
+            text = self.cache.get(key)
+            if text is not None:
+                return key, LLMResponse(text=text, cached=True)
+        return key, None
+
+    def _store(self, key: str, resp: LLMResponse) -> LLMResponse:
+        if self.mode != "off":
+            self.cache.put(key, self.inner.cache_identity(), resp.text)
+        return resp
+
+    def generate(self, prompt: str) -> LLMResponse:
+        key, hit = self._lookup(prompt)
+        if hit is not None:
+            return hit
+        return self._store(key, self.inner.generate(prompt))
+
+    def generate_with_retry(self, prompt: str, *, rate_limiter: RateLimiter | None = None, **kwargs) -> LLMResponse:
+        # cache hits must not consume rate-limit tokens, so look up before delegating
+        key, hit = self._lookup(prompt)
+        if hit is not None:
+            return hit
+        return self._store(key, self.inner.generate_with_retry(prompt, rate_limiter=rate_limiter, **kwargs))
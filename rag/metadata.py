@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+from collections import Counter
+from typing import Any, Dict, List, Optional, Sequence
+import re
+
+# pages at the start of a report that are scanned for company name and year
+METADATA_PAGES = 3
+
+_LEGAL_SUFFIX = (
+    r"Inc\.?|Incorporated|Corporation|Corp\.?|Company|Co\.|plc|PLC|p\.l\.c\.|Ltd\.?|Limited|LLC|L\.P\.|LP"
+    r"|AG|SE|SA|S\.A\.|N\.V\.|NV|B\.V\.|ASA|AB|A/S|Oyj|S\.p\.A\.|GmbH|Group|Holdings?|Bancorp|Trust"
+)
+# capitalised words on one line; no dots inside names so "... USD. Acme Inc" does not glue together
+_NAME_WORD = r"(?:[A-Z][\w&'\-]*|&|of|and|the)"
+_COMPANY = re.compile(rf"\b([A-Z][\w&'\-]*(?:[ \t]+{_NAME_WORD}){{0,5}}?),?[ \t]+({_LEGAL_SUFFIX})(?=[\s,;:)]|$)")
+_YEAR = re.compile(r"\b(19[89]\d|20[0-4]\d)\b")
+_REPORT_YEAR = re.compile(
+    r"(?i)(?:annual\s+report|fiscal\s+(?:year)?|financial\s+year|year\s+ended[^.]{0,30}?|form\s+10-k)\D{0,20}((?:19|20)\d\d)"
+)
+_STRIP_SUFFIX = re.compile(rf"(?i)[\s,]+(?:{_LEGAL_SUFFIX})\s*$")
+_QUOTED = re.compile(r"[\"“”]([^\"“”]{2,120})[\"“”]")
+
+def normalize_company(name: str) -> str:
+    n = name.strip()
+    # drop trailing legal forms repeatedly ("Foo Holdings Inc." -> "foo")
+    while True:
+        stripped = _STRIP_SUFFIX.sub("", n)
+        if stripped == n or not stripped:
+            break
+        n = stripped
+    n = re.sub(r"[^\w&]+", " ", n.lower())
+    return " ".join(n.split())
+
+def extract_pdf_metadata(first_pages: Sequence[str]) -> Dict[str, Any]:
+    text = "\n".join(first_pages)
+
+    companies = Counter()
+    for m in _COMPANY.finditer(text):
+        full = f"{m.group(1)} {m.group(2)}".strip()
+        if normalize_company(full):
+            companies[full] += 1
+    company = companies.most_common(1)[0][0] if companies else None
+
+    # explicit "annual report 2022" style mentions beat plain year counts
+    years = Counter(int(y) for y in _REPORT_YEAR.findall(text))
+    if not years:
+        years = Counter(int(y) for y in _YEAR.findall(text))
+    year = years.most_common(1)[0][0] if years else None
+
+    return {"company": company, "year": year}
+
+def _tokens(s: str) -> set:
+    return set(s.split())
+
+def _contains(outer: str, inner: str) -> bool:
+    # whole words only: "ally" is not in "tally bank"
+    return f" {inner} " in f" {outer} "
+
+def _longest(matched: Dict[str, str]) -> List[str]:
+    # a name that is part of another matched name ("alder" in "alder energy") was matched through it
+    return [sha for sha, n in matched.items() if not any(m != n and _contains(m, n) for m in matched.values())]
+
+def route_question(question: str, pdfs: Dict[str, Dict[str, Any]]) -> Optional[List[str]]:
+    # pdf_sha1s of the reports whose company the question names; None = no confident match
+    names = {sha: normalize_company(meta["company"]) for sha, meta in pdfs.items() if meta.get("company")}
+    names = {sha: n for sha, n in names.items() if n}
+    if not names:
+        return None
+
+    quoted = [normalize_company(q) for q in _QUOTED.findall(question)]
+    quoted = [q for q in quoted if q]
+    matched: List[str] = []
+    if quoted:
+        for q in quoted:
+            # an exact name wins over the looser matches
+            exact = [sha for sha, n in names.items() if n == q]
+            if exact:
+                matched.extend(exact)
+                continue
+            qt = _tokens(q)
+            close = {
+                sha: n for sha, n in names.items()
+                if len(qt & _tokens(n)) / len(qt | _tokens(n)) >= 0.6 or (len(q) > 3 and (_contains(n, q) or _contains(q, n)))
+            }
+            # names inside the quoted one: keep the most specific; a short quote inside several names
+            # ("alder" -> "alder energy", "alder mining") is ambiguous and routes to all of them
+            matched.extend(_longest(close) if all(_contains(q, n) for n in close.values()) else close)
+    else:
+        qn = normalize_company(question)
+        matched = _longest({sha: n for sha, n in names.items() if len(n) > 3 and _contains(qn, n)})
+
+    return sorted(set(matched)) or None
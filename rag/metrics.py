@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+from contextlib import ContextDecorator, contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+import bisect
+import cProfile
+import json
+import random
+import threading
+import time
+import numpy as np
+
+# histogram bucket upper bounds in milliseconds; the last bucket is open-ended
+HISTOGRAM_BOUNDS_MS = (0.1, 0.3, 1, 3, 10, 30, 100, 300, 1000, 3000, 10000, 30000)
+
+class _Timer(ContextDecorator):
+    # `with timer("x"):` or `@timer("x")`; a fresh instance per use so it is safe across threads
+    def __init__(self, metrics: "Metrics", name: str, trace: Optional[str]):
+        self.metrics = metrics
+        self.name = name
+        self.trace = trace
+        self.seconds = 0.0
+
+    def _recreate_cm(self):
+        return _Timer(self.metrics, self.name, self.trace)
+
+    def __enter__(self) -> "_Timer":
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        self.seconds = time.perf_counter() - self._t0
+        self.metrics.observe(self.name, self.seconds, trace=self.trace)
+        return False
+
+class _Stage:
+    # count, total, max and histogram are exact; percentiles come from `samples`, which holds every
+    # observation, or a uniform random reservoir of at most `cap` of them
+    __slots__ = ("count", "total", "max", "buckets", "samples")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+        self.samples: List[float] = []
+
+    def add(self, seconds: float, cap: Optional[int]) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.buckets[bisect.bisect_left(HISTOGRAM_BOUNDS_MS, seconds * 1000.0)] += 1
+        if cap is None or len(self.samples) < cap:
+            self.samples.append(seconds)
+        else:
+            # reservoir sampling (algorithm R): every observation so far is kept with probability cap / count
+            j = random.randrange(self.count)
+            if j < cap:
+                self.samples[j] = seconds
+
+# Process-wide registry of stage timings (seconds), counters and per-question traces. By default every
+# stage keeps its raw samples, so the summary of a batch run has exact percentiles besides the
+# fixed-bucket histogram; a long-running process (rag/server.py) sets max_samples, which bounds the
+# memory per stage and makes percentiles approximate. Worker processes hand their registry back with
+# snapshot() and the parent merge()s it.
+class Metrics:
+    def __init__(self, *, enabled: bool = True, max_samples: Optional[int] = None):
+        self.enabled = enabled
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._stages: Dict[str, _Stage] = {}
+        self._counters: Dict[str, float] = {}
+        self._traces: Dict[str, Dict[str, Any]] = {}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stages, self._counters, self._traces = {}, {}, {}
+
+    def _trace(self, key: str) -> Dict[str, Any]:
+        return self._traces.setdefault(key, {"stages": {}, "counters": {}})
+
+    def _stage(self, name: str) -> _Stage:
+        stage = self._stages.get(name)
+        if stage is None:
+            stage = self._stages[name] = _Stage()
+        return stage
+
+    def observe(self, name: str, seconds: float, *, trace: Optional[str] = None) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._stage(name).add(seconds, self.max_samples)
+            if trace is not None:
+                stages = self._trace(trace)["stages"]
+                stages[name] = stages.get(name, 0.0) + seconds
+
+    def count(self, name: str, n: float = 1, *, trace: Optional[str] = None) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+            if trace is not None:
+                counters = self._trace(trace)["counters"]
+                counters[name] = counters.get(name, 0) + n
+
+    def annotate(self, trace: str, **fields: Any) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self._trace(trace).update(fields)
+
+    def timer(self, name: str, *, trace: Optional[str] = None) -> _Timer:
+        return _Timer(self, name, trace)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"samples": {k: list(v.samples) for k, v in self._stages.items()}, "counters": dict(self._counters)}
+
+    def merge(self, snapshot: Dict[str, Any]) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            for k, v in snapshot.get("samples", {}).items():
+                stage = self._stage(k)
+                for seconds in v:
+                    stage.add(seconds, self.max_samples)
+            for k, v in snapshot.get("counters", {}).items():
+                self._counters[k] = self._counters.get(k, 0) + v
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = {
+                k: (v.count, v.total, v.max, list(v.buckets), np.asarray(v.samples, dtype="float64") * 1000.0)
+                for k, v in self._stages.items()
+            }
+            counters = dict(self._counters)
+            traces = {k: dict(v) for k, v in self._traces.items()}
+        labels = [f"<={b}" for b in HISTOGRAM_BOUNDS_MS] + [f">{HISTOGRAM_BOUNDS_MS[-1]}"]
+        stages = {}
+        for name, (count, total, peak, buckets, ms) in sorted(stats.items()):
+            stages[name] = {
+                "count": count,
+                "total_s": total,
+                "mean_ms": total * 1000.0 / count,
+                "p50_ms": float(np.percentile(ms, 50)),
+                "p95_ms": float(np.percentile(ms, 95)),
+                "max_ms": peak * 1000.0,
+                "histogram_ms": {label: c for label, c in zip(labels, buckets) if c},
+            }
+        return {"stages": stages, "counters": counters, "questions": traces}
+
+    def write_json(self, path: Path, **meta: Any) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({"meta": meta, **self.summary()}, ensure_ascii=False, indent=2), encoding="utf-8")
+
+METRICS = Metrics()
+
+def timer(name: str, *, trace: Optional[str] = None) -> _Timer:
+    return METRICS.timer(name, trace=trace)
+
+def observe(name: str, seconds: float, *, trace: Optional[str] = None) -> None:
+    METRICS.observe(name, seconds, trace=trace)
+
+def count(name: str, n: float = 1, *, trace: Optional[str] = None) -> None:
+    METRICS.count(name, n, trace=trace)
+
+def annotate(trace: str, **fields: Any) -> None:
+    METRICS.annotate(trace, **fields)
+
+PROFILERS = ("", "cprofile", "pyinstrument")
+
+@contextmanager
+def profile(kind: str, out_path: Path) -> Iterator[None]:
+    # whole-run profile: cProfile stats (<out_path>.prof, view with snakeviz/pstats) or pyinstrument HTML
+    if not kind:
+        yield
+        return
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    if kind == "cprofile":
+        prof = cProfile.Profile()
+        prof.enable()
+        try:
+            yield
+        finally:
+            prof.disable()
+            prof.dump_stats(str(out_path.with_suffix(".prof")))
+        return
+    if kind == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except Exception as e:
+            raise RuntimeError("Install pyinstrument to use PROFILE=pyinstrument: pip install pyinstrument") from e
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            out_path.with_suffix(".html").write_text(profiler.output_html(), encoding="utf-8")
+        return
+    raise ValueError(f"PROFILE must be one of {PROFILERS}, got {kind!r}")
@@ -0,0 +1,163 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Dict, List, Sequence
+import hashlib
+import inspect
+import json
+import re
+import shutil
+import numpy as np
+
+# EMBED_BACKEND=onnx | onnx-int8: the sentence-transformers model runs as an exported ONNX graph on
+# onnxruntime. The first load exports it with torch (and, for onnx-int8, quantizes the weights to int8
+# with onnxruntime's dynamic quantization); later loads need neither torch nor sentence-transformers:
+#   <EMBED_ONNX_DIR>/<model>-<backend>/model.onnx      transformer: input ids -> token embeddings
+#   <EMBED_ONNX_DIR>/<model>-<backend>/tokenizer.json  the model's fast tokenizer
+#   <EMBED_ONNX_DIR>/<model>-<backend>/embedder.json   pooling, normalization, max_seq_length, dim
+# Pooling and normalization are done here in numpy. Only models made of Transformer + Pooling
+# (mean | cls | max) + optional Normalize are supported, which covers the usual sentence encoders.
+_POOLING = ("mean", "cls", "max")
+_INPUTS = ("input_ids", "attention_mask", "token_type_ids")
+
+def _ort():
+    try:
+        import onnxruntime
+    except Exception as e:
+        raise RuntimeError("Install onnxruntime to use EMBED_BACKEND=onnx / onnx-int8: pip install onnxruntime") from e
+    return onnxruntime
+
+def export_dir(root: Path, name: str, backend: str) -> Path:
+    slug = re.sub(r"[^A-Za-z0-9._-]+", "_", name).strip("_")
+    return root / f"{slug}-{hashlib.sha1(name.encode('utf-8')).hexdigest()[:8]}-{backend}"
+
+def export_onnx(name: str, out_dir: Path, *, quantize: bool) -> None:
+    import torch
+    from sentence_transformers import SentenceTransformer, models
+
+    st = SentenceTransformer(name, device="cpu")
+    mods = list(st)
+    if (
+        not 2 <= len(mods) <= 3 or not isinstance(mods[0], models.Transformer) or not isinstance(mods[1], models.Pooling)
+        or (len(mods) == 3 and not isinstance(mods[2], models.Normalize))
+    ):
+        raise RuntimeError(f"{name}: ONNX export supports Transformer + Pooling [+ Normalize] models, got {[type(m).__name__ for m in mods]}")
+    transformer, pooling = mods[0], mods[1]
+    if pooling.get_pooling_mode_str() not in _POOLING:
+        raise RuntimeError(f"{name}: ONNX export supports {'/'.join(_POOLING)} pooling, got {pooling.get_pooling_mode_str()}")
+    if not getattr(transformer.tokenizer, "is_fast", False):
+        raise RuntimeError(f"{name}: ONNX export needs a fast (tokenizers) tokenizer")
+
+    tmp = out_dir.with_name(out_dir.name + ".tmp")
+    if tmp.exists():
+        shutil.rmtree(tmp)
+    tmp.mkdir(parents=True)
+    transformer.tokenizer.backend_tokenizer.save(str(tmp / "tokenizer.json"))
+
+    sample = transformer.tokenizer(["an example sentence", "another one"], padding=True, return_tensors="pt")
+    inputs = [k for k in _INPUTS if k in sample]
+
+    class TokenEmbeddings(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, *args):
+            return self.model(**dict(zip(inputs, args)), return_dict=True).last_hidden_state
+
+    axes: Dict[str, Dict[int, str]] = {k: {0: "batch", 1: "seq"} for k in inputs + ["token_embeddings"]}
+    # the TorchScript exporter needs no extra packages; newer torch defaults to the dynamo one
+    legacy = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+    fp32 = tmp / ("model_fp32.onnx" if quantize else "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            TokenEmbeddings(transformer.auto_model).eval(), tuple(sample[k] for k in inputs), str(fp32),
+            input_names=inputs, output_names=["token_embeddings"], dynamic_axes=axes, opset_version=14, **legacy,
+        )
+    if quantize:
+        _ort()
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        quantize_dynamic(str(fp32), str(tmp / "model.onnx"), weight_type=QuantType.QInt8)
+        fp32.unlink()
+
+    meta = {
+        "model": name,
+        "pooling": pooling.get_pooling_mode_str(),
+        "normalize": len(mods) == 3,
+        "max_seq_length": int(st.max_seq_length),
+        "do_lower_case": bool(transformer.do_lower_case),
+        "pad_id": int(transformer.tokenizer.pad_token_id or 0),
+        "pad_token": transformer.tokenizer.pad_token or "[PAD]",
+        "dim": int(st.get_sentence_embedding_dimension()),
+        "inputs": inputs,
+        "quantized": quantize,
+    }
+    (tmp / "embedder.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    if out_dir.exists():
+        shutil.rmtree(out_dir)
+    tmp.rename(out_dir)
+
+class OnnxEmbedder:
+    # the subset of SentenceTransformer used by the index, retrieval and benchmarks
+    def __init__(self, model_dir: Path):
+        ort = _ort()
+        from tokenizers import Tokenizer
+
+        meta = json.loads((model_dir / "embedder.json").read_text(encoding="utf-8"))
+        self.meta = meta
+        self.max_seq_length = meta["max_seq_length"]
+        self._dim = meta["dim"]
+        self._inputs = meta["inputs"]
+        self.tokenizer = Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.max_seq_length)
+        self.tokenizer.enable_padding(pad_id=meta["pad_id"], pad_token=meta["pad_token"])
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(str(model_dir / "model.onnx"), opts, providers=["CPUExecutionProvider"])
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self._dim
+
+    def _pool(self, tokens: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        pooling = self.meta["pooling"]
+        if pooling == "cls":
+            return tokens[:, 0]
+        m = mask[:, :, None].astype("float32")
+        if pooling == "max":
+            return np.where(m > 0, tokens, -1e9).max(axis=1)
+        return (tokens * m).sum(axis=1) / np.maximum(m.sum(axis=1), 1e-9)
+
+    def encode(
+        self, sentences: str | Sequence[str], batch_size: int = 32, show_progress_bar: bool = False,
+        normalize_embeddings: bool = False, **kwargs,
+    ) -> np.ndarray:
+        single = isinstance(sentences, str)
+        texts: List[str] = [str(s).strip() for s in ([sentences] if single else sentences)]
+        if self.meta["do_lower_case"]:
+            texts = [t.lower() for t in texts]
+        out = np.zeros((len(texts), self._dim), dtype="float32")
+        # longest first, as sentence-transformers does, so batches pad to similar lengths
+        order = np.argsort([-len(t) for t in texts], kind="stable")
+        for start in range(0, len(texts), batch_size):
+            rows = order[start:start + batch_size]
+            enc = self.tokenizer.encode_batch([texts[i] for i in rows])
+            mask = np.asarray([e.attention_mask for e in enc], dtype="int64")
+            cols = {
+                "input_ids": np.asarray([e.ids for e in enc], dtype="int64"),
+                "attention_mask": mask,
+                "token_type_ids": np.asarray([e.type_ids for e in enc], dtype="int64"),
+            }
+            tokens = self.session.run(None, {k: cols[k] for k in self._inputs})[0]
+            out[rows] = self._pool(tokens, mask)
+        if normalize_embeddings or self.meta["normalize"]:
+            norms = np.linalg.norm(out, axis=1, keepdims=True)
+            out /= np.maximum(norms, 1e-12)
+        return out[0] if single else out
+
+def load_onnx_embedder(name: str, root: Path, *, backend: str) -> OnnxEmbedder:
+    model_dir = export_dir(root, name, backend)
+    if not (model_dir / "embedder.json").exists():
+        _ort()
+        export_onnx(name, model_dir, quantize=backend == "onnx-int8")
+    return OnnxEmbedder(model_dir)
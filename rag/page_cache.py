@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+from pathlib import Path
+from typing import IO, Iterator
+import gzip
+import io
+import json
+
+from .pdf import EXTRACTOR_VERSION, Page
+
+CODECS = ("gzip", "zstd")
+_SUFFIX = {"gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+
+def _zstd():
+    try:
+        import zstandard
+    except Exception as e:
+        raise RuntimeError("Install zstandard to use PAGE_CACHE_CODEC=zstd: pip install zstandard") from e
+    return zstandard
+
+# Extracted page text, one compressed JSONL file per PDF: <root>/<pdf_sha1>.v<EXTRACTOR_VERSION>.jsonl.gz
+# (or .zst), one {"i": page_index, "t": text} line per page in page order. Files are written to a
+# temp name and renamed when the whole PDF has been extracted, so a present file is always complete.
+# Reads decompress line by line; memory does not grow with the size of the report.
+class PageTextCache:
+    def __init__(self, root: Path, *, codec: str = "gzip"):
+        if codec not in CODECS:
+            raise ValueError(f"PAGE_CACHE_CODEC must be one of {CODECS}, got {codec!r}")
+        if codec == "zstd":
+            _zstd()
+        root.mkdir(parents=True, exist_ok=True)
+        self.root = root
+        self.codec = codec
+
+    def _path(self, pdf_sha1: str, codec: str) -> Path:
+        return self.root / f"{pdf_sha1}.v{EXTRACTOR_VERSION}{_SUFFIX[codec]}"
+
+    def _find(self, pdf_sha1: str) -> tuple | None:
+        # a file written under the other codec is still readable
+        for codec in (self.codec, *(c for c in CODECS if c != self.codec)):
+            path = self._path(pdf_sha1, codec)
+            if path.exists():
+                return path, codec
+        return None
+
+    def has(self, pdf_sha1: str) -> bool:
+        return self._find(pdf_sha1) is not None
+
+    @staticmethod
+    def _open_read(path: Path, codec: str) -> IO[str]:
+        if codec == "zstd":
+            raw = _zstd().ZstdDecompressor().stream_reader(path.open("rb"), closefd=True)
+            return io.TextIOWrapper(raw, encoding="utf-8")
+        return gzip.open(path, "rt", encoding="utf-8")
+
+    def iter_pages(self, pdf_sha1: str, pdf_path: Path) -> Iterator[Page]:
+        path, codec = self._find(pdf_sha1)
+        with self._open_read(path, codec) as f:
+            for line in f:
+                row = json.loads(line)
+                yield Page(pdf_path=pdf_path, pdf_sha1=pdf_sha1, page_index=row["i"], text=row["t"])
+
+    def writer(self, pdf_sha1: str) -> "PageTextWriter":
+        return PageTextWriter(self._path(pdf_sha1, self.codec), self.codec)
+
+class PageTextWriter:
+    def __init__(self, path: Path, codec: str):
+        self.path = path
+        self._tmp = path.with_name(path.name + ".tmp")
+        if codec == "zstd":
+            raw = _zstd().ZstdCompressor(level=3).stream_writer(self._tmp.open("wb"), closefd=True)
+            self._f: IO[str] = io.TextIOWrapper(raw, encoding="utf-8")
+        else:
+            self._f = gzip.open(self._tmp, "wt", encoding="utf-8", compresslevel=6)
+
+    def write(self, page: Page) -> None:
+        self._f.write(json.dumps({"i": page.page_index, "t": page.text}, ensure_ascii=False) + "\n")
+
+    def commit(self) -> None:
+        self._f.close()
+        self._tmp.replace(self.path)
+
+    def abort(self) -> None:
+        self._f.close()
+        self._tmp.unlink(missing_ok=True)
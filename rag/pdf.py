@@ -1,10 +1,20 @@
 from __future__ import annotations
 
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
 import hashlib
-import fitz  # PyMuPDF
-from typing import Iterable, Iterator
+import time
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple, TYPE_CHECKING
+
+from .metrics import METRICS
+
+if TYPE_CHECKING:
+    from .page_cache import PageTextCache
+
+# bump whenever _page_text changes, so cached page text (rag/page_cache.py) is re-extracted
+EXTRACTOR_VERSION = 1
 
 @dataclass(frozen=True)
 class Page:
@@ -20,26 +30,142 @@ def sha1_file(path: Path) -> str:
             h.update(chunk)
     return h.hexdigest()
 
-def iter_pdf_pages(pdf_path: Path) -> Iterator[Page]:
+def pdf_sha1_for(pdf_path: Path) -> str:
     # If filename looks like sha1, trust it to save time; otherwise compute.
     name = pdf_path.stem.lower()
     if len(name) == 40 and all(c in "0123456789abcdef" for c in name):
-        pdf_sha1 = name
-    else:
-        pdf_sha1 = sha1_file(pdf_path)
+        return name
+    return sha1_file(pdf_path)
+
+def _page_text(page) -> str:
+    # text extraction: standard mode
+    text = page.get_text("text") or ""
+    # normalize whitespace slightly
+    return " ".join(text.replace("\u00a0", " ").split())
+
+def iter_pdf_pages(pdf_path: Path, *, start: int = 0, stop: Optional[int] = None, pdf_sha1: Optional[str] = None) -> Iterator[Page]:
+    if pdf_sha1 is None:
+        pdf_sha1 = pdf_sha1_for(pdf_path)
 
+    import fitz  # PyMuPDF
+
+    t0 = time.perf_counter()
     doc = fitz.open(pdf_path)
+    METRICS.observe("pdf.open", time.perf_counter() - t0)
     try:
-        for i in range(doc.page_count):
-            page = doc.load_page(i)
-            # text extraction: standard mode
-            text = page.get_text("text") or ""
-            # normalize whitespace slightly
-            text = " ".join(text.replace("\u00a0", " ").split())
+        end = doc.page_count if stop is None else min(stop, doc.page_count)
+        for i in range(start, end):
+            t0 = time.perf_counter()
+            text = _page_text(doc.load_page(i))
+            METRICS.observe("pdf.extract_page", time.perf_counter() - t0)
             yield Page(pdf_path=pdf_path, pdf_sha1=pdf_sha1, page_index=i, text=text)
     finally:
         doc.close()
 
-def iter_all_pages(pdf_dir: Path) -> Iterable[Page]:
-    for pdf_path in sorted(pdf_dir.glob("*.pdf")):
-        yield from iter_pdf_pages(pdf_path)
+# (pdf_path, pdf_sha1 or None, start, stop or None)
+_Task = Tuple[Path, Optional[str], int, Optional[int]]
+
+def _extract_task(task: _Task) -> Tuple[List[Page], dict]:
+    # runs in a worker process: its timings travel back with the pages and are merged by the parent
+    pdf_path, pdf_sha1, start, stop = task
+    METRICS.reset()
+    pages = list(iter_pdf_pages(pdf_path, start=start, stop=stop, pdf_sha1=pdf_sha1))
+    return pages, METRICS.snapshot()
+
+def _plan_tasks(pdf_paths: Sequence[Path], pages_per_task: int) -> Iterator[_Task]:
+    import fitz  # PyMuPDF
+
+    for pdf_path in pdf_paths:
+        if pages_per_task <= 0:
+            # one task per PDF; sha1 is computed inside the worker
+            yield (pdf_path, None, 0, None)
+            continue
+        doc = fitz.open(pdf_path)
+        try:
+            n = doc.page_count
+        finally:
+            doc.close()
+        if n <= pages_per_task:
+            yield (pdf_path, None, 0, None)
+            continue
+        # big PDF: split into page ranges, hash once here so workers agree on sha1
+        pdf_sha1 = pdf_sha1_for(pdf_path)
+        for start in range(0, n, pages_per_task):
+            yield (pdf_path, pdf_sha1, start, min(n, start + pages_per_task))
+
+def iter_pages(
+    pdf_paths: Sequence[Path],
+    *,
+    workers: int = 1,
+    pages_per_task: int = 0,
+    cache: "PageTextCache | None" = None,
+) -> Iterator[Page]:
+    if cache is not None:
+        yield from _iter_pages_cached(pdf_paths, cache, workers=workers, pages_per_task=pages_per_task)
+        return
+    if workers <= 1:
+        for pdf_path in pdf_paths:
+            yield from iter_pdf_pages(pdf_path)
+        return
+
+    # results are yielded in submission order; at most `2 * workers` tasks are in flight,
+    # so memory stays bounded even if the consumer (embedding) is slower than extraction
+    def collect(fut) -> List[Page]:
+        pages, timings = fut.result()
+        METRICS.merge(timings)
+        return pages
+
+    import multiprocessing as mp
+
+    tasks = _plan_tasks(pdf_paths, pages_per_task)
+    # spawn, not fork: this usually runs on the ingest pipeline's extract thread, and forking a
+    # process that already has threads (tqdm, torch, faiss) can deadlock the children
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp.get_context("spawn")) as ex:
+        pending = deque()
+        for task in tasks:
+            pending.append(ex.submit(_extract_task, task))
+            if len(pending) >= 2 * workers:
+                yield from collect(pending.popleft())
+        while pending:
+            yield from collect(pending.popleft())
+
+def _iter_pages_cached(pdf_paths: Sequence[Path], cache: "PageTextCache", *, workers: int, pages_per_task: int) -> Iterator[Page]:
+    # cached PDFs are streamed from the cache without opening them; the rest are extracted and written
+    # to the cache as their pages go by. Pages come out in input order however warm the cache is, so
+    # the chunk ids of an index build do not depend on it
+    sha1s = [pdf_sha1_for(p) for p in pdf_paths]
+    hits = [cache.has(s) for s in sha1s]
+    extracted = iter_pages([p for p, hit in zip(pdf_paths, hits) if not hit], workers=workers, pages_per_task=pages_per_task)
+    # pages of one PDF arrive contiguously and in order; `ahead` is the first page of the next extracted PDF
+    ahead: Optional[Page] = None
+    writer = None
+    try:
+        for pdf_path, pdf_sha1, hit in zip(pdf_paths, sha1s, hits):
+            if hit:
+                METRICS.count("pdf.page_cache_hits")
+                yield from cache.iter_pages(pdf_sha1, pdf_path)
+                continue
+            writer = cache.writer(pdf_sha1)
+            while True:
+                page = ahead if ahead is not None else next(extracted, None)
+                ahead = None
+                if page is None:
+                    break
+                if page.pdf_path != pdf_path:
+                    ahead = page
+                    break
+                writer.write(page)
+                yield page
+            writer.commit()
+            writer = None
+    finally:
+        # consumer stopped early or extraction failed: never leave a partial PDF behind
+        if writer is not None:
+            writer.abort()
+        extracted.close()
+
+def list_pdfs(pdf_dir: Path) -> List[Path]:
+    return sorted(pdf_dir.glob("*.pdf"))
+
+def iter_all_pages(pdf_dir: Path, *, workers: int = 1, pages_per_task: int = 0) -> Iterable[Page]:
+    yield from iter_pages(list_pdfs(pdf_dir), workers=workers, pages_per_task=pages_per_task)
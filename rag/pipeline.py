@@ -0,0 +1,128 @@
+from __future__ import annotations
+
+from typing import List, Sequence
+
+from .config import Settings
+from .index import IndexArtifacts
+from .retrieval import Retrieved, retrieve_many
+from .context import build_context
+from .tokens import load_tokenizer, tokenizer_for
+from .rerank import RerankScoreCache
+from .llm import GeminiClient, OpenAICompatibleClient, HeuristicLLM, LLMClient
+from .llm_cache import CachedLLM, LLMResponseCache
+from .facts import Fact, label_matches, metric_terms, question_year
+from .metadata import route_question
+from .answering import pick_references, sanitize_number
+from .submission import Answer, SourceReference
+
+# Question-answering steps shared by the batch CLI (main.py) and the resident server (rag/server.py).
+
+def get_llm(settings: Settings) -> LLMClient:
+    llm = _make_llm(settings)
+    if settings.generator == "heuristic" or settings.llm_cache == "off":
+        return llm
+    cache = LLMResponseCache(settings.llm_cache_path, max_bytes=settings.llm_cache_max_mb * 1024 * 1024)
+    return CachedLLM(llm, cache, mode=settings.llm_cache)
+
+def _make_llm(settings: Settings) -> LLMClient:
+    if settings.generator == "gemini":
+        if not settings.gemini_api_key:
+            raise RuntimeError("GENERATOR=gemini but GEMINI_API_KEY is not set")
+        return GeminiClient(api_key=settings.gemini_api_key, model=settings.gemini_model)
+    if settings.generator == "openai":
+        if not settings.openai_api_key:
+            raise RuntimeError("GENERATOR=openai but OPENAI_API_KEY is not set")
+        return OpenAICompatibleClient(
+            api_key=settings.openai_api_key,
+            base_url=settings.openai_base_url,
+            model=settings.openai_model,
+            pool_size=max(settings.llm_pool_size, settings.llm_concurrency),
+            connect_timeout=settings.llm_connect_timeout,
+            read_timeout=settings.llm_read_timeout,
+        )
+    return HeuristicLLM()
+
+def lookup_facts(settings: Settings, artifacts: IndexArtifacts, qtext: str, kind: str) -> List[Fact]:
+    if kind != "number" or artifacts.facts is None:
+        return []
+    # facts of other companies are never the answer, so routing applies even without FILTER_BY_COMPANY;
+    # a question that names no known company gets no facts unless there is only one report
+    pdf_sha1s = route_question(qtext, artifacts.pdfs)
+    if pdf_sha1s is None and len(artifacts.pdfs) > 1:
+        return []
+    return artifacts.facts.lookup(
+        qtext,
+        pdf_sha1s=pdf_sha1s,
+        year=question_year(qtext),
+        top_k=settings.fact_top_k,
+    )
+
+def question_context(settings: Settings, qtext: str, kind: str, retrieved: List[Retrieved], facts: Sequence[Fact] = ()) -> str:
+    # indexed figures first; the chunk context stays for anything the extractor missed
+    return build_context(
+        retrieved,
+        query=qtext,
+        tokenizer=load_tokenizer(tokenizer_for(settings)),
+        max_tokens=settings.max_context_tokens,
+        figures=[f.describe() for f in facts] if kind == "number" else (),
+        numbers=kind == "number",
+        max_chars=settings.max_context_chars,
+    )
+
+def make_answer(qtext: str, kind: str, value, retrieved: List[Retrieved], facts: Sequence[Fact] = ()) -> Answer:
+    # ===== FINAL SAFETY (ABSOLUTE MUST) =====
+    if kind == "boolean":
+        # по правилам: если нет упоминания -> False
+        if value in ("N/A", "NA", None, ""):
+            value = False
+        if isinstance(value, str):
+            v = value.strip().lower()
+            if v in ("yes", "true", "1"):
+                value = True
+            elif v in ("no", "false", "0"):
+                value = False
+            else:
+                value = False
+
+    if kind == "number":
+        value = sanitize_number(value, qtext)
+    # =======================================
+
+    backing = []
+    if kind == "number" and value != "N/A":
+        # a fact carrying the answer backs it; one whose label names the metric asked for wins
+        terms = metric_terms(qtext)
+        backing = sorted((f for f in facts if f.value == value), key=lambda f: not label_matches(f, terms))
+    refs = pick_references(retrieved, max_refs=2, facts=backing[:1])
+    return Answer(value=value, references=[SourceReference(**r) for r in refs], question_text=qtext, kind=kind)
+
+def retrieve_questions(
+    settings: Settings,
+    artifacts: IndexArtifacts,
+    queries: Sequence[str],
+    *,
+    embedder,
+    reranker=None,
+    rerank_cache: RerankScoreCache | None = None,
+) -> List[List[Retrieved]]:
+    return retrieve_many(
+        artifacts,
+        queries=queries,
+        embedder=embedder,
+        top_k=settings.top_k,
+        fetch_k=settings.fetch_k,
+        rerank=reranker is not None,
+        reranker=reranker,
+        batch_size=settings.query_batch_size,
+        mode=settings.retrieval_mode,
+        rrf_k=settings.rrf_k,
+        rerank_batch_size=settings.rerank_batch_size,
+        rerank_cache=rerank_cache,
+        rerank_min_score=settings.rerank_min_score,
+        filter_by_company=settings.filter_by_company,
+    )
+
+def make_rerank_cache(settings: Settings) -> RerankScoreCache | None:
+    if not (settings.rerank and settings.rerank_cache):
+        return None
+    return RerankScoreCache(settings.rerank_cache_path, settings.rerank_model)
@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+from dataclasses import replace
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, TYPE_CHECKING
+import hashlib
+import sqlite3
+import threading
+
+from .metrics import METRICS
+
+if TYPE_CHECKING:
+    from sentence_transformers import CrossEncoder
+    from .retrieval import Retrieved
+
+# Cross-encoder scores keyed by sha1(model, query, chunk text). Chunk text rather than chunk id is
+# hashed so that scores survive full index rebuilds, where ids are reassigned.
+class RerankScoreCache:
+    def __init__(self, path: Path, model_name: str):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.model_name = model_name
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS scores (key BLOB PRIMARY KEY, score REAL)")
+        self._db.commit()
+
+    def key(self, query: str, text: str) -> bytes:
+        h = hashlib.sha1(self.model_name.encode("utf-8"))
+        h.update(b"\0" + hashlib.sha1(query.encode("utf-8")).digest())
+        h.update(hashlib.sha1(text.encode("utf-8")).digest())
+        return h.digest()
+
+    def get_many(self, keys: Sequence[bytes]) -> Dict[bytes, float]:
+        out: Dict[bytes, float] = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                part = list(keys[i:i + 500])
+                marks = ",".join("?" * len(part))
+                out.update(self._db.execute(f"SELECT key, score FROM scores WHERE key IN ({marks})", part).fetchall())
+        return out
+
+    def put_many(self, items: Dict[bytes, float]) -> None:
+        with self._lock:
+            self._db.executemany("INSERT OR REPLACE INTO scores (key, score) VALUES (?, ?)", list(items.items()))
+            self._db.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+def rerank_many(
+    queries: Sequence[str],
+    candidates: Sequence[List["Retrieved"]],
+    *,
+    reranker: "CrossEncoder",
+    top_k: int,
+    batch_size: int = 64,
+    cache: RerankScoreCache | None = None,
+    min_score: Optional[float] = None,
+) -> List[List["Retrieved"]]:
+    # candidates whose dense similarity is below min_score skip the cross-encoder and keep their order
+    # after the reranked ones. The cutoff is on the dense score even in hybrid mode, where score is
+    # the RRF score; BM25-only hits have no dense score and are always reranked
+    todo = [
+        [r for r in cands if min_score is None or r.dense_score is None or r.dense_score >= min_score]
+        for cands in candidates
+    ]
+
+    keys = [[cache.key(q, r.chunk.text) for r in cands] for q, cands in zip(queries, todo)] if cache is not None else None
+    known: Dict[bytes, float] = cache.get_many([k for ks in keys for k in ks]) if keys else {}
+
+    # all cache misses of all questions go to the cross-encoder in one predict call
+    pairs = []
+    slots = []
+    for qi, (q, cands) in enumerate(zip(queries, todo)):
+        for ci, r in enumerate(cands):
+            if keys is not None and keys[qi][ci] in known:
+                continue
+            pairs.append((q, r.chunk.text))
+            slots.append((qi, ci))
+    scores: Dict[tuple, float] = {}
+    METRICS.count("rerank.cache_hits", len(known))
+    METRICS.count("rerank.pairs_scored", len(pairs))
+    if pairs:
+        with METRICS.timer("rerank.predict"):
+            predicted = reranker.predict(pairs, batch_size=batch_size, show_progress_bar=False)
+        scores = {slot: float(s) for slot, s in zip(slots, predicted)}
+        if cache is not None:
+            cache.put_many({keys[qi][ci]: s for (qi, ci), s in scores.items()})
+
+    out: List[List[Retrieved]] = []
+    for qi, (cands, selected) in enumerate(zip(candidates, todo)):
+        rescored = []
+        for ci, r in enumerate(selected):
+            s = scores[(qi, ci)] if (qi, ci) in scores else known[keys[qi][ci]]
+            rescored.append(replace(r, score=s))
+        # sort by rerank score desc
+        rescored.sort(key=lambda x: x.score, reverse=True)
+        chosen = {id(r) for r in selected}
+        rest = [r for r in cands if id(r) not in chosen]
+        out.append((rescored + rest)[:top_k])
+    return out
@@ -1,53 +1,115 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
-from typing import List, Tuple
-from sentence_transformers import SentenceTransformer, CrossEncoder
+from dataclasses import dataclass, field
+from typing import List, Sequence, Tuple, TYPE_CHECKING
+import numpy as np
 
-from .index import IndexArtifacts, search
+from .index import IndexArtifacts, search_many
 from .chunking import Chunk
+from .lexical import reciprocal_rank_fusion
+from .rerank import RerankScoreCache, rerank_many
+from .metadata import route_question
+from .metrics import METRICS
+
+if TYPE_CHECKING:
+    from sentence_transformers import CrossEncoder, SentenceTransformer
 
 @dataclass(frozen=True)
 class Retrieved:
     chunk: Chunk
     score: float
+    # first-stage dense similarity; equals score in dense mode, None for a hybrid hit found only by BM25
+    dense_score: float | None = None
+    # other pages of the same report whose near-duplicate chunks were folded into this one at indexing time
+    also_in: Tuple[int, ...] = ()
+    # precomputed (end offset, regex token count, has digit) per sentence of chunk.text (rag/sentences.py)
+    sentences: np.ndarray | None = field(default=None, compare=False, repr=False)
+
+def retrieve_many(
+    artifacts: IndexArtifacts,
+    *,
+    queries: Sequence[str],
+    embedder: "SentenceTransformer",
+    top_k: int,
+    fetch_k: int,
+    rerank: bool = False,
+    reranker: "CrossEncoder | None" = None,
+    batch_size: int = 64,
+    mode: str = "dense",
+    rrf_k: int = 60,
+    rerank_batch_size: int = 64,
+    rerank_cache: RerankScoreCache | None = None,
+    rerank_min_score: float | None = None,
+    filter_by_company: bool = False,
+) -> List[List[Retrieved]]:
+    # questions naming a known company only search that company's report(s)
+    pdf_filters = [route_question(q, artifacts.pdfs) for q in queries] if filter_by_company else None
+
+    # first-stage dense retrieval for all queries at once
+    firsts = search_many(artifacts, queries, model=embedder, top_k=fetch_k, batch_size=batch_size, pdf_filters=pdf_filters)
+    dense = [dict(first) for first in firsts]
+    if mode == "hybrid" and artifacts.bm25 is not None:
+        # exact-term hits from BM25 fused with the dense ranking; score becomes the RRF score
+        id_ranges = [artifacts.id_ranges(f) if f else None for f in pdf_filters] if pdf_filters else None
+        with METRICS.timer("search.bm25"):
+            lexical = artifacts.bm25.search_many(queries, fetch_k, id_ranges=id_ranges)
+        firsts = [reciprocal_rank_fusion([d, l], k=rrf_k)[:fetch_k] for d, l in zip(firsts, lexical)]
+    with METRICS.timer("search.load_chunks"):
+        aliases = artifacts.aliases
+        candidates: List[List[Retrieved]] = [
+            [
+                Retrieved(
+                    chunk=artifacts.chunks[i], score=s, dense_score=d.get(i), also_in=aliases.pages_of(i) if aliases else (),
+                    sentences=artifacts.chunks.sentences(i),
+                )
+                for i, s in first
+            ]
+            for first, d in zip(firsts, dense)
+        ]
+
+    if not rerank or reranker is None:
+        return [c[:top_k] for c in candidates]
+
+    return rerank_many(
+        queries,
+        candidates,
+        reranker=reranker,
+        top_k=top_k,
+        batch_size=rerank_batch_size,
+        cache=rerank_cache,
+        min_score=rerank_min_score,
+    )
 
 def retrieve(
     artifacts: IndexArtifacts,
     *,
     query: str,
-    embedder: SentenceTransformer,
+    embedder: "SentenceTransformer",
     top_k: int,
     fetch_k: int,
     rerank: bool = False,
-    reranker: CrossEncoder | None = None
+    reranker: "CrossEncoder | None" = None,
+    mode: str = "dense",
+    rrf_k: int = 60,
+    filter_by_company: bool = False,
 ) -> List[Retrieved]:
-    # first-stage dense retrieval
-    first = search(artifacts, query, model=embedder, top_k=fetch_k)
-    candidates: List[Retrieved] = [Retrieved(chunk=artifacts.chunks[i], score=s) for i, s in first]
-
-    if not rerank or reranker is None or not candidates:
-        return candidates[:top_k]
-
-    pairs = [(query, r.chunk.text) for r in candidates]
-    rr_scores = reranker.predict(pairs)
-    # sort by rerank score desc
-    reranked = sorted(
-        [Retrieved(chunk=r.chunk, score=float(rs)) for r, rs in zip(candidates, rr_scores)],
-        key=lambda x: x.score,
-        reverse=True,
-    )
-    return reranked[:top_k]
+    return retrieve_many(
+        artifacts,
+        queries=[query],
+        embedder=embedder,
+        top_k=top_k,
+        fetch_k=fetch_k,
+        rerank=rerank,
+        reranker=reranker,
+        mode=mode,
+        rrf_k=rrf_k,
+        filter_by_company=filter_by_company,
+    )[0]
 
 def build_context(retrieved: List[Retrieved], *, max_chars: int) -> str:
-    parts = []
-    total = 0
-    for r in retrieved:
-        header = f"[pdf_sha1={r.chunk.pdf_sha1} page_index={r.chunk.page_index}]\n"
-        txt = r.chunk.text.strip()
-        block = header + txt + "\n"
-        if total + len(block) > max_chars:
-            break
-        parts.append(block)
-        total += len(block)
-    return "\n".join(parts)
+    # character-budgeted context kept for callers of the old API; see rag/context.py. Regex tokens
+    # are at least one character each, so the character cap is the binding one.
+    from .context import build_context as _build_context
+    from .tokens import RegexTokenizer
+
+    return _build_context(retrieved, query="", tokenizer=RegexTokenizer(), max_tokens=max_chars, max_chars=max_chars)
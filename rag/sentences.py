@@ -0,0 +1,53 @@
+from __future__ import annotations
+
+from typing import List
+import re
+import numpy as np
+
+from .tokens import RegexTokenizer
+
+# Sentence spans of a chunk, computed once at indexing time and stored next to the chunk text
+# (rag/chunk_store.py) as an int32 array of shape (num_sentences, 3):
+#   [:, 0]  end offset of the sentence in the chunk text (start = previous end, the first starts at 0)
+#   [:, 1]  token count of the sentence for the regex tokenizer (rag/tokens.py)
+#   [:, 2]  1 if the sentence contains a digit, else 0
+# The index does not depend on the prompt tokenizer: for any other CONTEXT_TOKENIZER the context
+# builder counts the sentences of the retrieved chunks itself (rag/context.py).
+# Sentences end at . ! ? ; followed by whitespace, or at a blank line; PDF tables and lists without
+# punctuation are cut at the last line break (or space) before MAX_SENTENCE_CHARS.
+_BOUNDARY = re.compile(r"(?<=[.!?;])\s+|\n\s*\n")
+_DIGIT = re.compile(r"\d")
+MAX_SENTENCE_CHARS = 400
+
+def _cut_long(text: str, start: int, end: int, ends: List[int]) -> None:
+    while end - start > MAX_SENTENCE_CHARS:
+        limit = start + MAX_SENTENCE_CHARS
+        cut = text.rfind("\n", start + 1, limit)
+        if cut < 0:
+            cut = text.rfind(" ", start + 1, limit)
+        cut = cut + 1 if cut >= 0 else limit
+        ends.append(cut)
+        start = cut
+    ends.append(end)
+
+def sentence_ends(text: str) -> List[int]:
+    ends: List[int] = []
+    start = 0
+    for m in _BOUNDARY.finditer(text):
+        # trailing whitespace belongs to the sentence it follows
+        if m.end() > start:
+            _cut_long(text, start, m.end(), ends)
+            start = m.end()
+    if start < len(text):
+        _cut_long(text, start, len(text), ends)
+    return ends
+
+def sentence_spans(text: str) -> np.ndarray:
+    ends = sentence_ends(text)
+    texts = [text[s:e] for s, e in zip([0] + ends[:-1], ends)]
+    digits = [_DIGIT.search(t) is not None for t in texts]
+    return np.asarray([ends, RegexTokenizer().count_many(texts), digits], dtype="int32").T.reshape(-1, 3)
+
+def sentence_texts(text: str, spans: np.ndarray) -> List[str]:
+    ends = spans[:, 0].tolist()
+    return [text[s:e].strip() for s, e in zip([0] + ends[:-1], ends)]
@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List
+import json
+import threading
+import time
+from dotenv import load_dotenv
+load_dotenv()
+
+from .config import Settings
+from .embedding import embedder_from_settings, load_reranker
+from .index import IndexArtifacts, build_or_load_index_from_settings
+from .llm import RateLimiter
+from .pipeline import get_llm, lookup_facts, question_context, make_answer, retrieve_questions, make_rerank_cache
+from .answering import build_prompt, normalize_by_kind, default_heuristic_answer
+from .metrics import METRICS
+
+# Resident query service: models, LLM client and index are loaded once and shared by all requests.
+#   python -m rag.server --host 127.0.0.1 --port 8000
+#   POST /query    {"question": "...", "kind": "number"} or {"questions": [{"text", "kind"}, ...]}
+#                  optional "generate": false answers heuristically, without an LLM call
+#   POST /retrieve {"question": "..."} -> ranked chunks with scores
+#   POST /reload   re-scan PDF_DIR and swap in the updated index (incremental, see build_or_load_index)
+#   GET  /health   index size and load time;  GET /metrics  stage timings since start
+# Stage timings keep at most METRICS_SAMPLES samples per stage for the percentiles, so a server that
+# runs for weeks does not grow with the number of requests; counts and histograms stay exact.
+METRICS_SAMPLES = 10_000
+
+class QueryService:
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        self.embedder = embedder_from_settings(settings)
+        self.reranker = load_reranker(settings.rerank_model) if settings.rerank else None
+        self.rerank_cache = make_rerank_cache(settings)
+        self.llm = get_llm(settings)
+        self.rate_limiter = RateLimiter(settings.llm_rate_per_sec, burst=settings.llm_concurrency)
+        self._reload_lock = threading.Lock()
+        # requests in flight per artifacts snapshot (by id); a snapshot replaced by a reload is closed
+        # when its last request is done, so reloads do not leak file descriptors and memory maps
+        self._use_lock = threading.Lock()
+        self._in_use: Dict[int, int] = {}
+        self.artifacts: IndexArtifacts | None = None
+        self.loaded_at = 0.0
+        self.reload()
+
+    def reload(self) -> Dict[str, Any]:
+        # requests keep using the old artifacts until the new ones are complete, then the reference is swapped
+        with self._reload_lock:
+            t0 = time.perf_counter()
+            artifacts = build_or_load_index_from_settings(self.settings, model=self.embedder)
+            with self._use_lock:
+                old, self.artifacts = self.artifacts, artifacts
+                idle = old is not None and not self._in_use.get(id(old))
+            if idle:
+                old.close()
+            self.loaded_at = time.time()
+            return {**self.health(), "reload_ms": (time.perf_counter() - t0) * 1000.0}
+
+    @contextmanager
+    def snapshot(self) -> Iterator[IndexArtifacts]:
+        # the artifacts a request works on, kept open until the request is done even if a reload swaps them
+        with self._use_lock:
+            artifacts = self.artifacts
+            self._in_use[id(artifacts)] = self._in_use.get(id(artifacts), 0) + 1
+        try:
+            yield artifacts
+        finally:
+            with self._use_lock:
+                left = self._in_use.pop(id(artifacts)) - 1
+                if left:
+                    self._in_use[id(artifacts)] = left
+                retired = not left and artifacts is not self.artifacts
+            if retired:
+                artifacts.close()
+
+    def health(self) -> Dict[str, Any]:
+        with self.snapshot() as artifacts:
+            return {
+                "status": "ok",
+                "num_chunks": len(artifacts.chunks),
+                "num_pdfs": len(artifacts.pdfs),
+                "loaded_at": self.loaded_at,
+                "generator": self.settings.generator,
+            }
+
+    def retrieve(self, questions: List[str]) -> List[List[Dict[str, Any]]]:
+        with self.snapshot() as artifacts:
+            return self._retrieve(artifacts, questions)
+
+    def _retrieve(self, artifacts: IndexArtifacts, questions: List[str]) -> List[List[Dict[str, Any]]]:
+        results = retrieve_questions(
+            self.settings, artifacts, questions,
+            embedder=self.embedder, reranker=self.reranker, rerank_cache=self.rerank_cache,
+        )
+        return [
+            [
+                {"pdf_sha1": r.chunk.pdf_sha1, "page_index": r.chunk.page_index, "score": r.score, "text": r.chunk.text}
+                for r in retrieved
+            ]
+            for retrieved in results
+        ]
+
+    def answer(self, questions: List[Dict[str, str]], *, generate: bool = True) -> List[Dict[str, Any]]:
+        with self.snapshot() as artifacts:
+            return self._answer(artifacts, questions, generate=generate)
+
+    def _answer(self, artifacts: IndexArtifacts, questions: List[Dict[str, str]], *, generate: bool) -> List[Dict[str, Any]]:
+        settings = self.settings
+        t0 = time.perf_counter()
+        texts = [q["text"] for q in questions]
+        all_retrieved = retrieve_questions(
+            settings, artifacts, texts, embedder=self.embedder, reranker=self.reranker, rerank_cache=self.rerank_cache,
+        )
+        retrieval_ms = (time.perf_counter() - t0) * 1000.0
+        all_facts = [lookup_facts(settings, artifacts, q["text"], q["kind"]) for q in questions]
+
+        if not generate or settings.generator == "heuristic":
+            values = [
+                default_heuristic_answer(q["kind"], r, f, question=q["text"]) for q, r, f in zip(questions, all_retrieved, all_facts)
+            ]
+        else:
+            prompts = [
+                build_prompt(q["text"], q["kind"], question_context(settings, q["text"], q["kind"], r, f))
+                for q, r, f in zip(questions, all_retrieved, all_facts)
+            ]
+            responses = self.llm.generate_many(
+                prompts,
+                concurrency=settings.llm_concurrency,
+                rate_limiter=self.rate_limiter,
+                max_retries=settings.llm_max_retries,
+                backoff=settings.llm_backoff,
+            )
+            values = [normalize_by_kind(q["kind"], resp.text, q["text"]) for q, resp in zip(questions, responses)]
+
+        total_ms = (time.perf_counter() - t0) * 1000.0
+        out = []
+        for q, value, r, f in zip(questions, values, all_retrieved, all_facts):
+            answer = make_answer(q["text"], q["kind"], value, r, f)
+            out.append({**answer.model_dump(), "retrieval_ms": retrieval_ms, "total_ms": total_ms})
+        return out
+
+def _questions_of(body: Dict[str, Any]) -> List[Dict[str, str]]:
+    if "questions" in body:
+        items = body["questions"]
+    else:
+        items = [{"text": body.get("question") or body.get("text"), "kind": body.get("kind", "name")}]
+    out = []
+    for q in items:
+        q = {"text": q} if isinstance(q, str) else q
+        if not q.get("text"):
+            raise ValueError("question text is required")
+        out.append({"text": q["text"], "kind": q.get("kind", "name")})
+    return out
+
+def make_handler(service: QueryService):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send(self, status: int, obj: Any) -> None:
+            body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _body(self) -> Dict[str, Any]:
+            n = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(n) or b"{}") if n else {}
+
+        def do_GET(self) -> None:
+            if self.path == "/health":
+                self._send(200, service.health())
+            elif self.path == "/metrics":
+                summary = METRICS.summary()
+                self._send(200, {"stages": summary["stages"], "counters": summary["counters"]})
+            else:
+                self._send(404, {"error": f"unknown path {self.path}"})
+
+        def do_POST(self) -> None:
+            try:
+                body = self._body()
+                if self.path == "/query":
+                    multi = "questions" in body
+                    answers = service.answer(_questions_of(body), generate=bool(body.get("generate", True)))
+                    self._send(200, {"answers": answers} if multi else answers[0])
+                elif self.path == "/retrieve":
+                    results = service.retrieve([q["text"] for q in _questions_of(body)])
+                    self._send(200, {"results": results} if "questions" in body else {"results": results[0]})
+                elif self.path == "/reload":
+                    self._send(200, service.reload())
+                else:
+                    self._send(404, {"error": f"unknown path {self.path}"})
+            except (ValueError, KeyError, TypeError) as e:
+                self._send(400, {"error": str(e)})
+            except Exception as e:
+                self._send(500, {"error": f"{type(e).__name__}: {e}"})
+
+    return Handler
+
+def main() -> None:
+    import argparse
+
+    ap = argparse.ArgumentParser(description="serve questions over HTTP with models and index kept in memory")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8000)
+    args = ap.parse_args()
+
+    METRICS.max_samples = METRICS_SAMPLES
+    service = QueryService(Settings())
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    print(f"Serving on http://{args.host}:{args.port} ({service.health()['num_chunks']} chunks)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,340 @@
+from __future__ import annotations
+
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, TYPE_CHECKING
+import importlib
+import json
+import os
+import shutil
+import threading
+import traceback
+import weakref
+import numpy as np
+
+from .config import Settings
+from .ann import AnnParams
+from .chunking import Chunk
+from .facts import FactTable
+from .index import IndexArtifacts, build_or_load_index, index_kwargs, load_index
+from .metrics import METRICS, timer
+from .pdf import list_pdfs, pdf_sha1_for
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+# Sharded index (INDEX_SHARDS > 1). PDFs are partitioned by pdf_sha1 into N independent indexes,
+# each one a regular build_or_load_index directory:
+#   <index_dir>/shards/shards.json   {"num_shards": N}; a different N rebuilds every shard
+#   <index_dir>/shards/NN/           shard NN (index.faiss, chunks/, bm25/, manifest.json, ...)
+#   <index_dir>/shards/facts/        one fact table over the facts extracted by all shards
+# Chunk ids are global: shard << SHARD_BITS | the shard's own chunk id, so everything downstream of
+# search (retrieval, reranking, citations) works on ShardedArtifacts unchanged. Dense search is
+# scatter-gather: every shard's worker searches its own index and the per-shard top-k lists are
+# merged by score. Inner products are comparable across shards, so for exact indexes the merged
+# top-k equals the single-index top-k. BM25 statistics (idf, avgdl) are per shard, which makes
+# hybrid retrieval an approximation of the single-index ranking.
+SHARD_BITS = 40
+_LOCAL = (1 << SHARD_BITS) - 1
+
+def shard_of(pdf_sha1: str, num_shards: int) -> int:
+    return int(pdf_sha1[:8], 16) % num_shards
+
+def _split(gid: int) -> Tuple[int, int]:
+    return gid >> SHARD_BITS, gid & _LOCAL
+
+def _to_global(shard: int, ids: np.ndarray) -> np.ndarray:
+    return np.where(ids >= 0, (np.int64(shard) << SHARD_BITS) | ids, -1)
+
+def _local_ranges(ranges: List[Tuple[int, int]], shard: int) -> List[Tuple[int, int]]:
+    # PDF id ranges never cross shards
+    return [(lo & _LOCAL, hi - (shard << SHARD_BITS)) for lo, hi in ranges if lo >> SHARD_BITS == shard]
+
+# Shard workers. A worker answers dense searches for one shard: submit() starts a search and
+# result() returns its (scores, local ids) as IndexArtifacts.search_vectors does; the coordinator
+# submits to every shard before it collects any result. SHARD_WORKERS=module:factory plugs in other
+# workers (e.g. remote ones): factory(shard_dir, ann) must return an object with submit / result / close.
+class LocalShardWorker:
+    # searches in the calling thread; no parallelism, no extra memory
+    def __init__(self, artifacts: IndexArtifacts):
+        self.artifacts = artifacts
+        self._result: Tuple[np.ndarray, np.ndarray] | None = None
+
+    def submit(self, q: np.ndarray, top_k: int, id_ranges: Sequence[Optional[List[Tuple[int, int]]]]) -> None:
+        self._result = self.artifacts.search_vectors(q, top_k, id_ranges)
+
+    def result(self) -> Tuple[np.ndarray, np.ndarray]:
+        out, self._result = self._result, None
+        return out
+
+    def close(self) -> None:
+        pass
+
+def _serve(conn, shard_dir: Path, ann: AnnParams, threads: int | None) -> None:
+    # worker process: load the shard read-only, then answer requests until None (or the pipe closes)
+    try:
+        if threads:
+            import faiss
+
+            faiss.omp_set_num_threads(threads)
+        artifacts = load_index(shard_dir, ann)
+        conn.send(("ready", artifacts.faiss_index.ntotal))
+    except Exception:
+        conn.send(("error", traceback.format_exc()))
+        return
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            return
+        if msg is None:
+            return
+        try:
+            conn.send(("ok", artifacts.search_vectors(*msg)))
+        except Exception:
+            conn.send(("error", traceback.format_exc()))
+
+def _stop_process(conn, proc) -> None:
+    try:
+        conn.send(None)
+    except (OSError, ValueError):
+        pass
+    proc.join(timeout=5)
+    if proc.is_alive():
+        proc.terminate()
+        proc.join()
+    conn.close()
+
+class ProcessShardWorker:
+    # one spawned process per shard holding that shard's index; faiss searches of different shards
+    # run truly in parallel and each process only maps its own part of the index. threads caps the
+    # worker's faiss (OpenMP) threads so that N workers do not each start one thread per core
+    def __init__(self, shard_dir: Path, ann: AnnParams, *, threads: int | None = None):
+        import multiprocessing as mp
+
+        ctx = mp.get_context("spawn")
+        self.shard_dir = shard_dir
+        self._conn, child = ctx.Pipe()
+        self._proc = ctx.Process(target=_serve, args=(child, shard_dir, ann, threads), daemon=True, name=f"shard-{shard_dir.name}")
+        self._proc.start()
+        child.close()
+        self._ready = False
+        self._finalizer = weakref.finalize(self, _stop_process, self._conn, self._proc)
+
+    def _recv(self):
+        try:
+            status, payload = self._conn.recv()
+        except EOFError:
+            raise RuntimeError(f"Shard worker for {self.shard_dir} exited") from None
+        if status == "error":
+            raise RuntimeError(f"Shard worker for {self.shard_dir} failed:\n{payload}")
+        return payload
+
+    def submit(self, q: np.ndarray, top_k: int, id_ranges: Sequence[Optional[List[Tuple[int, int]]]]) -> None:
+        self._conn.send((q, top_k, list(id_ranges)))
+
+    def result(self) -> Tuple[np.ndarray, np.ndarray]:
+        if not self._ready:
+            # the first message is the worker's "ready"; workers load their shards concurrently
+            self._recv()
+            self._ready = True
+        return self._recv()
+
+    def close(self) -> None:
+        self._finalizer()
+
+def _worker_factory(spec: str) -> Callable[..., Any]:
+    module, _, name = spec.partition(":")
+    if not name:
+        raise ValueError(f"SHARD_WORKERS must be process, local or module:factory, got {spec!r}")
+    return getattr(importlib.import_module(module), name)
+
+class ShardedChunks(Mapping):
+    # ChunkStore interface over the shards' chunk stores, keyed by global chunk id
+    def __init__(self, stores: Sequence[Any]):
+        self.stores = list(stores)
+        self.ids = np.concatenate(
+            [_to_global(s, np.asarray(store.ids, dtype="int64")) for s, store in enumerate(self.stores)]
+        ) if self.stores else np.zeros(0, dtype="int64")
+
+    def _store(self, chunk_id: int) -> Tuple[Any, int]:
+        shard, local = _split(int(chunk_id))
+        if not 0 <= shard < len(self.stores):
+            raise KeyError(chunk_id)
+        return self.stores[shard], local
+
+    def __len__(self) -> int:
+        return sum(len(store) for store in self.stores)
+
+    def __iter__(self) -> Iterator[int]:
+        for cid in self.ids:
+            yield int(cid)
+
+    def __getitem__(self, chunk_id: int) -> Chunk:
+        store, local = self._store(chunk_id)
+        return store[local]
+
+    def sentences(self, chunk_id: int) -> np.ndarray:
+        store, local = self._store(chunk_id)
+        return store.sentences(local)
+
+    def iter_texts(self) -> Iterator[str]:
+        for store in self.stores:
+            yield from store.iter_texts()
+
+    def close(self) -> None:
+        for store in self.stores:
+            store.close()
+
+class ShardedBM25:
+    # per-shard BM25 results merged by score; idf and document length norms are each shard's own
+    def __init__(self, indexes: Sequence[Any]):
+        self.indexes = list(indexes)
+
+    def search_many(
+        self, queries: Sequence[str], top_k: int, *, id_ranges: Sequence[Sequence[Tuple[int, int]] | None] | None = None
+    ) -> List[List[Tuple[int, float]]]:
+        ranges = id_ranges if id_ranges is not None else [None] * len(queries)
+        out = []
+        for query, r in zip(queries, ranges):
+            hits: List[Tuple[int, float]] = []
+            for s, index in enumerate(self.indexes):
+                # an empty range list means "unfiltered", as in BM25Index.search
+                local = _local_ranges(list(r), s) if r else None
+                if r and not local:
+                    continue
+                hits.extend(((s << SHARD_BITS) | cid, score) for cid, score in index.search(query, top_k, id_ranges=local))
+            hits.sort(key=lambda h: h[1], reverse=True)
+            out.append(hits[:top_k])
+        return out
+
+class ShardedAliases:
+    def __init__(self, aliases: Sequence[Any]):
+        self.aliases = list(aliases)
+
+    def __len__(self) -> int:
+        return sum(len(a) for a in self.aliases if a is not None)
+
+    def pages_of(self, chunk_id: int) -> Tuple[int, ...]:
+        shard, local = _split(int(chunk_id))
+        a = self.aliases[shard] if 0 <= shard < len(self.aliases) else None
+        return a.pages_of(local) if a is not None else ()
+
+class ShardedArtifacts:
+    # the IndexArtifacts interface used by retrieval, answering and the server, over N shards
+    def __init__(self, shards: Sequence[IndexArtifacts], workers: Sequence[Any], *, facts: FactTable | None):
+        self.shards = list(shards)
+        self.workers = list(workers)
+        # one scatter-gather at a time: a worker's submit / result pairs must not interleave
+        self._lock = threading.Lock()
+        self.embed_model_name = self.shards[0].embed_model_name
+        self.ann = self.shards[0].ann
+        self.chunks = ShardedChunks([a.chunks for a in self.shards])
+        self.bm25 = ShardedBM25([a.bm25 for a in self.shards]) if all(a.bm25 is not None for a in self.shards) else None
+        self.aliases = ShardedAliases([a.aliases for a in self.shards])
+        self.facts = facts
+        self.pdfs: Dict[str, Dict[str, Any]] = {}
+        for s, a in enumerate(self.shards):
+            for sha, entry in a.pdfs.items():
+                self.pdfs[sha] = {**entry, "first_id": (s << SHARD_BITS) | entry["first_id"], "shard": s}
+
+    id_ranges = IndexArtifacts.id_ranges
+
+    def search_vectors(
+        self, q: np.ndarray, top_k: int, id_ranges: Sequence[Optional[List[Tuple[int, int]]]]
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        with METRICS.timer("search.shards"), self._lock:
+            # scatter: shards with nothing to search for any query are skipped
+            busy = []
+            for s, worker in enumerate(self.workers):
+                local = [None if r is None else _local_ranges(r, s) for r in id_ranges]
+                if all(r is not None and not r for r in local):
+                    continue
+                worker.submit(q, top_k, local)
+                busy.append(s)
+            parts = [(s, *self.workers[s].result()) for s in busy]
+        # gather: (nq, top_k * shards) candidates merged by score, padding (-1, -inf) sorts last
+        D = np.full((len(q), top_k), -np.inf, dtype="float32")
+        I = np.full((len(q), top_k), -1, dtype="int64")
+        if not parts:
+            return D, I
+        D = np.concatenate([np.where(Is >= 0, Ds, -np.inf) for _, Ds, Is in parts], axis=1).astype("float32")
+        I = np.concatenate([_to_global(s, Is) for s, _, Is in parts], axis=1)
+        order = np.argsort(-D, axis=1, kind="stable")[:, :top_k]
+        return np.take_along_axis(D, order, axis=1), np.take_along_axis(I, order, axis=1)
+
+    def close(self) -> None:
+        for worker in self.workers:
+            worker.close()
+        # each shard closes its chunk store (shared with self.chunks) and drops its memory maps
+        for shard in self.shards:
+            shard.close()
+        self.bm25, self.facts = None, None
+
+def _load_or_build_facts(root: Path, shard_dirs: Sequence[Path], pdfs: Dict[str, Dict[str, Any]]) -> FactTable:
+    # the shards' per-PDF fact files are gathered into one table, rebuilt when any of them changes
+    sources = {}
+    for sha, entry in pdfs.items():
+        path = shard_dirs[entry["shard"]] / "facts" / "pdfs" / f"{sha}.npz"
+        if path.exists():
+            st = path.stat()
+            sources[sha] = [str(path), st.st_size, st.st_mtime_ns]
+    sources_path = root / "sources.json"
+    if (root / "ranges.json").exists() and sources_path.exists():
+        if json.loads(sources_path.read_text(encoding="utf-8")) == sources:
+            return FactTable(root)
+    if (root / "pdfs").exists():
+        shutil.rmtree(root / "pdfs")
+    (root / "pdfs").mkdir(parents=True)
+    for sha, (path, _, _) in sources.items():
+        shutil.copyfile(path, root / "pdfs" / f"{sha}.npz")
+    table = FactTable.build(root, list(sources))
+    tmp = sources_path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(sources), encoding="utf-8")
+    tmp.replace(sources_path)
+    return table
+
+@timer("index.build_or_load_sharded")
+def build_or_load_sharded_index(settings: Settings, *, model: "SentenceTransformer | None" = None) -> ShardedArtifacts:
+    n = settings.index_shards
+    root = settings.index_dir / "shards"
+    layout = root / "shards.json"
+    if layout.exists() and json.loads(layout.read_text(encoding="utf-8")).get("num_shards") != n:
+        shutil.rmtree(root)
+    root.mkdir(parents=True, exist_ok=True)
+    layout.write_text(json.dumps({"num_shards": n}), encoding="utf-8")
+
+    kwargs = index_kwargs(settings)
+    shard_dirs = [root / f"{i:02d}" for i in range(n)]
+    # the PDF directory is hashed once here; each shard gets the PDFs that hash to it
+    parts: List[Dict[str, Path]] = [{} for _ in range(n)]
+    for pdf_path in list_pdfs(settings.pdf_dir):
+        sha = pdf_sha1_for(pdf_path)
+        parts[shard_of(sha, n)].setdefault(sha, pdf_path)
+    # shards are built one after the other with the same model (and embedding cache); they only write
+    # per-PDF fact files, the one fact table is gathered from them below
+    shards = [
+        build_or_load_index(
+            pdf_dir=settings.pdf_dir, index_dir=d, shard=(i, n), pdfs=parts[i], fact_table=False, model=model, **kwargs
+        )
+        for i, d in enumerate(shard_dirs)
+    ]
+
+    kind = settings.shard_workers
+    if kind == "local":
+        workers = [LocalShardWorker(a) for a in shards]
+    else:
+        if kind == "process":
+            threads = max(1, (os.cpu_count() or 1) // n)
+            factory = lambda d, ann: ProcessShardWorker(d, ann, threads=threads)
+        else:
+            factory = _worker_factory(kind)
+        workers = [factory(d, a.ann) for d, a in zip(shard_dirs, shards)]
+        # the workers hold the vector indexes; the coordinator only keeps chunks, BM25 and metadata
+        for a in shards:
+            a.faiss_index, a.vectors = None, None
+
+    artifacts = ShardedArtifacts(shards, workers, facts=None)
+    if settings.fact_index:
+        artifacts.facts = _load_or_build_facts(root / "facts", shard_dirs, artifacts.pdfs)
+    return artifacts
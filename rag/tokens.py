@@ -0,0 +1,63 @@
+from __future__ import annotations
+
+from functools import lru_cache
+from typing import List, Sequence
+import importlib.util
+import re
+
+from .config import Settings
+
+# Token counts for context budgeting. "regex" is a dependency-free approximation of a BPE tokenizer
+# (letter runs of up to 6 characters, digit groups of up to 3, every other symbol); any other name is
+# resolved with tiktoken, first as a model name (gpt-4o-mini), then as an encoding name (cl100k_base).
+_PIECE = re.compile(r"[^\W\d_]{1,6}|\d{1,3}|[^\w\s]|_")
+
+class RegexTokenizer:
+    name = "regex"
+    # pieces never span whitespace, so the count of whitespace-joined texts is the sum of their counts
+    additive = True
+
+    def count(self, text: str) -> int:
+        return len(_PIECE.findall(text))
+
+    def count_many(self, texts: Sequence[str]) -> List[int]:
+        return [len(_PIECE.findall(t)) for t in texts]
+
+class TiktokenTokenizer:
+    additive = False
+
+    def __init__(self, name: str):
+        try:
+            import tiktoken
+        except Exception as e:
+            raise RuntimeError(f"Install tiktoken to count tokens with {name!r}: pip install tiktoken") from e
+        try:
+            self._enc = tiktoken.encoding_for_model(name)
+        except KeyError:
+            self._enc = tiktoken.get_encoding(name)
+        self.name = name
+
+    def count(self, text: str) -> int:
+        return len(self._enc.encode_ordinary(text))
+
+    def count_many(self, texts: Sequence[str]) -> List[int]:
+        return [len(t) for t in self._enc.encode_ordinary_batch(list(texts))]
+
+@lru_cache(maxsize=None)
+def load_tokenizer(name: str) -> RegexTokenizer | TiktokenTokenizer:
+    return RegexTokenizer() if name == "regex" else TiktokenTokenizer(name)
+
+def tokenizer_for(settings: Settings) -> str:
+    # CONTEXT_TOKENIZER wins; otherwise the OpenAI model's own encoding when tiktoken is installed
+    if settings.context_tokenizer:
+        return settings.context_tokenizer
+    if settings.generator == "openai" and importlib.util.find_spec("tiktoken") is not None:
+        import tiktoken
+
+        try:
+            tiktoken.encoding_for_model(settings.openai_model)
+            return settings.openai_model
+        except KeyError:
+            # OpenAI-compatible servers with other models: the common encoding is close enough
+            return "cl100k_base"
+    return "regex"
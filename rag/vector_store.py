@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+from pathlib import Path
+import json
+import shutil
+import numpy as np
+
+# Exact float32 embeddings for lossy indexes (QUANTIZATION=fp16/int8/binary, INDEX_TYPE=ivfpq):
+#   vectors.f32  little-endian float32 rows, row i belongs to row i of the chunk store
+#   meta.json    {"dim": int}
+# The faiss index only holds the compressed codes; these rows are memory-mapped and read back for
+# the few candidates being rescored, so they cost disk and page cache rather than resident RAM.
+_VECTORS = "vectors.f32"
+_META = "meta.json"
+
+class VectorStore:
+    def __init__(self, root: Path):
+        self.root = root
+        meta = json.loads((root / _META).read_text(encoding="utf-8")) if (root / _META).exists() else {"dim": 0}
+        self.dim = int(meta["dim"])
+        path = root / _VECTORS
+        size = path.stat().st_size if path.exists() else 0
+        # a torn tail row (crashed append) is ignored; the caller compares len() with the chunk store
+        n = size // (4 * self.dim) if self.dim else 0
+        if n:
+            self.vectors = np.memmap(path, dtype="<f4", mode="r", shape=(n, self.dim))
+        else:
+            self.vectors = np.zeros((0, self.dim), dtype="float32")
+
+    @classmethod
+    def open(cls, root: Path) -> "VectorStore":
+        return cls(root)
+
+    def truncate(self, n: int) -> "VectorStore":
+        with (self.root / _VECTORS).open("ab") as f:
+            f.truncate(min(n, len(self)) * 4 * self.dim)
+        return VectorStore(self.root)
+
+    @classmethod
+    def create(cls, root: Path, dim: int) -> "VectorStore":
+        if root.exists():
+            shutil.rmtree(root)
+        root.mkdir(parents=True)
+        (root / _VECTORS).touch()
+        (root / _META).write_text(json.dumps({"dim": dim}), encoding="utf-8")
+        return cls(root)
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    def append(self, vectors: np.ndarray) -> "VectorStore":
+        vectors = np.ascontiguousarray(vectors, dtype="<f4")
+        if vectors.ndim != 2 or vectors.shape[1] != self.dim:
+            raise ValueError(f"expected vectors of dim {self.dim}, got shape {vectors.shape}")
+        n = len(self)
+        # appending leaves this instance's mapping of the first n rows valid for readers still using it
+        with (self.root / _VECTORS).open("ab") as f:
+            # drop a torn tail first so rows stay aligned
+            f.truncate(n * 4 * self.dim)
+            f.write(vectors.tobytes())
+        return VectorStore(self.root)
+
+    def compact(self, keep: np.ndarray) -> "VectorStore":
+        # same contract as ChunkStore.compact: keep[row] selects the rows that survive
+        tmp = self.root.with_name(self.root.name + ".tmp")
+        if tmp.exists():
+            shutil.rmtree(tmp)
+        tmp.mkdir(parents=True)
+        with (tmp / _VECTORS).open("wb") as f:
+            rows = np.flatnonzero(keep[: len(self)])
+            for i in range(0, len(rows), 65536):
+                f.write(np.ascontiguousarray(self.vectors[rows[i:i + 65536]], dtype="<f4").tobytes())
+        shutil.copy(self.root / _META, tmp / _META)
+        shutil.rmtree(self.root)
+        tmp.rename(self.root)
+        return VectorStore(self.root)
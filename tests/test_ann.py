@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+import dataclasses
+import shutil
+
+import numpy as np
+import pytest
+
+from benchmarks.corpus import make_corpus, make_questions
+from benchmarks.run import HashEmbedder
+from rag.config import Settings
+from rag.index import build_or_load_index_from_settings
+
+K = 5
+
+@pytest.fixture(scope="module")
+def built(tmp_path_factory):
+    # one corpus, one exact flat index to compare every storage format against
+    root = tmp_path_factory.mktemp("ann")
+    reports = make_corpus(root / "pdfs", num_pdfs=6, pages=10, seed=0)
+    q = HashEmbedder().encode([q["text"] for q in make_questions(reports, num_questions=50, seed=0)])
+    base = dataclasses.replace(Settings(), pdf_dir=root / "pdfs", embed_cache=False, page_cache=False, fact_index=False)
+
+    def build(name: str, **changes):
+        settings = dataclasses.replace(base, index_dir=root / name, **changes)
+        if settings.index_dir.exists():
+            shutil.rmtree(settings.index_dir)
+        return build_or_load_index_from_settings(settings, model=HashEmbedder())
+
+    exact = build("flat")
+    return build, q, exact.search_vectors(q, K, [None] * len(q))[0]
+
+def _hits(artifacts, q, exact_scores):
+    # (returned scores, exact scores of the returned chunks, recall@K); chunks tied at the k-th place
+    # are interchangeable, so a hit counts if its exact score reaches the k-th exact score
+    D, I = artifacts.search_vectors(q, K, [None] * len(q))
+    texts = [artifacts.chunks[int(i)].text for i in I.ravel()]
+    true = np.einsum("qd,qkd->qk", q, HashEmbedder().encode(texts).reshape(*I.shape, -1))
+    return D, true, float(np.mean(true >= exact_scores[:, -1:] - 1e-4))
+
+@pytest.mark.parametrize("quantization", ["fp16", "int8"])
+def test_scalar_quantization_keeps_recall_and_rescoring_restores_exact_scores(built, quantization):
+    build, q, exact = built
+    artifacts = build(quantization, quantization=quantization)
+    assert artifacts.vectors is not None and len(artifacts.vectors) == len(artifacts.chunks)
+    D, true, recall = _hits(artifacts, q, exact)
+    assert recall == 1.0
+    np.testing.assert_allclose(D, true, atol=1e-5)
+
+    plain = build(f"{quantization}_plain", quantization=quantization, rescore=False)
+    assert plain.vectors is None
+    assert _hits(plain, q, exact)[2] == 1.0
+
+def test_rescoring_with_stored_vectors_restores_binary_recall(built):
+    build, q, exact = built
+    plain = build("binary_plain", quantization="binary", rescore=False)
+    rescored = build("binary", quantization="binary")
+    D, true, recall = _hits(rescored, q, exact)
+    np.testing.assert_allclose(D, true, atol=1e-5)
+    assert recall > _hits(plain, q, exact)[2]
+
+    # fetching every chunk as a candidate, the exact rescoring finds exactly what flat search finds
+    everything = build("binary_all", quantization="binary", rescore_factor=len(rescored.chunks) // K + 1)
+    assert _hits(everything, q, exact)[2] == 1.0
@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+import pytest
+
+from rag.answering import normalize_number
+from rag.facts import Fact
+
+@pytest.mark.parametrize("text, expected", [
+    ("67681", 67681),
+    ("Revenue was 67681 in 2022", 67681),
+    ("12,345", 12345),
+    ("12 345 employees", 12345),
+    ("1,234.5", 1234.5),
+    ("-3.5%", -3.5),
+    ("2022", "N/A"),
+    ("N/A", "N/A"),
+    ("not disclosed", "N/A"),
+])
+def test_normalize_number(text, expected):
+    assert normalize_number(text) == expected
+
+def test_fact_describe_prints_plain_grouped_values():
+    fact = Fact("a" * 40, 4, "total revenue", 12345678.0, "million", "USD", 2022)
+    assert fact.describe() == f"total revenue: 12,345,678 million USD (2022) [pdf_sha1={'a' * 40} page_index=4]"
+    assert Fact("a" * 40, 4, "operating margin", 12.5, "%", "", None).describe().startswith("operating margin: 12.5 %")
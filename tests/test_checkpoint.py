@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import dataclasses
+import json
+
+import pytest
+
+import main
+from rag.checkpoint import AnswerCheckpoint, question_key, run_fingerprint
+from rag.config import Settings
+from rag.submission import Answer
+
+QUESTIONS = [
+    {"text": 'What was the total revenue of "Acme Inc" in 2022?', "kind": "number"},
+    {"text": 'Who was the CEO of "Acme Inc" in 2022?', "kind": "name"},
+]
+
+@pytest.fixture
+def settings(tmp_path):
+    path = tmp_path / "questions.json"
+    path.write_text(json.dumps(QUESTIONS), encoding="utf-8")
+    return dataclasses.replace(
+        Settings(), questions_path=path, submissions_dir=tmp_path / "submissions", submission_name="t",
+        generator="heuristic", resume=True, metrics=False,
+    )
+
+def _checkpoint_path(settings):
+    return settings.submissions_dir / f"submission_{settings.submission_name}.checkpoint.jsonl"
+
+def _interrupted_run(settings, raw=None):
+    # what a run killed after answering every question leaves behind
+    checkpoint = AnswerCheckpoint(_checkpoint_path(settings), fingerprint=run_fingerprint(settings))
+    for q in QUESTIONS:
+        value = 1234 if q["kind"] == "number" else "Jane Doe"
+        answer = Answer(value=value, question_text=q["text"], kind=q["kind"])
+        checkpoint.append(question_key(q["text"], q["kind"]), answer, raw=raw if q["kind"] == "number" else None)
+
+@pytest.fixture
+def answered(monkeypatch):
+    # stands in for retrieval + generation; records which questions had to be answered again
+    calls = []
+
+    def answer_questions(settings, questions, keys, checkpoint, done):
+        calls.append([q["text"] for q in questions])
+        for q, k in zip(questions, keys):
+            done[k] = Answer(value="N/A", question_text=q["text"], kind=q["kind"])
+
+    monkeypatch.setattr(main, "answer_questions", answer_questions)
+    return calls
+
+def test_resume_with_same_settings_skips_answered_questions(settings, answered):
+    _interrupted_run(settings)
+    main.run(settings)
+    assert answered == []
+    out = json.loads((settings.submissions_dir / "submission_t.json").read_text(encoding="utf-8"))
+    assert [a["value"] for a in out["answers"]] == [1234, "Jane Doe"]
+    # a finished run leaves no checkpoint, so the next run answers everything again
+    assert not _checkpoint_path(settings).exists()
+    main.run(settings)
+    assert answered == [[q["text"] for q in QUESTIONS]]
+
+@pytest.mark.parametrize("change", [
+    {"generator": "openai"},
+    {"openai_model": "other-model", "generator": "openai"},
+    {"top_k": 3},
+    {"retrieval_mode": "hybrid"},
+    {"rerank": True},
+    {"max_context_tokens": 500},
+    {"dedup": True},
+    {"hnsw_ef_search": 16},
+    {"ivf_nprobe": 4},
+    {"quantization": "fp16"},
+    {"rescore": False},
+    {"rescore_factor": 8},
+])
+def test_checkpoint_of_other_settings_is_discarded(settings, answered, change):
+    _interrupted_run(settings)
+    main.run(dataclasses.replace(settings, **change))
+    assert answered == [[q["text"] for q in QUESTIONS]]
+
+def test_fingerprint_ignores_output_settings(settings):
+    other = dataclasses.replace(settings, submission_name="other", metrics=True, profile="cprofile", llm_concurrency=16)
+    assert run_fingerprint(other) == run_fingerprint(settings)
+
+def test_resume_false_starts_over(settings, answered):
+    _interrupted_run(settings)
+    main.run(dataclasses.replace(settings, resume=False))
+    assert answered == [[q["text"] for q in QUESTIONS]]
+
+def test_raw_llm_output_is_normalized_again_on_resume(settings, answered):
+    # "1,234" still reads as 1234: resumed. Output the current normalizer reads differently is not.
+    _interrupted_run(settings, raw="1,234")
+    main.run(settings)
+    assert answered == []
+
+    _interrupted_run(settings, raw="USD 1,234.5 million")
+    main.run(settings)
+    assert answered == [[QUESTIONS[0]["text"]]]
+
+def test_torn_last_line_is_ignored(settings):
+    _interrupted_run(settings)
+    path = _checkpoint_path(settings)
+    with path.open("a", encoding="utf-8") as f:
+        f.write('{"key": "abc", "answ')
+    checkpoint = AnswerCheckpoint(path, fingerprint=run_fingerprint(settings))
+    assert len(checkpoint.load()) == len(QUESTIONS)
+    checkpoint.append("def", Answer(value=1))
+    assert "def" in AnswerCheckpoint(path, fingerprint=run_fingerprint(settings)).load()
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import dataclasses
+
+from rag.chunking import Chunk
+from rag.config import Settings
+from rag.context import build_context
+from rag.index import index_kwargs
+from rag.pipeline import question_context
+from rag.retrieval import Retrieved, build_context as retrieval_build_context
+from rag.sentences import sentence_spans
+from rag.tokens import RegexTokenizer
+
+TEXT = "Revenue grew in all segments. Total revenue was 1,234 million. The board proposed a dividend."
+
+class WordTokenizer:
+    # stands in for tiktoken: counts differ from the regex counts stored with the index
+    name = "words"
+    additive = False
+
+    def count(self, text: str) -> int:
+        return 10 * len(text.split())
+
+    def count_many(self, texts):
+        return [self.count(t) for t in texts]
+
+def _retrieved():
+    chunk = Chunk("a" * 40, 0, 0, TEXT)
+    return [Retrieved(chunk=chunk, score=1.0, sentences=sentence_spans(TEXT))]
+
+def test_index_does_not_depend_on_the_prompt_tokenizer():
+    settings = Settings()
+    other = dataclasses.replace(settings, generator="openai", openai_model="gpt-4o-mini", context_tokenizer="cl100k_base")
+    assert index_kwargs(other) == index_kwargs(settings)
+
+def test_context_budget_uses_the_prompt_tokenizer():
+    retrieved = _retrieved()
+    # the whole chunk fits the budget in regex tokens...
+    full = build_context(retrieved, query="total revenue", tokenizer=RegexTokenizer(), max_tokens=200)
+    assert "dividend" in full and "1,234" in full
+    # ...but in the prompt tokenizer's counts only the best-matching sentence does
+    words = WordTokenizer()
+    budget = words.count(full.split("\n")[0]) + 2 + words.count(" Total revenue was 1,234 million.")
+    short = build_context(retrieved, query="total revenue", tokenizer=words, max_tokens=budget)
+    assert "1,234" in short and "dividend" not in short
+
+def test_max_context_chars_caps_the_context():
+    retrieved = _retrieved()
+    full = build_context(retrieved, query="total revenue", tokenizer=RegexTokenizer(), max_tokens=200)
+    capped = build_context(retrieved, query="total revenue", tokenizer=RegexTokenizer(), max_tokens=200, max_chars=len(full) - 1)
+    assert len(capped) < len(full) and "1,234" in capped
+
+    settings = dataclasses.replace(Settings(), context_tokenizer="regex", max_context_tokens=200, max_context_chars=80)
+    context = question_context(settings, "What was the total revenue?", "number", retrieved)
+    assert len(context) <= 80
+
+def test_retrieval_build_context_shim_keeps_the_old_signature():
+    context = retrieval_build_context(_retrieved(), max_chars=1000)
+    assert context == build_context(_retrieved(), query="", tokenizer=RegexTokenizer(), max_tokens=1000)
+    assert len(retrieval_build_context(_retrieved(), max_chars=90)) <= 90
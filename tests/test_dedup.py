@@ -0,0 +1,22 @@
+from __future__ import annotations
+
+from rag.dedup import near_duplicates
+
+BOILERPLATE = (
+    "Cautionary statement regarding forward-looking statements. This annual report contains certain forward-looking "
+    "statements with respect to the financial condition, results of operations and businesses of the group. These "
+    "statements involve risk and uncertainty because they relate to events that will occur in the future."
+)
+TABLE = (
+    "Segment results for the year. Revenue by segment in USD million: Energy {a}, Logistics 412, Pharma 388, "
+    "Retail 290, Mining 175, Software 96, Foods 81, Capital 64, Media 40, Telecom 33. Total segment revenue {b}."
+)
+
+def test_repeated_boilerplate_is_merged():
+    texts = [BOILERPLATE, "Our strategy focused on growth.", BOILERPLATE + " "]
+    assert near_duplicates(texts, threshold=0.8).tolist() == [0, 1, 0]
+
+def test_tables_with_different_figures_are_kept():
+    texts = [TABLE.format(a=1203, b=2782), TABLE.format(a=1244, b=2823), TABLE.format(a=1203, b=2782)]
+    # the first two differ in two figures only, far above the word-shingle threshold, but are not duplicates
+    assert near_duplicates(texts, threshold=0.5).tolist() == [0, 1, 0]
@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import dataclasses
+from types import SimpleNamespace
+
+from rag.answering import default_heuristic_answer
+from rag.config import Settings
+from rag.facts import Fact, extract_facts, metric_terms
+from rag.pipeline import lookup_facts
+
+def _fact(label: str, value: float, pdf_sha1: str = "a" * 40) -> Fact:
+    return Fact(pdf_sha1, 3, label, value, "million", "USD", 2022)
+
+def test_metric_terms_skip_company_and_year():
+    assert metric_terms('What was the total revenue of "Total Energies SE" in 2022?') == {"total", "revenue"}
+    assert metric_terms('What was the number of employees of "Acme plc" in 2021?') == {"number", "employees"}
+
+def test_extracted_labels_match_their_question():
+    facts = extract_facts("a" * 40, 0, "In 2022 total revenue was USD 1,234 million and net income reached USD 55 million.")
+    q = 'What was the total revenue of "Acme Inc" in 2022?'
+    assert default_heuristic_answer("number", [], facts, question=q) == 1234
+
+def test_heuristic_ignores_facts_sharing_one_word():
+    # "total" alone is not the metric asked for; with nothing retrieved the answer is N/A
+    q = 'What was the total revenue of "Acme Inc" in 2022?'
+    assert default_heuristic_answer("number", [], [_fact("total assets", 900.0)], question=q) == "N/A"
+    assert default_heuristic_answer("number", [], [_fact("total assets", 900.0), _fact("Total revenue", 120.0)], question=q) == 120
+
+class _FactTable:
+    def __init__(self):
+        self.calls = []
+
+    def lookup(self, question, *, pdf_sha1s=None, year=None, top_k=10):
+        self.calls.append(pdf_sha1s)
+        return [_fact("total revenue", 1.0)]
+
+def test_lookup_facts_never_crosses_companies_when_routing_fails():
+    settings = dataclasses.replace(Settings(), fact_index=True)
+    pdfs = {"a" * 40: {"company": "Acme Inc"}, "b" * 40: {"company": "Birch plc"}}
+    artifacts = SimpleNamespace(facts=_FactTable(), pdfs=pdfs)
+
+    assert lookup_facts(settings, artifacts, "What was the total revenue of the company in 2022?", "number") == []
+    assert artifacts.facts.calls == []
+    assert lookup_facts(settings, artifacts, 'What was the total revenue of "Birch plc" in 2022?', "number")
+    assert artifacts.facts.calls == [["b" * 40]]
+
+    # a single report: nothing to confuse it with
+    single = SimpleNamespace(facts=_FactTable(), pdfs={"a" * 40: {"company": None}})
+    assert lookup_facts(settings, single, "What was the total revenue in 2022?", "number")
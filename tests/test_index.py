@@ -0,0 +1,195 @@
+from __future__ import annotations
+
+import dataclasses
+import shutil
+
+import numpy as np
+import pytest
+
+from benchmarks.corpus import make_corpus, make_questions
+from benchmarks.run import HashEmbedder
+from rag.config import Settings
+from rag.index import build_or_load_index_from_settings
+from rag.page_cache import PageTextCache
+from rag.pdf import iter_pages
+
+K = 5
+
+@pytest.fixture(scope="module")
+def corpus(tmp_path_factory):
+    root = tmp_path_factory.mktemp("corpus")
+    reports = make_corpus(root, num_pdfs=6, pages=10, seed=0)
+    texts = [q["text"] for q in make_questions(reports, num_questions=20, seed=0)]
+    return sorted(root.glob("*.pdf")), texts
+
+def _settings(tmp_path, index_type: str) -> Settings:
+    # nprobe = nlist and a search beam wider than the corpus: every index type answers exactly, so an
+    # incrementally maintained index and a fresh one must agree
+    return dataclasses.replace(
+        Settings(), pdf_dir=tmp_path / "pdfs", index_dir=tmp_path / "index", embed_cache=False, page_cache=False,
+        fact_index=False, index_type=index_type, hnsw_ef_search=512, ivf_nlist=2, ivf_nprobe=2, ivf_train_sample=80,
+    )
+
+def _use(settings: Settings, pdfs) -> None:
+    if settings.pdf_dir.exists():
+        shutil.rmtree(settings.pdf_dir)
+    settings.pdf_dir.mkdir(parents=True)
+    for p in pdfs:
+        shutil.copy(p, settings.pdf_dir / p.name)
+
+def _results(artifacts, texts):
+    # chunk ids differ between builds: compare by (pdf, page, chunk) and score; chunks tied with the
+    # k-th score may be cut differently, so only those strictly above it are compared by identity
+    q = HashEmbedder().encode(texts)
+    D, I = artifacts.search_vectors(q, K, [None] * len(q))
+    out = []
+    for scores, ids in zip(D, I):
+        hits = {}
+        for s, i in zip(scores.tolist(), ids.tolist()):
+            if s > scores[-1] + 1e-5:
+                c = artifacts.chunks[int(i)]
+                hits[(c.pdf_sha1, c.page_index, c.chunk_index)] = round(s, 4)
+        out.append((hits, np.round(scores, 4).tolist()))
+    return out
+
+def _chunks(artifacts):
+    return sorted((c.pdf_sha1, c.page_index, c.chunk_index, c.text) for c in (artifacts.chunks[i] for i in artifacts.chunks))
+
+def _fresh(tmp_path, index_type: str, pdfs):
+    settings = _settings(tmp_path / "fresh", index_type)
+    _use(settings, pdfs)
+    return build_or_load_index_from_settings(settings, model=HashEmbedder())
+
+@pytest.mark.parametrize("index_type", ["flat", "hnsw", "ivf"])
+def test_incremental_add_and_remove_match_a_fresh_build(tmp_path, corpus, index_type):
+    pdfs, texts = corpus
+    settings = _settings(tmp_path / "incremental", index_type)
+    _use(settings, pdfs[:-1])
+    build_or_load_index_from_settings(settings, model=HashEmbedder())
+    _use(settings, pdfs[1:])
+    incremental = build_or_load_index_from_settings(settings, model=HashEmbedder())
+
+    fresh = _fresh(tmp_path, index_type, pdfs[1:])
+    assert set(incremental.pdfs) == set(fresh.pdfs)
+    assert _chunks(incremental) == _chunks(fresh)
+    assert _results(incremental, texts) == _results(fresh, texts)
+
+class FailingEmbedder(HashEmbedder):
+    # raises on the encode call after `calls` successful ones, like a worker killed mid-build
+    def __init__(self, calls: int):
+        super().__init__()
+        self.calls = calls
+        self.encoded = 0
+
+    def encode(self, texts, **kwargs):
+        if self.calls == 0:
+            raise RuntimeError("injected encode failure")
+        self.calls -= 1
+        self.encoded += len(texts)
+        return super().encode(texts, **kwargs)
+
+def test_build_resumed_after_encode_failure_matches_a_fresh_build(tmp_path, corpus):
+    pdfs, texts = corpus
+    # one PDF per encode call and a checkpoint after every PDF
+    settings = dataclasses.replace(_settings(tmp_path / "resumed", "flat"), index_encode_batch=1, index_checkpoint_s=0.0)
+    _use(settings, pdfs)
+    with pytest.raises(RuntimeError, match="injected"):
+        build_or_load_index_from_settings(settings, model=FailingEmbedder(calls=2))
+
+    model = FailingEmbedder(calls=-1)
+    resumed = build_or_load_index_from_settings(settings, model=model)
+    fresh = _fresh(tmp_path, "flat", pdfs)
+    # the PDFs checkpointed before the failure are not encoded again
+    assert 0 < model.encoded < len(fresh.chunks)
+    assert _chunks(resumed) == _chunks(fresh)
+    assert _results(resumed, texts) == _results(fresh, texts)
+
+def test_sharded_search_matches_a_single_index(tmp_path, corpus):
+    pdfs, texts = corpus
+    single = _fresh(tmp_path, "flat", pdfs)
+    settings = dataclasses.replace(_settings(tmp_path / "sharded", "flat"), index_shards=2, shard_workers="local")
+    _use(settings, pdfs)
+    sharded = build_or_load_index_from_settings(settings, model=HashEmbedder())
+    try:
+        assert len(sharded.chunks) == len(single.chunks)
+        assert _results(sharded, texts) == _results(single, texts)
+    finally:
+        sharded.close()
+
+def _ids(artifacts):
+    return {i: (c.pdf_sha1, c.page_index, c.chunk_index) for i, c in ((i, artifacts.chunks[i]) for i in artifacts.chunks)}
+
+def test_partly_warm_page_cache_keeps_the_chunk_ids_of_a_cold_build(tmp_path, corpus):
+    pdfs, _ = corpus
+    cold = _fresh(tmp_path, "flat", pdfs)
+
+    # the second and fourth reports were extracted before, e.g. by a build of another index dir
+    settings = dataclasses.replace(_settings(tmp_path / "warm", "flat"), page_cache=True, page_cache_dir=tmp_path / "page_cache")
+    list(iter_pages([pdfs[1], pdfs[3]], cache=PageTextCache(settings.page_cache_dir)))
+    _use(settings, pdfs)
+    warm = build_or_load_index_from_settings(settings, model=HashEmbedder())
+    assert _ids(warm) == _ids(cold)
+    assert {e["first_id"] for e in warm.pdfs.values()} == {e["first_id"] for e in cold.pdfs.values()}
+
+def test_sharded_build_hashes_pdfs_once_and_gathers_one_fact_table(tmp_path, corpus, monkeypatch):
+    import rag.pdf
+
+    pdfs, _ = corpus
+    settings = dataclasses.replace(
+        _settings(tmp_path / "sharded", "flat"), index_shards=2, shard_workers="local", fact_index=True,
+    )
+    _use(settings, pdfs)
+    build_or_load_index_from_settings(settings, model=HashEmbedder()).close()
+
+    hashed = []
+    sha1_file = rag.pdf.sha1_file
+    monkeypatch.setattr(rag.pdf, "sha1_file", lambda path: hashed.append(path) or sha1_file(path))
+    sharded = build_or_load_index_from_settings(settings, model=HashEmbedder())
+    try:
+        # a warm load hashes every PDF once, not once per shard
+        assert sorted(hashed) == sorted(settings.pdf_dir / p.name for p in pdfs)
+        assert sharded.facts is not None and len(sharded.facts.value) > 0
+        shards = settings.index_dir / "shards"
+        assert not any((shards / f"{i:02d}" / "facts" / "ranges.json").exists() for i in range(2))
+        assert len(list(shards.glob("??/facts/pdfs/*.npz"))) == len(pdfs)
+    finally:
+        sharded.close()
+
+def _bm25_results(artifacts, texts):
+    # by (pdf, page, chunk) and score, as in _results
+    out = []
+    for text in texts:
+        chunks = [(artifacts.chunks[i], s) for i, s in artifacts.bm25.search(text, K)]
+        out.append([(c.pdf_sha1, c.page_index, c.chunk_index, round(s, 4)) for c, s in chunks])
+    return out
+
+def test_hybrid_incremental_build_tokenizes_only_the_added_chunks(tmp_path, corpus, monkeypatch):
+    import rag.lexical
+
+    pdfs, texts = corpus
+    settings = dataclasses.replace(_settings(tmp_path / "incremental", "flat"), retrieval_mode="hybrid")
+    _use(settings, pdfs[:-1])
+    build_or_load_index_from_settings(settings, model=HashEmbedder())
+
+    tokenized = []
+    tokenize = rag.lexical.tokenize
+    monkeypatch.setattr(rag.lexical, "tokenize", lambda text: tokenized.append(text) or tokenize(text))
+    _use(settings, pdfs[1:])
+    incremental = build_or_load_index_from_settings(settings, model=HashEmbedder())
+    monkeypatch.undo()
+
+    # the first report was removed and the last one added: its chunks are the only ones tokenized
+    added = next(e for e in incremental.pdfs.values() if e["file"] == pdfs[-1].name)
+    assert len(tokenized) == added["num_chunks"]
+
+    fresh_settings = dataclasses.replace(_settings(tmp_path / "fresh", "flat"), retrieval_mode="hybrid")
+    _use(fresh_settings, pdfs[1:])
+    fresh = build_or_load_index_from_settings(fresh_settings, model=HashEmbedder())
+    assert incremental.bm25.num_docs == len(incremental.chunks) == len(fresh.chunks)
+    assert _bm25_results(incremental, texts) == _bm25_results(fresh, texts)
+
+def test_dense_retrieval_builds_no_bm25(tmp_path, corpus):
+    pdfs, _ = corpus
+    dense = _fresh(tmp_path, "flat", pdfs)
+    assert dense.bm25 is None
+    assert not (tmp_path / "fresh" / "index" / "bm25").exists()
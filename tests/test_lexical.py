@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+import numpy as np
+
+from rag.lexical import BM25Index
+
+TEXTS = [
+    "Total revenue was USD 1,234 million in 2022.",
+    "The board approved the dividend and the capital allocation framework.",
+    "Revenue from the energy segment grew on higher prices.",
+    "Net income fell as operating costs rose.",
+    "The audit committee oversaw financial reporting.",
+]
+NEW = ["Energy revenue and net income both rose.", "A new board member joined the audit committee."]
+QUERIES = ["total revenue", "net income", "board audit committee", "energy prices", "dividend"]
+
+def _results(index: BM25Index):
+    return [[(i, round(s, 5)) for i, s in index.search(q, 10)] for q in QUERIES]
+
+def test_update_matches_a_fresh_build(tmp_path):
+    ids = np.arange(10, 10 + len(TEXTS))
+    index = BM25Index.build(tmp_path / "bm25", ids, TEXTS)
+    keep = np.array([True, False, True, True, False])
+    # only "dividend" was in a dropped row: its postings and vocabulary entry go
+    updated = index.update(keep, np.array([20, 21]), NEW)
+
+    kept = [t for t, k in zip(TEXTS, keep) if k]
+    fresh = BM25Index.build(tmp_path / "fresh", np.concatenate([ids[keep], [20, 21]]), kept + NEW)
+    assert updated.num_docs == fresh.num_docs and updated.avgdl == fresh.avgdl
+    assert set(updated.vocab) == set(fresh.vocab) and "dividend" not in updated.vocab
+    assert _results(updated) == _results(fresh)
+    assert updated.search("revenue", 10, id_ranges=[(20, 22)]) == fresh.search("revenue", 10, id_ranges=[(20, 22)])
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+
+import pytest
+
+import rag.llm
+from rag.llm import OpenAICompatibleClient, RateLimiter
+from rag.llm_cache import CachedLLM, LLMResponseCache
+
+# OpenAI-compatible stub: echoes the prompt back, and answers the first request for every third
+# prompt ("q0", "q3", ...) with a 429 and no Retry-After header, so the client has to back off
+class StubHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompt = body["messages"][-1]["content"]
+        server = self.server
+        with server.lock:
+            server.times.append(time.monotonic())
+            throttle = int(prompt[1:]) % 3 == 0 and prompt not in server.throttled
+            if throttle:
+                server.throttled.add(prompt)
+        if throttle:
+            self._reply(429, {"error": {"message": "rate limited"}})
+            return
+        self._reply(200, {
+            "choices": [{"message": {"content": f"answer to {prompt}"}}],
+            "usage": {"prompt_tokens": 3, "completion_tokens": 3},
+        })
+
+    def _reply(self, status: int, payload: dict) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.lock = threading.Lock()
+    server.times = []
+    server.throttled = set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def test_generate_many_against_stub_server(stub_server, tmp_path, monkeypatch):
+    # record the backoff ceilings generate_with_retry draws its jittered delay from
+    ceilings = []
+    monkeypatch.setattr(rag.llm.random, "uniform", lambda a, b: ceilings.append(b) or b)
+
+    client = OpenAICompatibleClient(
+        api_key="test", base_url=f"http://127.0.0.1:{stub_server.server_port}/v1", model="stub",
+    )
+    cache = LLMResponseCache(tmp_path / "llm_cache.sqlite")
+    llm = CachedLLM(client, cache)
+    prompts = [f"q{i}" for i in range(12)]
+    rate = 20.0
+    done = []
+
+    out = llm.generate_many(
+        prompts, concurrency=4, rate_limiter=RateLimiter(rate, burst=1), max_retries=3, backoff=0.05,
+        on_result=lambda i, r: done.append(i),
+    )
+
+    # order follows the prompts, whatever order they completed in
+    assert [r.text for r in out] == [f"answer to {p}" for p in prompts]
+    assert sorted(done) == list(range(len(prompts)))
+    # q0, q3, q6, q9 were throttled once each and retried after the first backoff step
+    assert stub_server.throttled == {"q0", "q3", "q6", "q9"}
+    assert [r.attempts for r in out] == [2 if i % 3 == 0 else 1 for i in range(len(prompts))]
+    assert ceilings == [0.05] * 4
+    # every request, retries included, took a token: 16 requests at 20/s with a burst of 1
+    times = stub_server.times
+    assert len(times) == 16
+    assert times[-1] - times[0] >= (len(times) - 1) / rate * 0.9
+
+    # a second run is answered from the cache without reaching the server
+    again = llm.generate_many(prompts, concurrency=4, rate_limiter=RateLimiter(rate, burst=1))
+    assert [r.text for r in again] == [r.text for r in out]
+    assert all(r.cached for r in again)
+    assert len(stub_server.times) == 16
+    cache.close()
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import pytest
+
+from rag.metadata import extract_pdf_metadata, route_question
+
+PDFS = {
+    "a": {"company": "Ally Financial Inc."},
+    "b": {"company": "Tally Bank plc"},
+    "c": {"company": "Alder Energy AG"},
+    "d": {"company": "Alder Mining SA"},
+    "e": {"company": "Alder Energy Storage Corporation"},
+    "f": {"company": "Meridian Holdings Ltd"},
+}
+
+@pytest.mark.parametrize("question, expected", [
+    ('What was the net income of "Ally Financial Inc." in 2022?', ["a"]),
+    # a short name inside a longer word is not a match
+    ('What was the net income of "Ally" in 2022?', ["a"]),
+    ('Who is the CEO of "Tally Bank"?', ["b"]),
+    # the exact name wins over names that contain it
+    ('What were the total assets of "Alder Energy AG"?', ["c"]),
+    ('Did "Alder Energy Storage" report a loss?', ["e"]),
+    # a quote that only names part of several companies is ambiguous
+    ('What was the revenue of "Alder"?', ["c", "d", "e"]),
+    ('Compare "Alder Mining" and "Meridian Holdings".', ["d", "f"]),
+    ('What did "Unknown Widgets Inc" report?', None),
+])
+def test_quoted_names(question, expected):
+    assert route_question(question, PDFS) == expected
+
+@pytest.mark.parametrize("question, expected", [
+    ("What was the revenue of Alder Energy Storage Corporation in 2021?", ["e"]),
+    ("How many employees did Alder Mining have?", ["d"]),
+    ("What was the revenue of Tally Bank?", ["b"]),
+    ("How did the tally of votes change?", None),
+])
+def test_unquoted_names(question, expected):
+    assert route_question(question, PDFS) == expected
+
+def test_company_and_year_from_the_cover():
+    meta = extract_pdf_metadata(["Alder Energy AG\nAnnual Report 2021\n\nFor the financial year ended 31 December 2021."])
+    assert meta == {"company": "Alder Energy AG", "year": 2021}
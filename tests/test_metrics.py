@@ -0,0 +1,44 @@
+from __future__ import annotations
+
+import random
+
+import pytest
+
+from rag.metrics import Metrics
+
+def test_unbounded_metrics_have_exact_percentiles():
+    m = Metrics()
+    for i in range(1, 101):
+        m.observe("stage", i / 1000.0)
+    s = m.summary()["stages"]["stage"]
+    assert s["count"] == 100
+    assert s["p50_ms"] == pytest.approx(50.5)
+    assert s["max_ms"] == pytest.approx(100.0)
+    assert sum(s["histogram_ms"].values()) == 100
+
+def test_max_samples_bounds_memory_but_keeps_exact_totals():
+    random.seed(0)
+    m = Metrics(max_samples=500)
+    values = [random.uniform(0.0, 0.2) for _ in range(50_000)]
+    for v in values:
+        m.observe("stage", v)
+    assert len(m.snapshot()["samples"]["stage"]) == 500
+
+    s = m.summary()["stages"]["stage"]
+    assert s["count"] == len(values)
+    assert s["total_s"] == pytest.approx(sum(values))
+    assert s["max_ms"] == pytest.approx(max(values) * 1000.0)
+    assert sum(s["histogram_ms"].values()) == len(values)
+    # the reservoir is a uniform sample of everything observed, so percentiles stay close
+    assert s["p50_ms"] == pytest.approx(100.0, abs=15.0)
+    assert s["p95_ms"] == pytest.approx(190.0, abs=10.0)
+
+def test_merge_adds_worker_samples():
+    parent, worker = Metrics(), Metrics()
+    parent.observe("pdf.open", 0.001)
+    worker.observe("pdf.open", 0.003)
+    worker.count("pages", 7)
+    parent.merge(worker.snapshot())
+    s = parent.summary()
+    assert s["stages"]["pdf.open"]["count"] == 2
+    assert s["counters"]["pages"] == 7
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+pytest.importorskip("onnxruntime")
+pytest.importorskip("sentence_transformers")
+
+from rag.embed_cache import EmbeddingCache
+from rag.embedding import embed_model_id
+from rag.onnx_embed import load_onnx_embedder
+
+SENTENCES = [
+    "Total revenue was USD 1,234 million in 2022.",
+    "The board approved the capital allocation framework.",
+    "Net income rose on lower operating costs",
+    "Risk management covers market, credit and liquidity risks across all business segments of the group.",
+    "Alder Energy AG",
+]
+
+@pytest.fixture(scope="module")
+def model_dir(tmp_path_factory) -> Path:
+    # a small randomly initialised BERT sentence encoder saved locally, so the test needs no download
+    import torch
+    from sentence_transformers import SentenceTransformer, models
+    from transformers import BertConfig, BertModel, BertTokenizerFast
+
+    root = tmp_path_factory.mktemp("st")
+    words = sorted({w for s in SENTENCES for w in s.lower().replace(",", " , ").replace(".", " . ").split()})
+    (root / "vocab.txt").write_text("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + words), encoding="utf-8")
+    torch.manual_seed(0)
+    bert = BertModel(BertConfig(
+        vocab_size=5 + len(words), hidden_size=64, num_hidden_layers=2, num_attention_heads=4, intermediate_size=128,
+        max_position_embeddings=64,
+    ))
+    bert.save_pretrained(root / "bert")
+    BertTokenizerFast(vocab_file=str(root / "vocab.txt")).save_pretrained(root / "bert")
+    transformer = models.Transformer(str(root / "bert"), max_seq_length=48)
+    st = SentenceTransformer(modules=[transformer, models.Pooling(64, "mean"), models.Normalize()], device="cpu")
+    st.save(str(root / "encoder"))
+    return root / "encoder"
+
+def _torch_embeddings(model_dir: Path) -> np.ndarray:
+    from sentence_transformers import SentenceTransformer
+
+    return SentenceTransformer(str(model_dir), device="cpu").encode(SENTENCES, normalize_embeddings=True)
+
+@pytest.mark.parametrize("backend, tolerance", [("onnx", 1e-4), ("onnx-int8", 0.02)])
+def test_onnx_embeddings_match_torch(model_dir, tmp_path, backend, tolerance):
+    expected = _torch_embeddings(model_dir)
+    onnx = load_onnx_embedder(str(model_dir), tmp_path / "onnx", backend=backend)
+    got = onnx.encode(SENTENCES, batch_size=2, normalize_embeddings=True)
+    assert got.shape == expected.shape == (len(SENTENCES), onnx.get_sentence_embedding_dimension())
+    # each sentence's vector points the same way, and the similarities between sentences are kept
+    assert np.min(np.sum(got * expected, axis=1)) >= 1.0 - tolerance
+    np.testing.assert_allclose(got @ got.T, expected @ expected.T, atol=tolerance)
+
+def test_embedding_caches_of_backends_are_kept_apart(tmp_path):
+    ids = {embed_model_id("m", b) for b in ("torch", "onnx", "onnx-int8")}
+    assert len(ids) == 3 and embed_model_id("m", "torch") == "m"
+
+    torch_cache = EmbeddingCache(tmp_path, embed_model_id("m", "torch"))
+    torch_cache.get_or_compute(["a sentence"], lambda texts: np.ones((len(texts), 4), dtype="float32"))
+    onnx_cache = EmbeddingCache(tmp_path, embed_model_id("m", "onnx-int8"))
+    assert onnx_cache.dir != torch_cache.dir and len(onnx_cache) == 0
+    calls = []
+    onnx_cache.get_or_compute(["a sentence"], lambda texts: calls.append(texts) or np.zeros((len(texts), 4), dtype="float32"))
+    assert calls == [["a sentence"]]
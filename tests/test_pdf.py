@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+import pytest
+
+from benchmarks.corpus import make_corpus
+from rag.page_cache import PageTextCache
+from rag.pdf import iter_pages
+
+@pytest.fixture(scope="module")
+def pdfs(tmp_path_factory):
+    root = tmp_path_factory.mktemp("pdfs")
+    make_corpus(root, num_pdfs=3, pages=5, seed=0)
+    return sorted(root.glob("*.pdf"))
+
+@pytest.mark.parametrize("workers, pages_per_task", [(2, 0), (2, 1), (2, 2)])
+def test_parallel_extraction_matches_serial(pdfs, workers, pages_per_task):
+    serial = list(iter_pages(pdfs, workers=1))
+    assert len(serial) == 15
+    assert list(iter_pages(pdfs, workers=workers, pages_per_task=pages_per_task)) == serial
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_partly_warm_page_cache_keeps_the_input_order(pdfs, tmp_path, workers):
+    serial = list(iter_pages(pdfs, workers=1))
+    cache = PageTextCache(tmp_path / "cache")
+    list(iter_pages(pdfs[1:2], cache=cache))
+    assert list(iter_pages(pdfs, workers=workers, cache=cache)) == serial
+    # every PDF is cached now and comes back the same
+    assert list(iter_pages(pdfs, cache=cache)) == serial
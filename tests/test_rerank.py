@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+import numpy as np
+
+from rag.chunking import Chunk
+from rag.rerank import rerank_many
+from rag.retrieval import Retrieved
+
+class LengthReranker:
+    def __init__(self):
+        self.pairs = []
+
+    def predict(self, pairs, batch_size: int = 64, show_progress_bar: bool = False, **kwargs):
+        self.pairs.extend(pairs)
+        return np.asarray([len(t) for _, t in pairs], dtype="float32")
+
+def _hit(text: str, score: float, dense_score: float | None) -> Retrieved:
+    return Retrieved(chunk=Chunk("pdf", 0, len(text), text), score=score, dense_score=dense_score)
+
+def test_min_score_applies_to_dense_score_in_hybrid_mode():
+    # hybrid candidates: score is the RRF score (~0.01-0.03), far below a cutoff tuned on dense similarity
+    cands = [
+        _hit("a", 0.032, 0.71),
+        _hit("bbb", 0.031, 0.42),    # dense hit below the cutoff
+        _hit("cc", 0.016, None),     # found by BM25 only
+    ]
+    reranker = LengthReranker()
+    out = rerank_many(["q"], [cands], reranker=reranker, top_k=3, min_score=0.5)[0]
+
+    assert sorted(t for _, t in reranker.pairs) == ["a", "cc"]
+    # reranked hits first by cross-encoder score, then the skipped one in first-stage order
+    assert [r.chunk.text for r in out] == ["cc", "a", "bbb"]
+    assert out[0].dense_score is None and out[1].dense_score == 0.71
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import dataclasses
+import os
+import shutil
+
+import pytest
+
+from benchmarks.corpus import make_corpus
+from benchmarks.run import HashEmbedder
+from rag import server
+from rag.config import Settings
+
+pytestmark = pytest.mark.skipif(not os.path.isdir("/proc/self/fd"), reason="counts open file descriptors in /proc")
+
+def _fds() -> int:
+    return len(os.listdir("/proc/self/fd"))
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    make_corpus(tmp_path / "corpus", num_pdfs=3, pages=4, seed=0)
+    (tmp_path / "pdfs").mkdir()
+    monkeypatch.setattr(server, "embedder_from_settings", lambda settings: HashEmbedder())
+    settings = dataclasses.replace(
+        Settings(), pdf_dir=tmp_path / "pdfs", index_dir=tmp_path / "index", embed_cache=False, page_cache=False,
+        generator="heuristic", rerank=False,
+    )
+    for p in sorted((tmp_path / "corpus").glob("*.pdf"))[:2]:
+        shutil.copy(p, settings.pdf_dir / p.name)
+    return server.QueryService(settings), sorted((tmp_path / "corpus").glob("*.pdf"))[2]
+
+def test_reload_swaps_the_index_without_leaking_descriptors(service):
+    service, extra = service
+    target = service.settings.pdf_dir / extra.name
+    before = service.health()["num_chunks"]
+
+    # one add / remove round first: lazily opened files (faiss, tqdm, ...) are not leaks
+    shutil.copy(extra, target)
+    service.reload()
+    target.unlink()
+    service.reload()
+    fds = _fds()
+    # replaced snapshots are closed even while something (a traceback, a slow client) still references them
+    replaced = []
+    for _ in range(3):
+        shutil.copy(extra, target)
+        replaced.append(service.artifacts)
+        added = service.reload()
+        assert added["num_chunks"] > before and added["num_pdfs"] == 3
+        target.unlink()
+        replaced.append(service.artifacts)
+        removed = service.reload()
+        assert removed["num_chunks"] == before and removed["num_pdfs"] == 2
+    assert _fds() == fds
+
+def test_snapshot_in_use_is_closed_after_its_last_request(service):
+    service, extra = service
+    with service.snapshot() as old:
+        shutil.copy(extra, service.settings.pdf_dir / extra.name)
+        service.reload()
+        # the request still reads the index it started with
+        assert service.artifacts is not old and len(old.pdfs) == 2
+        assert old.chunks[next(iter(old.chunks))].text
+        assert old.faiss_index is not None
+    assert old.faiss_index is None
+    assert service.answer([{"text": "What was the total revenue?", "kind": "number"}], generate=False)